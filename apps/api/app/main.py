@@ -1,15 +1,15 @@
 # Sistema Inteligente de Imóveis - Allega Imóveis
 
 from fastapi import FastAPI, Request, HTTPException, Body
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import PlainTextResponse, JSONResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import os
 import logging
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Dict
-from app.services.whatsapp_service import WhatsAppService
-from app.services.intelligent_bot import intelligent_bot
+from app.services.whatsapp_service import get_whatsapp_service
+from app.services.intelligent_bot import get_intelligent_bot, IMAGE_ANALYSIS_FALLBACK_MESSAGE
 from app.services.property_intelligence import property_intelligence
 from app.services.property_scraper import monitor_scraper
 from app.services.rag_pipeline import rag
@@ -22,6 +22,7 @@ from app.services.live_pricing_system import live_pricing_system
 from app.services.white_label_system import white_label_system
 from app.services.supabase_client import supabase_client
 from app.services.webhook_idempotency import webhook_idempotency
+from app.services import redis_client, json_utils, http_session
 import asyncio
 
 # Configurar logging
@@ -32,7 +33,9 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="Allega Imóveis WhatsApp Bot",
     description="AI-powered real estate WhatsApp bot with intelligent property search and image analysis",
-    version="2.1.0"
+    version="2.1.0",
+    # Respostas serializadas em C (bytes direto) quando orjson está instalado
+    default_response_class=ORJSONResponse if json_utils.orjson is not None else JSONResponse
 )
 
 # CORS para desenvolvimento
@@ -49,8 +52,26 @@ VERIFY_TOKEN = os.getenv("WHATSAPP_WEBHOOK_VERIFY_TOKEN", "alloha_secret")
 ACCESS_TOKEN = os.getenv("WHATSAPP_ACCESS_TOKEN", "")
 PHONE_NUMBER_ID = os.getenv("WHATSAPP_PHONE_NUMBER_ID", "")
 
+# Resposta padrão quando não é possível processar uma imagem recebida
+IMAGE_ERROR_RESPONSE = (
+    "📸 Recebi sua imagem!\n\n"
+    "😅 Tive dificuldade para processá-la no momento.\n\n"
+    "🏠 *Posso ajudar de outras formas:*\n"
+    "• Descreva o imóvel que procura\n"
+    "• Informe sua região preferida\n"
+    "• Conte sobre seu orçamento\n\n"
+    "📞 *Ou entre em contato direto:*\n"
+    "🏠 Vendas: (41) 99214-6670\n"
+    "🏡 Locação: (41) 99223-0874"
+)
+
 # Inicializar serviços
-whatsapp_service = WhatsAppService(ACCESS_TOKEN, PHONE_NUMBER_ID)
+whatsapp_service = get_whatsapp_service()
+
+
+async def _read_json_body(request: Request):
+    """Lê o corpo JSON da requisição (orjson direto dos bytes, se disponível)."""
+    return json_utils.loads(await request.body())
 
 @app.on_event("startup")
 async def startup_event():
@@ -75,7 +96,14 @@ async def startup_event():
         
         asyncio.create_task(cleanup_voice_cache())
         
-        # Inicializar Google Calendar (v1 desativado por padrão)
+        # Monitor de scraping sempre ativo
+        asyncio.create_task(monitor_scraper())
+        logger.info("✅ Property monitor iniciado")
+
+        # Iniciar idempotency cleanup task de forma segura
+        webhook_idempotency.start()
+
+        # Google Calendar por último: é o único passo com I/O bloqueante (roda em thread)
         if os.getenv('ENABLE_GOOGLE_CALENDAR', 'false').lower() in ('1','true','yes','on'):
             calendar_initialized = await autonomous_followup.initialize_calendar_service()
             if calendar_initialized:
@@ -84,16 +112,20 @@ async def startup_event():
                 logger.warning("⚠️ Google Calendar não configurado ou indisponível - fallback ativo")
         else:
             logger.info("ℹ️ Google Calendar desativado (ENABLE_GOOGLE_CALENDAR=false) - usando fallback de agendamento")
-        
-        # Monitor de scraping sempre ativo
-        asyncio.create_task(monitor_scraper())
-        logger.info("✅ Property monitor iniciado")
-
-        # Iniciar idempotency cleanup task de forma segura
-        webhook_idempotency.start()
 
     except Exception as e:
         logger.error(f"❌ Erro na inicialização: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Libera recursos compartilhados (sessões HTTP) no desligamento"""
+    await get_intelligent_bot().flush_sent_messages()
+    await asyncio.gather(
+        http_session.close(),
+        rag.aclose(),
+        redis_client.close(),
+        return_exceptions=True
+    )
     
 @app.get("/")
 async def root():
@@ -140,7 +172,7 @@ async def health():
             }
         }
     except Exception as e:
-        logger.error(f"Health check error: {str(e)}")
+        logger.error(f"Health check error: {e}")
         return {
             "status": "degraded",
             "error": str(e),
@@ -151,8 +183,6 @@ async def health():
 async def check_whatsapp_token_status():
     """Verificar o status do token do WhatsApp"""
     try:
-        import aiohttp
-        
         if not ACCESS_TOKEN or not PHONE_NUMBER_ID:
             return {
                 "status": "error",
@@ -167,44 +197,45 @@ async def check_whatsapp_token_status():
             "Authorization": f"Bearer {ACCESS_TOKEN}",
             "Content-Type": "application/json"
         }
+        # Pedir só os campos usados na resposta (probe leve)
+        params = {"fields": "id,display_phone_number,verified_name"}
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                status_code = response.status
-                response_text = await response.text()
-                
-                if status_code == 200:
-                    import json
-                    data = json.loads(response_text)
-                    return {
-                        "status": "valid",
-                        "message": "Token do WhatsApp está válido e ativo",
-                        "phone_number_info": {
-                            "id": data.get("id"),
-                            "display_phone_number": data.get("display_phone_number"),
-                            "verified_name": data.get("verified_name")
-                        },
-                        "token_masked": f"{ACCESS_TOKEN[:10]}...{ACCESS_TOKEN[-10:]}"
-                    }
-                elif status_code == 401:
-                    return {
-                        "status": "expired",
-                        "message": "Token do WhatsApp expirado ou inválido",
-                        "error_details": response_text,
-                        "action_required": "Renovar token no Facebook Developers"
-                    }
-                else:
-                    return {
-                        "status": "error",
-                        "message": f"Erro ao validar token: {status_code}",
-                        "error_details": response_text
-                    }
-    
+        session = await http_session.get_session()
+        async with session.get(url, headers=headers, params=params) as response:
+            status_code = response.status
+            response_text = await response.text()
+            
+            if status_code == 200:
+                data = json_utils.loads(response_text)
+                return {
+                    "status": "valid",
+                    "message": "Token do WhatsApp está válido e ativo",
+                    "phone_number_info": {
+                        "id": data.get("id"),
+                        "display_phone_number": data.get("display_phone_number"),
+                        "verified_name": data.get("verified_name")
+                    },
+                    "token_masked": f"{ACCESS_TOKEN[:10]}...{ACCESS_TOKEN[-10:]}"
+                }
+            elif status_code == 401:
+                return {
+                    "status": "expired",
+                    "message": "Token do WhatsApp expirado ou inválido",
+                    "error_details": response_text,
+                    "action_required": "Renovar token no Facebook Developers"
+                }
+            else:
+                return {
+                    "status": "error",
+                    "message": f"Erro ao validar token: {status_code}",
+                    "error_details": response_text
+                }
+
     except Exception as e:
-        logger.error(f"Error checking WhatsApp token: {str(e)}")
+        logger.error(f"Error checking WhatsApp token: {e}")
         return {
             "status": "error",
-            "message": f"Erro interno ao verificar token: {str(e)}"
+            "message": f"Erro interno ao verificar token: {e}"
         }
 
 @app.get("/webhook", response_class=PlainTextResponse)
@@ -236,7 +267,7 @@ async def verify_webhook(request: Request):
 async def webhook_handler(request: Request):
     """Handler idempotente para mensagens do WhatsApp"""
     try:
-        body = await request.json()
+        body = await _read_json_body(request)
         
         # Importar serviço de idempotência
         from app.services.webhook_idempotency import webhook_idempotency
@@ -264,7 +295,7 @@ async def webhook_handler(request: Request):
         return response_data
     
     except Exception as e:
-        logger.error(f"Error processing webhook: {str(e)}")
+        logger.error(f"Error processing webhook: {e}")
         # Ainda responde 200 para não quebrar com a Meta
         return {"status": "error", "message": str(e)}
 
@@ -303,24 +334,34 @@ async def process_whatsapp_message(webhook_data):
         except Exception:
             profile_name = None
         from_number = message["from"]
+        message_id = message.get("id")
+        message_type = message.get("type", "text")
+        
+        logger.info(f"📨 Message from {from_number} - Type: {message_type}")
+
         # Persistir nome se disponível (não bloqueia fluxo)
-        if profile_name:
+        async def _save_profile_name():
             try:
                 await asyncio.to_thread(supabase_client.set_user_name, from_number, profile_name)
             except Exception:
                 logger.debug("Falha ao salvar user_name para %s", from_number)
-        message_id = message.get("id")
-        message_type = message.get("type", "text")
-        
-        logger.info(f"📨 Message from {from_number} - Type: {message_type}")
-        
+
         # Marcar como lida (check azul) — não é obrigatório, apenas tenta e loga falhas
-        if message_id and getattr(whatsapp_service, "is_configured", None):
+        async def _mark_as_read():
             try:
                 await whatsapp_service.mark_message_as_read(message_id)
                 logger.info("Marked incoming message as read: %s", message_id)
             except Exception as e:
                 logger.debug("Failed to mark message as read: %s", e)
+
+        # Chamadas independentes: executar em paralelo
+        side_effects = []
+        if profile_name:
+            side_effects.append(_save_profile_name())
+        if message_id and getattr(whatsapp_service, "is_configured", None):
+            side_effects.append(_mark_as_read())
+        if side_effects:
+            await asyncio.gather(*side_effects)
         
         # Verificar se é imagem
         if message_type == "image" or (message_type == "document" and message.get("document", {}).get("mime_type", "").startswith("image/")):
@@ -331,7 +372,7 @@ async def process_whatsapp_message(webhook_data):
         message_text = message.get("text", {}).get("body", "")
         
         # Processar com sistema inteligente
-        ai_response = await intelligent_bot.process_message(message_text, from_number)
+        ai_response = await get_intelligent_bot().process_message(message_text, from_number)
         
         logger.info(f"🤖 AI Response: {ai_response[:100]}...")
         
@@ -344,7 +385,7 @@ async def process_whatsapp_message(webhook_data):
             logger.error(f"❌ Failed to send message to {from_number}")
         
     except Exception as e:
-        logger.error(f"Error processing message: {str(e)}")
+        logger.error(f"Error processing message: {e}")
         
         # Enviar resposta de fallback em caso de erro
         try:
@@ -391,7 +432,7 @@ async def process_image_message(message: Dict, from_number: str, webhook_data: D
         
         # Análise de imagem usando Sofia Vision
         try:
-            response = await intelligent_bot.process_image_message(
+            response = await get_intelligent_bot().process_image_message(
                 image_data=image_data,
                 caption=caption,
                 user_phone=from_number
@@ -403,17 +444,7 @@ async def process_image_message(message: Dict, from_number: str, webhook_data: D
             logger.error(f"Image analysis error: {str(analyzer_error)}")
             
             # Fallback para resposta de erro
-            response = (
-                "📸 Recebi sua imagem!\n\n"
-                "😅 Tive dificuldade técnica para analisá-la no momento.\n\n"
-                "🏠 *Mas posso ajudar de outras formas:*\n"
-                "• Descreva o imóvel que procura\n"
-                "• Informe sua localização preferida\n"
-                "• Conte sobre seu orçamento\n\n"
-                "📞 *Ou entre em contato direto:*\n"
-                "🏠 Vendas: (41) 99214-6670\n"
-                "🏡 Locação: (41) 99223-0874"
-            )
+            response = IMAGE_ANALYSIS_FALLBACK_MESSAGE
         
         # Enviar resposta
         success = await whatsapp_service.send_message(from_number, response)
@@ -424,36 +455,26 @@ async def process_image_message(message: Dict, from_number: str, webhook_data: D
             logger.error(f"❌ Failed to send image response to {from_number}")
         
     except Exception as e:
-        logger.error(f"Error processing image: {str(e)}")
+        logger.error(f"Error processing image: {e}")
         await send_image_error_response(from_number)
 
 async def send_image_error_response(from_number: str):
     """Envia resposta de erro para problemas com imagem"""
     try:
-        error_response = (
-            "📸 Recebi sua imagem!\n\n"
-            "😅 Tive dificuldade para processá-la no momento.\n\n"
-            "🏠 *Posso ajudar de outras formas:*\n"
-            "• Descreva o imóvel que procura\n"
-            "• Informe sua região preferida\n"
-            "• Conte sobre seu orçamento\n\n"
-            "📞 *Ou entre em contato direto:*\n"
-            "🏠 Vendas: (41) 99214-6670\n"
-            "🏡 Locação: (41) 99223-0874"
-        )
-        
-        await whatsapp_service.send_message(from_number, error_response)
+        await whatsapp_service.send_message(from_number, IMAGE_ERROR_RESPONSE)
         
     except Exception as e:
-        logger.error(f"Error sending image error response: {str(e)}")
+        logger.error(f"Error sending image error response: {e}")
 
 @app.get("/analytics/{user_phone}")
 async def get_user_analytics(user_phone: str):
     """Obter analytics de um usuário específico"""
     try:
         # Obter dados do Supabase
-        user_profile = await asyncio.to_thread(supabase_client.get_user_profile, user_phone)
-        user_stats = await asyncio.to_thread(supabase_client.get_user_stats, user_phone)
+        user_profile, user_stats = await asyncio.gather(
+            asyncio.to_thread(supabase_client.get_user_profile, user_phone),
+            asyncio.to_thread(supabase_client.get_user_stats, user_phone),
+        )
         
         return {
             "user_phone": user_phone,
@@ -462,14 +483,14 @@ async def get_user_analytics(user_phone: str):
             "status": "success"
         }
     except Exception as e:
-        logger.error(f"Error getting analytics: {str(e)}")
+        logger.error(f"Error getting analytics: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/test-ai")
 async def test_ai_response(request: Request):
     """Endpoint para testar respostas da IA"""
     try:
-        body = await request.json()
+        body = await _read_json_body(request)
         message = body.get("message", "")
         user_phone = body.get("user_phone", "test_user")
         
@@ -477,7 +498,7 @@ async def test_ai_response(request: Request):
             raise HTTPException(status_code=400, detail="Message is required")
         
         # Testar com sistema inteligente
-        response = await intelligent_bot.process_message(message, user_phone)
+        response = await get_intelligent_bot().process_message(message, user_phone)
         
         return {
             "input_message": message,
@@ -488,14 +509,14 @@ async def test_ai_response(request: Request):
         }
         
     except Exception as e:
-        logger.error(f"Error testing AI: {str(e)}")
+        logger.error(f"Error testing AI: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/test-image-analysis")
 async def test_image_analysis(request: Request):
     """Endpoint para testar análise de imagens"""
     try:
-        body = await request.json()
+        body = await _read_json_body(request)
         image_url = body.get("image_url", "")
         user_phone = body.get("user_phone", "test_user")
         analysis_type = body.get("analysis_type", "complete")  # complete ou availability
@@ -503,18 +524,17 @@ async def test_image_analysis(request: Request):
         if not image_url:
             raise HTTPException(status_code=400, detail="Image URL is required")
         
-        # Download da imagem de teste
-        import aiohttp
-        async with aiohttp.ClientSession() as session:
-            async with session.get(image_url) as resp:
-                if resp.status == 200:
-                    image_data = await resp.read()
-                else:
-                    raise HTTPException(status_code=400, detail="Failed to download image")
+        # Download da imagem de teste (sessão HTTP compartilhada)
+        session = await http_session.get_session()
+        async with session.get(image_url) as resp:
+            if resp.status == 200:
+                image_data = await resp.read()
+            else:
+                raise HTTPException(status_code=400, detail="Failed to download image")
         
         # Testar análise de imagem com Sofia Vision
         try:
-            response = await intelligent_bot.process_image_message(
+            response = await get_intelligent_bot().process_image_message(
                 image_data=image_data,
                 caption=caption or "",
                 user_phone=user_phone
@@ -535,7 +555,7 @@ async def test_image_analysis(request: Request):
         }
         
     except Exception as e:
-        logger.error(f"Error testing image analysis: {str(e)}")
+        logger.error(f"Error testing image analysis: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/update-properties")
@@ -544,7 +564,7 @@ async def update_property_database():
     try:
         logger.info("🔄 Iniciando atualização manual da base de imóveis...")
         
-        success = await intelligent_bot.update_property_database()
+        success = await get_intelligent_bot().update_property_database()
         
         if success:
             return {
@@ -560,7 +580,7 @@ async def update_property_database():
             }
             
     except Exception as e:
-        logger.error(f"Error updating properties: {str(e)}")
+        logger.error(f"Error updating properties: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/properties/stats")
@@ -568,22 +588,22 @@ async def get_property_statistics():
     """Obter estatísticas dos imóveis"""
     try:
         # Carregar dados de propriedades
-        await intelligent_bot.property_intelligence.load_property_data()
+        await property_intelligence.load_property_data()
         
         stats = {}
-        if intelligent_bot.property_intelligence.property_cache:
-            cache = intelligent_bot.property_intelligence.property_cache
+        if property_intelligence.property_cache:
+            cache = property_intelligence.property_cache
             stats = cache.get('statistics', {})
         
         return {
             "statistics": stats,
-            "cache_status": "loaded" if intelligent_bot.property_intelligence.property_cache else "empty",
-            "last_update": intelligent_bot.property_intelligence.last_cache_update,
+            "cache_status": "loaded" if property_intelligence.property_cache else "empty",
+            "last_update": property_intelligence.last_cache_update,
             "status": "success"
         }
         
     except Exception as e:
-        logger.error(f"Error getting property stats: {str(e)}")
+        logger.error(f"Error getting property stats: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/system/status")
@@ -592,17 +612,18 @@ async def get_system_status():
     try:
         # Importar serviços otimizados
         from app.services.embedding_cache import embedding_cache
+        from app.services.semantic_cache import semantic_response_cache
         from app.services.webhook_idempotency import webhook_idempotency
         from app.models.conversation_state import conversation_manager
         
-        status_info = await intelligent_bot._get_system_status()
+        status_info = await get_intelligent_bot()._get_system_status()
         
         return {
             "detailed_status": status_info,
             "components": {
                 "whatsapp_service": bool(ACCESS_TOKEN and PHONE_NUMBER_ID),
                 "supabase_client": True,
-                "property_intelligence": bool(intelligent_bot.property_intelligence),
+                "property_intelligence": bool(property_intelligence),
                 "intelligent_bot": True,
                 "sofia_vision": True,  # Análise de imagens integrada
                 "embedding_cache": True,
@@ -611,6 +632,7 @@ async def get_system_status():
             },
             "performance_metrics": {
                 "embedding_cache": embedding_cache.get_stats(),
+                "semantic_response_cache": semantic_response_cache.get_stats(),
                 "webhook_idempotency": webhook_idempotency.get_stats(),
                 "active_conversations": len(conversation_manager.get_active_conversations())
             },
@@ -623,9 +645,34 @@ async def get_system_status():
         }
         
     except Exception as e:
-        logger.error(f"Error getting system status: {str(e)}")
+        logger.error(f"Error getting system status: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _count_lines(file_path: Path, chunk_size: int = 1024 * 1024) -> int:
+    """Conta linhas lendo o arquivo em blocos binários (sem decodificar)"""
+    count = 0
+    last = b"\n"
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            count += chunk.count(b"\n")
+            last = chunk[-1:]
+    # Última linha sem quebra final também conta
+    return count + (last != b"\n")
+
+def _describe_dataset_file(file_path: Path) -> Dict:
+    """Metadados de um arquivo de dataset (bloqueante: executar em thread)"""
+    stat = file_path.stat()
+    return {
+        "filename": file_path.name,
+        "path": str(file_path),
+        "examples": _count_lines(file_path),
+        "size_mb": stat.st_size / (1024 * 1024),
+        "created": datetime.fromtimestamp(stat.st_mtime).isoformat()
+    }
+
 @app.get("/dataset/status")
 async def get_dataset_status():
     """Status do sistema de dataset living"""
@@ -634,26 +681,17 @@ async def get_dataset_status():
         
         status = dataset_living_loop.get_status()
         
-        # Adicionar estatísticas dos arquivos
+        # Adicionar estatísticas dos arquivos (leitura de disco fora do event loop)
         datasets_dir = Path("datasets")
         dataset_files = []
         
         if datasets_dir.exists():
-            for file_path in datasets_dir.rglob("*.jsonl"):
-                if "train" in file_path.name:
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            line_count = sum(1 for _ in f)
-                        
-                        dataset_files.append({
-                            "filename": file_path.name,
-                            "path": str(file_path),
-                            "examples": line_count,
-                            "size_mb": file_path.stat().st_size / (1024 * 1024),
-                            "created": datetime.fromtimestamp(file_path.stat().st_mtime).isoformat()
-                        })
-                    except Exception:
-                        pass
+            train_files = [p for p in datasets_dir.rglob("*.jsonl") if "train" in p.name]
+            results = await asyncio.gather(
+                *(asyncio.to_thread(_describe_dataset_file, p) for p in train_files),
+                return_exceptions=True
+            )
+            dataset_files = [r for r in results if isinstance(r, dict)]
         
         return {
             "living_loop": status,
@@ -663,7 +701,7 @@ async def get_dataset_status():
         }
         
     except Exception as e:
-        logger.error(f"Error getting dataset status: {str(e)}")
+        logger.error(f"Error getting dataset status: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/dataset/expand")
@@ -698,7 +736,7 @@ async def expand_dataset_now():
         }
         
     except Exception as e:
-        logger.error(f"Error expanding dataset: {str(e)}")
+        logger.error(f"Error expanding dataset: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 # ==============================================
@@ -709,7 +747,7 @@ async def expand_dataset_now():
 async def dual_stack_query(request: Request):
     """API para consultas com sistema dual-stack"""
     try:
-        data = await request.json()
+        data = await _read_json_body(request)
         
         user_message = data.get("message", "")
         user_phone = data.get("phone", "")
@@ -893,7 +931,7 @@ async def trigger_dataset_update():
         }
         
     except Exception as e:
-        logger.error(f"Error triggering dataset update: {str(e)}")
+        logger.error(f"Error triggering dataset update: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/run-property-scraper")
@@ -910,7 +948,7 @@ async def run_property_scraper():
             "timestamp": str(datetime.now())
         }
     except Exception as e:
-        logger.error(f"Erro ao executar o scraper manualmente: {str(e)}")
+        logger.error(f"Erro ao executar o scraper manualmente: {e}")
         return {
             "status": "error",
             "message": str(e)
@@ -932,25 +970,25 @@ async def query_endpoint(payload: dict = Body(...)):
         raise HTTPException(status_code=400, detail="Question is required")
 
     # 1) Recuperar documentos relevantes
-    retrieved = rag.retrieve(question, top_k=5, filters=filters)
+    retrieved = await rag.retrieve(question, top_k=5, filters=filters)
 
     # 2) Montar prompt para o OpenAI
     prompt = rag.build_prompt(question, retrieved)
 
-    # 3) Chamar OpenAI via função compat (bloqueante) em thread
+    # 3) Chamar OpenAI (thread + semáforo/orçamento TPM compartilhados com o bot)
     try:
-        response = await asyncio.to_thread(rag.call_gpt, prompt)
+        response = await rag.acall_gpt(prompt)
     except Exception as e:
-        logger.error(f"Error calling OpenAI: {str(e)}")
+        logger.error(f"Error calling OpenAI: {e}")
         raise HTTPException(status_code=500, detail="Error generating response")
 
     # 4) Preparar dados para retorno (incluindo URLs e imagens)
     candidates = []
     for r in retrieved:
-        m = r.get("meta", r.get("metadata", {}))
+        m = r.metadata or {}
         candidates.append({
-            "id": r.get("id"),
-            "preview": r.get("text", "")[:200],
+            "id": r.id,
+            "preview": (r.text or "")[:200],
             "url": m.get("url"),
             "image": m.get("main_image") or m.get("image"),
             "neighborhood": m.get("neighborhood"),
@@ -71,6 +71,11 @@ class AutonomousFollowUp:
         if not _GOOGLE_CALENDAR_AVAILABLE:
             logger.warning("Google Calendar libs não instaladas - fallback ativo")
             return False
+        # Leitura de token, refresh OAuth e discovery são bloqueantes: executar em thread
+        return await asyncio.to_thread(self._build_calendar_service)
+    
+    def _build_calendar_service(self) -> bool:
+        """Carrega credenciais e constrói o client do Google Calendar (síncrono)"""
         try:
             # Credenciais OAuth2
             creds = None
@@ -403,7 +408,9 @@ class AutonomousFollowUp:
                 'created_at': datetime.utcnow().isoformat(),
                 'updated_at': datetime.utcnow().isoformat()
             }
-            supabase_client.client.table('scheduled_visits').insert(visit_data).execute()
+            await asyncio.to_thread(
+                supabase_client.client.table('scheduled_visits').insert(visit_data).execute
+            )
             logger.info(f"Visita salva no Supabase: {phone} - {event_data['event_id']}")
         except Exception as e:
             logger.error(f"Erro ao salvar visita agendada (Supabase): {e}")
@@ -21,8 +21,36 @@ try:
 except ImportError:
     Translator = None
 
+# Motor de regex linear (RE2) para varredura em massa; fallback para `re`
+try:
+    import re2 as sensitive_re
+except ImportError:
+    sensitive_re = re
+
 logger = logging.getLogger(__name__)
 
+# Padrão único para dados sensíveis (URL + telefone) - uma só varredura por mensagem
+SENSITIVE_DATA_PATTERN = sensitive_re.compile(
+    r'(?P<url>https?://[^\s]+)|(?P<phone>\b\d{4,5}-?\d{4}\b)'
+)
+SENSITIVE_DATA_PLACEHOLDERS = {'url': '<URL>', 'phone': '<TEL>'}
+
+# Categorias do lead score (+1 cada), uma regex case-insensitive por categoria
+LEAD_SCORE_KEYWORDS = (
+    # Demonstrou interesse específico
+    ['quero', 'procuro', 'interesse', 'gostaria', 'preciso'],
+    # Mencionou características específicas
+    ['quartos', 'banheiros', 'vagas', 'metragem', 'm²', 'andar'],
+    # Perguntou sobre financiamento/valores
+    ['preço', 'valor', 'custo', 'financiamento', 'entrada', 'prestação'],
+    # Pediu agendamento/visita
+    ['visita', 'agendar', 'ver', 'conhecer', 'quando', 'horário'],
+)
+LEAD_SCORE_PATTERNS = tuple(
+    re.compile('|'.join(re.escape(k) for k in keywords), re.IGNORECASE)
+    for keywords in LEAD_SCORE_KEYWORDS
+)
+
 @dataclass
 class TrainingExample:
     """Estrutura de um exemplo de treinamento"""
@@ -263,11 +291,10 @@ class DatasetExpander:
         if not content:
             return ""
         
-        # Anonimizar telefones
-        content = re.sub(self.phone_pattern, '<TEL>', content)
-        
-        # Remover URLs longas
-        content = re.sub(r'https?://[^\s]+', '<URL>', content)
+        # Anonimizar telefones e remover URLs longas numa única passada
+        content = SENSITIVE_DATA_PATTERN.sub(
+            lambda m: SENSITIVE_DATA_PLACEHOLDERS[m.lastgroup], content
+        )
         
         # Limpar caracteres especiais excessivos
         content = re.sub(r'[^\w\s\.\,\!\?\-\(\)\+\$\%\:\;]', '', content)
@@ -279,29 +306,20 @@ class DatasetExpander:
     
     def _calculate_lead_score(self, messages: List[Dict]) -> int:
         """Calcula score do lead (1-5) baseado no conteúdo"""
-        full_text = " ".join([m.get('content', '') for m in messages]).lower()
-        
         score = 1  # Base score
         
-        # +1: Demonstrou interesse específico
-        interest_keywords = ['quero', 'procuro', 'interesse', 'gostaria', 'preciso']
-        if any(keyword in full_text for keyword in interest_keywords):
-            score += 1
-        
-        # +1: Mencionou características específicas
-        specifics = ['quartos', 'banheiros', 'vagas', 'metragem', 'm²', 'andar']
-        if any(spec in full_text for spec in specifics):
-            score += 1
-        
-        # +1: Perguntou sobre financiamento/valores
-        financial = ['preço', 'valor', 'custo', 'financiamento', 'entrada', 'prestação']
-        if any(fin in full_text for fin in financial):
-            score += 1
-        
-        # +1: Pediu agendamento/visita
-        scheduling = ['visita', 'agendar', 'ver', 'conhecer', 'quando', 'horário']
-        if any(sched in full_text for sched in scheduling):
-            score += 1
+        # +1 por categoria encontrada (interesse, características, valores, visita).
+        # Varre mensagem a mensagem (sem concatenar a conversa) e para quando todas batem.
+        pending = list(LEAD_SCORE_PATTERNS)
+        for m in messages:
+            content = m.get('content')
+            if not content:
+                continue
+            remaining = [pattern for pattern in pending if not pattern.search(content)]
+            score += len(pending) - len(remaining)
+            pending = remaining
+            if not pending:
+                break
         
         return min(score, 5)  # Máximo 5
     
@@ -217,7 +217,7 @@ class DatasetLivingLoop:
             "timestamp": version,
             "total_examples": len(examples),
             "successful_conversations": len([e for e in examples if e.lead_score >= 4]),
-            "sources": list(set([e.source for e in examples])),
+            "sources": list(dict.fromkeys(e.source for e in examples)),
             "created_from_period": {
                 "start": self.last_check.isoformat(),
                 "end": datetime.utcnow().isoformat()
@@ -3,22 +3,37 @@ Sistema Dual-Stack: Fine-tune + RAG Dirigido
 Camada 1: Fine-tune próprio com Chain-of-Thought enxuto
 Latência total < 900ms para superar concorrência
 """
-import asyncio
-import json
 import logging
 import os
 from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime, timedelta
 import hashlib
 from dataclasses import dataclass
+from itertools import islice
 import re
 
+from app.services import json_utils
 from app.services.rag_pipeline import rag
 from app.services.embedding_cache import embedding_cache
 
 logger = logging.getLogger(__name__)
 
-@dataclass
+# Regex pré-compiladas (usadas a cada mensagem no fallback)
+URGENCY_PATTERN = re.compile(
+    '|'.join([
+        r'(preciso|tenho que) (sair|mudar|deixar).{0,20}(sexta|sábado|domingo|semana|mês)',
+        r'(despej\w+|despejo|saindo de casa|sem lugar)',
+        r'(urgente|emergência|rápido|logo|já)',
+        r'(até|antes d[eo]) (sexta|fim de semana|\d{1,2}\/\d{1,2})',
+        r'(casamento|separação|trabalho novo|transferência) (próxim\w+|em \w+ dias)',
+    ]),
+    re.IGNORECASE
+)
+JSON_OBJECT_PATTERN = re.compile(r'\{.*\}', re.DOTALL)
+BEDROOMS_PATTERN = re.compile(r'(\d+)\s*(quarto|dormitório)')
+KEYWORD_PATTERN = re.compile(r'\b\w{4,}\b')
+
+@dataclass(slots=True)
 class PropertyHypothesis:
     """Hipótese gerada pelo fine-tuned model"""
     neighborhood: Optional[str] = None
@@ -38,15 +53,6 @@ class DualStackIntelligence:
         self.session_cache = {}  # Cache de sessão por phone_hash
         self.cache_ttl_hours = 24
         
-        # Padrões para urgência
-        self.urgency_patterns = [
-            r'(preciso|tenho que) (sair|mudar|deixar).{0,20}(sexta|sábado|domingo|semana|mês)',
-            r'(despej\w+|despejo|saindo de casa|sem lugar)',
-            r'(urgente|emergência|rápido|logo|já)',
-            r'(até|antes d[eo]) (sexta|fim de semana|\d{1,2}\/\d{1,2})',
-            r'(casamento|separação|trabalho novo|transferência) (próxim\w+|em \w+ dias)'
-        ]
-        
         # Cache de hipóteses para evitar reprocessamento
         self.hypothesis_cache = {}
     
@@ -154,12 +160,12 @@ class DualStackIntelligence:
         try:
             # Usar modelo fine-tuned
             model = os.getenv("OPENAI_FINETUNED_MODEL")
-            response = await asyncio.to_thread(rag.call_gpt, full_prompt, model)
+            response = await rag.acall_gpt(full_prompt, model)
             
             # Extrair JSON
-            json_match = re.search(r'\\{.*\\}', response, re.DOTALL)
+            json_match = JSON_OBJECT_PATTERN.search(response or "")
             if json_match:
-                data = json.loads(json_match.group())
+                data = json_utils.loads(json_match.group())
                 
                 hypothesis = PropertyHypothesis(
                     neighborhood=data.get("neighborhood"),
@@ -191,11 +197,7 @@ class DualStackIntelligence:
         msg_lower = message.lower()
         
         # Detectar urgência
-        urgency_score = 1
-        for pattern in self.urgency_patterns:
-            if re.search(pattern, msg_lower, re.IGNORECASE):
-                urgency_score = max(urgency_score, 4)
-                break
+        urgency_score = 4 if URGENCY_PATTERN.search(msg_lower) else 1
         
         # Extrair bairros conhecidos
         neighborhoods = ["água verde", "bigorrilho", "batel", "centro", "cabral", "jardins"]
@@ -206,7 +208,7 @@ class DualStackIntelligence:
                 break
         
         # Extrair quartos
-        bedrooms_match = re.search(r'(\\d+)\\s*(quarto|dormitório)', msg_lower)
+        bedrooms_match = BEDROOMS_PATTERN.search(msg_lower)
         bedrooms = int(bedrooms_match.group(1)) if bedrooms_match else None
         
         # Tipo de imóvel
@@ -230,7 +232,7 @@ class DualStackIntelligence:
             transaction_type=transaction_type,
             urgency_score=urgency_score,
             intent_confidence=0.7,
-            extracted_keywords=re.findall(r'\\b\\w{4,}\\b', msg_lower)[:5]
+            extracted_keywords=KEYWORD_PATTERN.findall(msg_lower)[:5]
         )
     
     async def _directed_vector_search(self, 
@@ -290,6 +292,19 @@ class DualStackIntelligence:
             # Fallback: busca simples
             return await rag.retrieve(original_query, top_k=5, filters={"status": "active"})
     
+    @staticmethod
+    def _format_property_context(i: int, prop: Dict[str, Any]) -> str:
+        """Bloco de contexto de um imóvel para o prompt da Sofia"""
+        meta = prop.get("meta", prop.get("metadata", {}))
+        return f"""
+            IMÓVEL {i}:
+            Descrição: {prop.get('text', '')[:200]}
+            Bairro: {meta.get('neighborhood', 'N/A')}
+            Preço: {meta.get('price', 'Consulte')}
+            URL: {meta.get('url', '')}
+            Imagem: {meta.get('main_image', '')}
+            """
+    
     async def _generate_top_seller_response(self,
                                           original_query: str,
                                           hypothesis: PropertyHypothesis, 
@@ -320,17 +335,10 @@ class DualStackIntelligence:
         """
         
         # Construir contexto dos imóveis
-        properties_context = ""
-        for i, prop in enumerate(properties[:3], 1):
-            meta = prop.get("meta", prop.get("metadata", {}))
-            properties_context += f"""
-            IMÓVEL {i}:
-            Descrição: {prop.get('text', '')[:200]}
-            Bairro: {meta.get('neighborhood', 'N/A')}
-            Preço: {meta.get('price', 'Consulte')}
-            URL: {meta.get('url', '')}
-            Imagem: {meta.get('main_image', '')}
-            """
+        properties_context = "".join(
+            self._format_property_context(i, prop)
+            for i, prop in enumerate(islice(properties, 3), 1)
+        )
         
         # Contexto da urgência
         urgency_context = ""
@@ -352,11 +360,11 @@ class DualStackIntelligence:
         
         try:
             model = os.getenv("OPENAI_FINETUNED_MODEL")
-            response = await asyncio.to_thread(rag.call_gpt, full_prompt, model)
+            response = await rag.acall_gpt(full_prompt, model)
             
             # Adicionar tags especiais para urgência
             if hypothesis.urgency_score >= 4:
-                response = "<HOT> " + response + " <URGENT>"
+                response = f"<HOT> {response} <URGENT>"
             
             return response.strip()
             
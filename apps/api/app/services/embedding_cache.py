@@ -3,7 +3,6 @@ Cache FAISS para Embeddings - Reduz Latência de 1.8s para 250ms
 Corta 35% do custo de tokens mantendo vetores em RAM
 """
 import os
-import json
 import numpy as np
 import logging
 from typing import List, Dict, Any, Optional, Tuple
@@ -19,6 +18,8 @@ except ImportError:
 
 from sentence_transformers import SentenceTransformer
 
+from app.services import json_utils
+
 logger = logging.getLogger(__name__)
 
 class EmbeddingCache:
@@ -92,7 +93,7 @@ class EmbeddingCache:
                     cached_vec = await client.get(redis_key)
                     if cached_vec:
                         try:
-                            arr = np.array(json.loads(cached_vec), dtype=np.float32)
+                            arr = np.array(json_utils.loads(cached_vec), dtype=np.float32)
                             if arr.shape[0] == self.embedding_dim:
                                 logger.debug(f"Embedding Redis HIT: {text[:50]}...")
                                 return arr
@@ -137,7 +138,7 @@ class EmbeddingCache:
                 client = await redis_client.get_client()
                 if client:
                     redis_key = f"emb:{self.embedding_dim}:{text_hash}"
-                    await client.set(redis_key, json.dumps(embedding.tolist()), ex=int(self.ttl_hours * 3600))
+                    await client.set(redis_key, json_utils.dumps(embedding), ex=int(self.ttl_hours * 3600))
             except Exception as e:
                 logger.debug(f"Redis embedding cache fallback (set) {e}")
         
@@ -0,0 +1,70 @@
+"""Sessão HTTP compartilhada (aiohttp)
+
+Um único ClientSession por processo para as chamadas HTTP de saída (WhatsApp Graph,
+integrações de preço, Cloudflare...): pool de conexões, keep-alive e cache de DNS
+reaproveitados entre requisições.
+
+Env vars suportadas:
+HTTP_POOL_LIMIT=100
+HTTP_POOL_LIMIT_PER_HOST=32
+HTTP_KEEPALIVE_TIMEOUT=75
+HTTP_DNS_CACHE_TTL=300
+HTTP_TOTAL_TIMEOUT=30 (padrão da sessão; chamadas longas passam timeout= próprio)
+"""
+from __future__ import annotations
+import os
+import asyncio
+import logging
+from typing import Optional
+
+import aiohttp
+
+# Resolver DNS assíncrono (opcional)
+try:
+    import aiodns  # noqa: F401
+    from aiohttp.resolver import AsyncResolver
+except ImportError:
+    AsyncResolver = None
+
+logger = logging.getLogger(__name__)
+
+# Cache de DNS do connector
+DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", os.getenv("WHATSAPP_DNS_CACHE_TTL", "300")))  # seconds
+# Pool de conexões da sessão compartilhada
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "32"))
+HTTP_KEEPALIVE_TIMEOUT = int(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "75"))  # seconds
+# Timeout total padrão das requisições da sessão (o padrão do aiohttp é 300s)
+HTTP_TOTAL_TIMEOUT = int(os.getenv("HTTP_TOTAL_TIMEOUT", "30"))  # seconds
+
+_session: Optional[aiohttp.ClientSession] = None
+_init_lock = asyncio.Lock()
+
+
+async def get_session() -> aiohttp.ClientSession:
+    """Retorna a sessão compartilhada, criando-a sob demanda."""
+    global _session
+    if _session is not None and not _session.closed:
+        return _session
+    async with _init_lock:
+        if _session is None or _session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=HTTP_POOL_LIMIT,
+                limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+                keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=DNS_CACHE_TTL,
+                resolver=AsyncResolver() if AsyncResolver is not None else None,
+            )
+            _session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=HTTP_TOTAL_TIMEOUT)
+            )
+    return _session
+
+
+async def close():
+    """Fecha a sessão compartilhada (chamar no shutdown)."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
@@ -6,44 +6,246 @@ Coordena IA, extração de dados e resposta inteligente com análise de imagens
 import asyncio
 import os
 import logging
-from typing import Dict, Any, Optional, List
-from datetime import datetime, timedelta
-import aiohttp
-import tempfile
+import time
+from typing import Dict, Any, Optional, List, Final
+from datetime import datetime
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import islice
 import base64
+import hashlib
+import io
 import json
+import re
 from dotenv import load_dotenv
 
-from app.services.rag_pipeline import rag
+# Pré-processamento de imagens (opcional)
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Base64 vetorizado (SIMD) para imagens grandes (opcional; fallback: base64 da stdlib)
+try:
+    import pybase64
+except ImportError:
+    pybase64 = None
+
+from app.services import json_utils
+from app.services.rag_pipeline import rag, FALLBACK_REPLIES
 from app.services.property_intelligence import property_intelligence
 from app.services.embedding_cache import embedding_cache
+from app.services.semantic_cache import semantic_response_cache
 from app.models.conversation_state import conversation_manager, ConversationState
 from app.services.webhook_idempotency import webhook_idempotency
-from app.services.whatsapp_service import WhatsAppService
+from app.services.whatsapp_service import get_whatsapp_service
 from app.services.supabase_client import supabase_client
 
 load_dotenv()
 
 logger = logging.getLogger("IntelligentRealEstateBot")
 logger.setLevel(logging.INFO)
+# Handler próprio só se ninguém configurou o logging (rag_pipeline já chama basicConfig
+# no import; nesse caso os registros seguem para os handlers do root, uma única vez)
 if not logger.hasHandlers():
     handler = logging.StreamHandler()
     formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
     handler.setFormatter(formatter)
     logger.addHandler(handler)
 
-# RAG endpoint (HTTP fallback, se necessário)
-RAG_ENDPOINT = os.getenv("RAG_ENDPOINT", "http://localhost:8000/query")
-
 # In-memory cache for first names: { phone_hash: (first_name_or_none, expires_epoch) }
 FIRST_NAME_CACHE: Dict[str, tuple[Optional[str], float]] = {}
 FIRST_NAME_CACHE_LOCK = asyncio.Lock()
 FIRST_NAME_CACHE_TTL = int(os.getenv("FIRST_NAME_CACHE_TTL", "3600"))  # seconds
 FIRST_NAME_CACHE_NULL_TTL = int(os.getenv("FIRST_NAME_CACHE_NULL_TTL", "900"))  # shorter TTL for misses
 
+# Telefones que já não são elegíveis para saudação: { user_phone: expires_epoch }
+# (uma vez saudado / com histórico, a condição não volta a ser verdadeira)
+GREETING_DONE_CACHE: Dict[str, float] = {}
+GREETING_DONE_CACHE_TTL = int(os.getenv("GREETING_DONE_CACHE_TTL", "86400"))  # seconds
+
+# Projeções das leituras de histórico (só as colunas usadas; metadata/ids ficam no banco)
+HISTORY_COLUMNS: Final = "direction,content"
+GREETING_CHECK_COLUMNS: Final = "direction,content,metadata"
+# Janela FIFO do histórico enviado ao LLM: últimas N mensagens, dentro de um teto de tokens
+# (o prefill cresce linearmente com o histórico; respostas longas não podem estourar o contexto)
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "20"))
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "4000"))
+
+# Referências fortes para tarefas fire-and-forget (evita coleta antes do término)
+_BACKGROUND_TASKS: set = set()
+
+# Mensagens enviadas aguardando gravação em lote: [(user_phone, content, meta, created_at, tentativas)]
+_SENT_MESSAGE_BUFFER: List[tuple] = []
+SENT_MESSAGE_FLUSH_INTERVAL_MS = int(os.getenv("SENT_MESSAGE_FLUSH_INTERVAL_MS", "250"))
+SENT_MESSAGE_BATCH_MAX = int(os.getenv("SENT_MESSAGE_BATCH_MAX", "25"))
+# Tentativas de gravação de cada mensagem enviada antes de descartá-la (com log de erro)
+SENT_MESSAGE_MAX_ATTEMPTS = int(os.getenv("SENT_MESSAGE_MAX_ATTEMPTS", "3"))
+
+# Roteamento por nível de modelo: "instant" para classificações e turnos curtos,
+# "balanced" para respostas completas (OPENAI_FAST_MODEL ausente = mesmo modelo)
+MODEL_TIERS: Final = {
+    "instant": os.getenv("OPENAI_FAST_MODEL") or os.getenv("OPENAI_MODEL"),
+    "balanced": os.getenv("OPENAI_MODEL"),
+}
+INSTANT_TIER_MAX_CHARS = int(os.getenv("INSTANT_TIER_MAX_CHARS", "80"))
+# Tetos de saída das classificações (JSON de poucos campos): o padrão de 512 só reserva TPM à toa
+INTENT_NLU_MAX_TOKENS: Final = 40
+CTA_NLU_MAX_TOKENS: Final = 80
+
+# Respostas genéricas em streaming: cada parágrafo é enviado assim que fica completo
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "0") == "1"
+# Teto de saída da resposta de conversa (instruções pedem resposta concisa; 512 sobrava ~3x)
+CHAT_REPLY_MAX_TOKENS = int(os.getenv("CHAT_REPLY_MAX_TOKENS", "200"))
+# Janela (ms) para agrupar rajadas de mensagens do mesmo usuário num único turno (0 desativa)
+MESSAGE_COALESCE_MS = int(os.getenv("MESSAGE_COALESCE_MS", "150"))
+# Cache semântico só para mensagens curtas sem contexto (longas carregam detalhes próprios)
+SEMANTIC_CACHE_MAX_CHARS = int(os.getenv("SEMANTIC_CACHE_MAX_CHARS", "160"))
+
+# Cache LRU+TTL das análises de imagem: { blake2b(imagem+legenda): (resposta, expires_epoch) }
+IMAGE_ANALYSIS_CACHE: "OrderedDict[str, tuple[str, float]]" = OrderedDict()
+IMAGE_ANALYSIS_CACHE_TTL = int(os.getenv("IMAGE_ANALYSIS_CACHE_TTL", "3600"))  # seconds
+IMAGE_ANALYSIS_CACHE_MAX = int(os.getenv("IMAGE_ANALYSIS_CACHE_MAX", "256"))  # entries
+
+# Cache LRU da classificação de intenção: { mensagem normalizada: é_busca_de_imóvel }
+# (frases repetidas como "quero alugar" não precisam de nova chamada ao NLU)
+PROPERTY_INTENT_CACHE: "OrderedDict[str, bool]" = OrderedDict()
+PROPERTY_INTENT_CACHE_MAX = int(os.getenv("PROPERTY_INTENT_CACHE_MAX", "4096"))  # entries
+
+# Maior lado (px) aceito para imagens enviadas ao modelo de visão
+# (o modelo reduz no servidor de qualquer forma; enviar maior só gasta banda e tokens)
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1024"))
+# Tamanho máximo (bytes, antes do base64) da imagem enviada ao modelo de visão
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(1024 * 1024)))
+# Qualidade do JPEG re-comprimido (80 preserva detalhes de fotos de imóveis com ~metade do tamanho)
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "80"))
+# Teto de saída da análise de imagem (resumo de até 300 caracteres)
+VISION_MAX_TOKENS: Final = 384
+
+# Respostas padrão (boilerplate estático)
+IMAGE_ANALYSIS_FALLBACK_MESSAGE: Final = (
+    "📸 Recebi sua imagem!\n\n"
+    "😅 Tive dificuldade técnica para analisá-la no momento.\n\n"
+    "🏠 *Mas posso ajudar de outras formas:*\n"
+    "• Descreva o imóvel que procura\n"
+    "• Informe sua localização preferida\n"
+    "• Conte sobre seu orçamento\n\n"
+    "📞 *Ou entre em contato direto:*\n"
+    "🏠 Vendas: (41) 99214-6670\n"
+    "🏡 Locação: (41) 99223-0874"
+)
+TECHNICAL_DIFFICULTY_MESSAGE: Final = (
+    "😅 Tive dificuldade técnica para responder no momento. Por favor, tente novamente em instantes."
+)
+VISION_EMPTY_MESSAGE: Final = "📸 Não consegui analisar a imagem agora."
+VISION_ERROR_MESSAGE: Final = "📸 Não foi possível analisar a imagem agora. Tente novamente mais tarde."
+PROPERTY_LISTING_HEADER: Final = "Algumas opções que encontrei:"
+PROPERTY_LISTING_FOOTER: Final = (
+    "\n\n\nSe quiser mais detalhes de alguma delas basta me falar o número ou dizer 'quero a 1', por exemplo."
+)
+NO_RESULTS_MESSAGE: Final = (
+    "Não encontrei imóveis que atendam exatamente ao que você procura no momento. "
+    "Que tal me contar mais detalhes sobre suas preferências? "
+    "Posso buscar opções similares ou te ajudar a refinar a busca. "
+    "Também posso te passar o contato direto da nossa equipe para uma consulta personalizada."
+)
+
+# Palavras-chave das heurísticas (constantes: evitam recriar listas a cada mensagem)
+PROPERTY_SEARCH_KEYWORDS: Final = (
+    "procuro", "buscar", "apartamento", "casa", "quarto", "quartos",
+    "aluguel", "venda", "vaga", "área", "bairro", "locação",
+    "locar", "alugar", "comprar", "imóvel", "propriedade",
+    "preciso", "quero", "gostaria", "interesse",
+)
+CTA_INTENT_KEYWORDS: Final = (
+    "ver detalhes", "link", "manda o link", "me envia o link", "agendar visita",
+    "quero esse", "quero este", "gostei desse", "gostei dessa", "quero ver",
+    "me passa", "me manda", "qual o valor", "valor desse",
+)
+ASKING_MORE_INFO_KEYWORDS: Final = (
+    "que tal me contar", "mais detalhes", "suas preferências",
+    "refinar a busca", "me conte", "gostaria de saber",
+    "qual seu orçamento", "quantos quartos", "qual bairro",
+    "para alugar ou comprar", "mais informações",
+)
+# Cada lista vira uma única alternação compilada: uma varredura em C em vez de N buscas por substring
+CTA_INTENT_PATTERN: Final = re.compile("|".join(map(re.escape, CTA_INTENT_KEYWORDS)))
+ASKING_MORE_INFO_PATTERN: Final = re.compile("|".join(map(re.escape, ASKING_MORE_INFO_KEYWORDS)))
+
+# Apresentações em texto livre ("meu nome é X", "sou o X", "aqui é a X") num único regex
+NAME_INTRO_PATTERN: Final = re.compile(r"(?:meu nome [eé]|sou [oa]|aqui é [oa])\s+([A-Za-zÀ-ÖØ-öø-ÿ]{2,25})")
+BEDROOMS_QUERY_PATTERN: Final = re.compile(r"(\d+)\s*quarto")
+
+
+# Todas as palavras-chave num único regex: uma varredura da mensagem (em C) em vez de N buscas
+PROPERTY_SEARCH_PATTERN: Final = re.compile("|".join(map(re.escape, PROPERTY_SEARCH_KEYWORDS)))
+
+
+@lru_cache(maxsize=4096)
+def _match_property_keywords(text: str) -> tuple:
+    """Palavras-chave de busca de imóvel presentes em `text` (já em minúsculas), sem repetição."""
+    return tuple(dict.fromkeys(PROPERTY_SEARCH_PATTERN.findall(text)))
+
 class IntelligentRealEstateBot:
     """Bot inteligente especializado em imóveis"""
 
+    # Prompts estáticos (montados uma vez por classe, não por chamada)
+    IMAGE_PROMPT_HEADER = (
+        "Você é a Sofia, assistente virtual da Allega Imóveis. Analise esta imagem de imóvel enviada pelo cliente.\n\n"
+        "INSTRUÇÕES PARA ANÁLISE:\n"
+        "1. Descreva detalhadamente o que você vê na imagem\n"
+        "2. Identifique características do imóvel (tipo, quartos, área, localização se visível)\n"
+        "3. Se for um print de anúncio, extraia todas as informações disponíveis\n"
+        "4. Verifique se temos imóveis similares em nossa base\n"
+        "5. Seja cordial e ofereça ajuda adicional\n\n"
+    )
+    IMAGE_PROMPT_FOOTER = "\n\nResponda como Sofia da Allega Imóveis, sendo profissional e prestativa."
+    # Instrução final do prompt de visão (a imagem segue como parte image_url da mensagem)
+    VISION_INSTRUCTIONS = "\n\nResuma em até 300 caracteres e destaque campos relevantes."
+    PROFILE_SYSTEM_PROMPT = (
+        "Você é um assistente que extrai informações estruturadas de mensagens de clientes. "
+        "Retorne apenas um JSON válido com campos opcionais: name, email, phone, transaction_type, "
+        "budget_min, budget_max, preferred_neighborhoods (lista), bedrooms (int), contact_time (string)."
+    )
+    # Exemplo serializado uma única vez; o telefone do cliente substitui o marcador por chamada
+    PROFILE_EXAMPLE_JSON = json.dumps({
+        "name": "Maria Silva",
+        "email": "maria@example.com",
+        "phone": "__PHONE__",
+        "transaction_type": "locacao",
+        "budget_min": None,
+        "budget_max": 2000,
+        "preferred_neighborhoods": ["Água Verde"],
+        "bedrooms": 2,
+        "contact_time": "tarde"
+    }, ensure_ascii=False)
+    LLM_CONTEXT_HEADER = (
+        "Você é Sofia, consultora imobiliária da Allega Imóveis em Curitiba.\n"
+        "Responda de forma natural e conversacional, como se estivesse falando pessoalmente com o cliente."
+    )
+    LLM_CONTEXT_INSTRUCTIONS = "\n".join([
+        "",
+        "Instruções para sua resposta:",
+        "- Seja natural e conversacional, não robotizada",
+        "- Destaque os pontos mais relevantes para o que o cliente pediu",
+        "- Se houver links ou imagens, inclua-os naturalmente na conversa",
+        "- Ofereça ajuda adicional (visita, mais opções, contato direto)",
+        "- Se não encontrar nada adequado, seja honesta e ofereça alternativas",
+        "- Mantenha o tom amigável e profissional da Sofia"
+    ])
+
+    CHAT_INSTRUCTIONS = (
+        "Você é Sofia, assistente virtual da Allega Imóveis.\n"
+        "Responda de forma concisa, inclua URL e imagem quando disponíveis e ofereça próximos passos."
+    )
+
+    # Pergunta de qualificação da saudação por transação sugerida pelo usuário
+    GREETING_FOLLOW_UPS = {
+        'alugar': "Está buscando para alugar mesmo ou também consideraria comprar?",
+        'comprar': "Confirma que é para compra ou também avalia locação?",
+        None: "Seria para alugar ou comprar?",
+    }
+
     def __init__(self):
         self.bot_config = {
             'company_name': 'Allega Imóveis',
@@ -51,46 +253,88 @@ class IntelligentRealEstateBot:
             'enable_property_search': True,
             'enable_market_insights': True,
             'enable_image_analysis': True,
-            'max_properties_per_response': 3
+            'max_properties_per_response': 3,
+            'enable_semantic_cache': os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1"
         }
-        # Whatsapp service será instanciado sob demanda
+        # Whatsapp service (instância compartilhada) obtido sob demanda
         self.whatsapp_service = None
         # flags controláveis via env para evitar 400s da Cloud API
         self.whatsapp_supports_typing = False
         self.whatsapp_supports_presence = False
         # Flag para evitar spam de warnings de funcionalidades ainda não migradas
         self._embedding_meta_warning_emitted = False
+        # Prompt de sistema da conversa genérica: idêntico em todas as chamadas (prefix caching)
+        self.chat_system_prompt = f"{rag.system_prompt}\n\n{self.CHAT_INSTRUCTIONS}"
+        # Flush agendado do buffer de mensagens enviadas (None = nenhum pendente)
+        self._sent_flush_task: Optional[asyncio.Task] = None
+        # Rajadas em coleta por usuário: { telefone: (mensagens, future do turno) }
+        self._message_bursts: Dict[str, tuple[List[str], asyncio.Future]] = {}
         logger.info("Bot de Inteligência Imobiliária iniciado")
 
-    async def get_conversation_history(self, user_phone, limit=10) -> List[Dict[str, str]]:
-        """Busca histórico de conversa usando Supabase."""
+    async def get_conversation_history(self, user_phone, limit=10, conversation_id: Optional[str] = None) -> List[Dict[str, str]]:
+        """Busca histórico de conversa usando Supabase.
+        Se conversation_id já for conhecido, evita nova ida ao get_or_create_conversation."""
         try:
-            conversation = await asyncio.to_thread(
-                supabase_client.get_or_create_conversation,
-                user_phone
-            )
+            if conversation_id is None:
+                conversation = await asyncio.to_thread(
+                    supabase_client.get_or_create_conversation,
+                    user_phone
+                )
+                conversation_id = conversation['id']
             
             messages = await asyncio.to_thread(
                 supabase_client.get_conversation_messages,
-                conversation['id'],
-                limit
+                conversation_id,
+                limit,
+                HISTORY_COLUMNS
             )
             
-            # Converter para formato esperado
-            history = []
-            for msg in reversed(messages):  # Ordem cronológica
-                history.append({
-                    "direction": msg["direction"],
-                    "message": msg["content"],
-                    "timestamp": msg["created_at"]
-                })
-            
-            return history
+            # Já no formato de mensagens do chat, em ordem cronológica (o banco ordena por
+            # created_at DESC via idx_messages_conversation; reversed() não copia a lista)
+            return [
+                {
+                    "role": "user" if msg["direction"] == "received" else "assistant",
+                    "content": msg["content"]
+                }
+                for msg in reversed(messages)
+            ]
         except Exception as e:
             logger.debug(f"Falha ao obter histórico via Supabase: {e}")
             return []
 
     async def process_message(self, message: str, user_phone: str) -> str:
+        """
+        Ponto de entrada por mensagem recebida.
+
+        Mensagens do mesmo usuário que chegam dentro de MESSAGE_COALESCE_MS são
+        unidas (uma por linha) num único turno: uma persistência, uma leitura de
+        histórico e uma chamada ao LLM. Só quem abriu a janela recebe o retorno
+        do turno; as demais chamadas retornam "" (nada a enviar).
+        """
+        if MESSAGE_COALESCE_MS <= 0:
+            return await self._process_message_turn(message, user_phone)
+
+        burst = self._message_bursts.get(user_phone)
+        if burst is not None:
+            burst[0].append(message)
+            await asyncio.shield(burst[1])
+            return ""
+
+        turn_done = asyncio.get_running_loop().create_future()
+        messages = [message]
+        self._message_bursts[user_phone] = (messages, turn_done)
+        try:
+            try:
+                await asyncio.sleep(MESSAGE_COALESCE_MS / 1000)
+            finally:
+                self._message_bursts.pop(user_phone, None)
+            if len(messages) > 1:
+                logger.info("Agrupando %d mensagens seguidas de %s num único turno", len(messages), user_phone)
+            return await self._process_message_turn("\n".join(messages), user_phone)
+        finally:
+            turn_done.set_result(None)
+
+    async def _process_message_turn(self, message: str, user_phone: str) -> str:
         """
         Processa mensagem com otimizações de escala:
         - State machine para evitar race conditions
@@ -98,11 +342,14 @@ class IntelligentRealEstateBot:
         - Processamento thread-safe
         """
         try:
-            logger.info(f"📨 Mensagem de {user_phone}: {message[:100]}")
+            logger.info("📨 Mensagem de %s: %.100s", user_phone, message)
 
-            # 1) Gerenciar estado da conversa (thread-safe)
-            conversation = await conversation_manager.get_or_create_conversation(user_phone)
-            current_state = conversation["state"]
+            # 1) Estado da conversa (thread-safe) e conversa no Supabase, em paralelo
+            conversation_state, conversation = await asyncio.gather(
+                conversation_manager.get_or_create_conversation(user_phone),
+                asyncio.to_thread(supabase_client.get_or_create_conversation, user_phone)
+            )
+            current_state = conversation_state["state"]
             
             # 2) Verificar se já está processando para evitar duplicação
             if current_state == ConversationState.PENDING:
@@ -112,37 +359,29 @@ class IntelligentRealEstateBot:
                     {"processing": True, "last_message": message}
                 )
 
-            # 3) Salva mensagem recebida (received) no Supabase
-            conversation = await asyncio.to_thread(
-                supabase_client.get_or_create_conversation,
-                user_phone
+            # 3) Histórico anterior (Supabase) em paralelo com a detecção de intenção (LLM)
+            history, is_property_search = await asyncio.gather(
+                self.get_conversation_history(user_phone, limit=HISTORY_MAX_MESSAGES, conversation_id=conversation['id']),
+                self._is_property_search(message)
             )
-            await asyncio.to_thread(
-                supabase_client.save_message,
-                conversation['id'],
-                'received',
-                message,
-                'text',
-                None,
-                {"conversation_state": current_state.value}
-            )
-            logger.info(f"Mensagem salva no Supabase para {user_phone}.")
+
+            # 4) Salva mensagem recebida (received) em background: lida o histórico antes,
+            #    a gravação sai do caminho crítico e o histórico nunca inclui a mensagem atual
+            self._fire_and_forget(self._persist_received_message(
+                conversation['id'], user_phone, message, {"conversation_state": current_state.value}
+            ))
 
             if self.whatsapp_service is None:
-                token = os.getenv("WHATSAPP_ACCESS_TOKEN")
-                phone_id = os.getenv("WHATSAPP_PHONE_NUMBER_ID")
-                if token and phone_id:
-                    self.whatsapp_service = WhatsAppService(token, phone_id)
+                service = get_whatsapp_service()
+                if service.is_configured():
+                    self.whatsapp_service = service
                 else:
                     logger.error("WhatsAppService não configurado corretamente.")
                     return "Erro interno: serviço indisponível."
 
-            # 4) Recupera histórico rápido (menor limite para agilizar)
-            history = await self.get_conversation_history(user_phone, limit=6)
-
             # 5) Se for busca por imóvel, dispare tarefa específica de busca+envio.
             #    Assim garantimos que process_property_search seja chamado.
-            if await self._is_property_search(message):
+            if is_property_search:
                 # Enviar saudação personalizada se aplicável (antes do fluxo principal)
                 try:
                     if await self._should_send_greeting(user_phone):
@@ -150,10 +389,10 @@ class IntelligentRealEstateBot:
                 except Exception:
                     logger.debug("Falha ao enviar saudação personalizada (ignorado)")
                 logger.info("Mensagem identificada como busca de imóvel — iniciando fluxo de property_search em background.")
-                asyncio.create_task(self._process_property_search_and_send(message, user_phone, history))
+                self._fire_and_forget(self._process_property_search_and_send(message, user_phone, history))
             else:
                 # Dispara geração/atualização em background (fluxo genérico)
-                asyncio.create_task(self._generate_and_send_response(
+                self._fire_and_forget(self._generate_and_send_response(
                     message, user_phone, history
                 ))
 
@@ -163,70 +402,113 @@ class IntelligentRealEstateBot:
             logger.exception(f"Erro ao processar mensagem (inicial): {e}")
             return "Desculpe, ocorreu um erro. Tente novamente mais tarde."
 
+    @staticmethod
+    def _trim_history(history: List[Dict[str, str]], max_messages: int = HISTORY_MAX_MESSAGES,
+                      max_tokens: int = HISTORY_MAX_TOKENS) -> List[Dict[str, str]]:
+        """Mantém as mensagens mais recentes (FIFO) que cabem em max_messages e max_tokens.
+
+        Contagem com o tokenizer tiktoken do rag (bloqueante na primeira carga: executar em thread).
+        """
+        encode = rag.tokenizer.encode_ordinary
+        kept = 0
+        used = 0
+        for msg in reversed(history[-max_messages:]):
+            used += len(encode(msg["content"]))
+            if used > max_tokens:
+                break
+            kept += 1
+        return history[len(history) - kept:]
+
+    @staticmethod
+    def _normalize_history(raw_history: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """Normaliza histórico: aceita formatos {role, content}, {direction, message} ou payload de webhook."""
+        normalized = []
+        for h in raw_history or []:
+            if isinstance(h, dict):
+                if "role" in h and "content" in h:
+                    normalized.append({"role": h["role"], "content": h["content"]})
+                    continue
+                if "direction" in h and "message" in h:
+                    role = "user" if h.get("direction") == "received" else "assistant"
+                    normalized.append({"role": role, "content": h.get("message", "")})
+                    continue
+                # If payload is nested (ex: webhook message)
+                if isinstance(h.get("text"), dict) and "body" in h["text"]:
+                    normalized.append({"role": "user", "content": h["text"]["body"]})
+                    continue
+            # Fallback: stringify
+            normalized.append({"role": "user", "content": str(h)})
+        return normalized
+
+    @staticmethod
+    def _parse_json_object(resp: str) -> dict:
+        """Extrai o objeto JSON ({...}) de uma resposta do LLM; levanta ValueError se inválido."""
+        start = resp.find("{")
+        end = resp.rfind("}")
+        json_text = resp[start:end + 1] if start != -1 and end > start else resp
+        data = json_utils.loads(json_text)
+        if not isinstance(data, dict):
+            raise ValueError("JSON retornado não é um objeto")
+        return data
+
     async def _generate_and_send_response(self, message: str, user_phone: str, history: List[Dict[str, str]]):
         """Gera a resposta, pára o typing loop e envia a mensagem final (sem placeholder)."""
         try:
-            logger.info(f"Iniciando geração de resposta para {user_phone}...")
-            # Normalizar histórico: aceitar formatos {role, content} ou {direction, message} ou firestore doc shape
-            def _normalize_history(raw_history: List[Dict[str, Any]]) -> List[Dict[str, str]]:
-                normalized = []
-                for h in raw_history or []:
+            logger.info("Gerando resposta para %s...", user_phone)
+            normalized_history = self._normalize_history(history)
+            # Fluxo genérico (não é busca de imóvel): turnos curtos vão para o modelo rápido
+            model = MODEL_TIERS["instant" if len(message) < INSTANT_TIER_MAX_CHARS else "balanced"]
+            query_embedding = None
+            if not normalized_history:
+                # Sem contexto anterior: prompt sem dados do cliente, para que perguntas frequentes
+                # idênticas ("tem casa no Bigorrilho?") reaproveitem o cache de respostas entre clientes
+                clean_message = " ".join(message.split())
+                prompt_with_history = self._build_prompt(clean_message, "cliente")
+                # ...e perguntas parecidas, o cache semântico
+                if self.bot_config.get("enable_semantic_cache") and len(clean_message) <= SEMANTIC_CACHE_MAX_CHARS:
                     try:
-                        if isinstance(h, dict):
-                            if "role" in h and "content" in h:
-                                normalized.append({"role": h["role"], "content": h["content"]})
-                                continue
-                            if "direction" in h and "message" in h:
-                                role = "user" if h.get("direction") == "received" else "assistant"
-                                normalized.append({"role": role, "content": h.get("message", "")})
-                                continue
-                            if "message" in h and "direction" in h:
-                                role = "user" if h.get("direction") == "received" else "assistant"
-                                normalized.append({"role": role, "content": h.get("message", "")})
-                                continue
-                            # If payload is nested (ex: webhook message)
-                            if "text" in h and isinstance(h["text"], dict) and "body" in h["text"]:
-                                normalized.append({"role": "user", "content": h["text"]["body"]})
-                                continue
-                        # Fallback: stringify
-                        normalized.append({"role": "user", "content": str(h)})
+                        query_embedding = await semantic_response_cache.embed(clean_message.lower())
                     except Exception:
-                        # ignore malformed entries
-                        continue
-                return normalized
-
-            logger.info(f"Gerando resposta para {user_phone}...")
-            prompt = self._build_prompt(message, user_phone)
-            normalized_history = _normalize_history(history)
-            short_history = normalized_history + [{"role": "user", "content": message}]
-            prompt_with_history = prompt + "\n\nHISTORY:\n" + "\n".join([f"{h['role']}: {h['content']}" for h in short_history])
-
-            model = os.getenv("OPENAI_MODEL")
-            response_text = await asyncio.to_thread(rag.call_gpt, prompt_with_history, model)
+                        logger.debug("Falha ao gerar embedding para o cache semântico (ignorado)")
+            else:
+                # Histórico vai como mensagens estruturadas após o prompt de sistema (prefixo estável
+                # entre turnos para o cache de prompt do provedor); o prompt é só o turno atual
+                first_name = await self._aget_first_name(user_phone)
+                prompt_with_history = self._build_prompt(message, first_name or user_phone)
+                normalized_history = await asyncio.to_thread(self._trim_history, normalized_history)
+
+            cached_reply = None
+            if query_embedding is not None:
+                cached_reply = semantic_response_cache.lookup(model, query_embedding)
+            streamed = STREAM_REPLIES and getattr(self, "whatsapp_service", None) is not None
+            if cached_reply:
+                response_text = cached_reply
+                streamed = False
+            elif streamed:
+                response_text = await self._stream_and_send_response(
+                    prompt_with_history, model, user_phone, normalized_history
+                )
+            else:
+                response_text = await rag.acall_gpt(
+                    prompt_with_history, model, system_prompt=self.chat_system_prompt,
+                    max_tokens=CHAT_REPLY_MAX_TOKENS, history=normalized_history
+                )
+            # Só completions reais: textos de fallback não podem ser servidos a outras perguntas
+            if query_embedding is not None and response_text and not cached_reply \
+                    and response_text not in FALLBACK_REPLIES:
+                semantic_response_cache.store(model, query_embedding, response_text)
 
             if not response_text:
                 response_text = "Desculpe, não consegui gerar uma resposta no momento."
+                streamed = False
 
-            # Persistir a mensagem final como "sent" no Supabase
-            try:
-                conversation = await asyncio.to_thread(
-                    supabase_client.get_or_create_conversation,
-                    user_phone
-                )
-                await asyncio.to_thread(
-                    supabase_client.save_message,
-                    conversation['id'],
-                    'sent',
-                    response_text,
-                    'text',
-                    None,
-                    {"ai": True}
-                )
-            except Exception:
-                logger.exception("Falha ao persistir mensagem enviada no Supabase.")
+            # Persistir a mensagem final como "sent" no Supabase (em background, não atrasa o envio)
+            self._persist_sent_message(user_phone, response_text, {"ai": True, "streamed": True} if streamed else {"ai": True})
 
-            # Envia a mensagem final via WhatsApp (se configurado)
-            if getattr(self, "whatsapp_service", None):
+            # Envia a mensagem final via WhatsApp (se configurado e ainda não enviada em partes)
+            if streamed:
+                logger.debug("Resposta enviada em partes (streaming) para %s.", user_phone)
+            elif getattr(self, "whatsapp_service", None):
                 try:
                     ok = await self.whatsapp_service.send_message(user_phone, response_text)
                     if not ok:
@@ -238,22 +520,32 @@ class IntelligentRealEstateBot:
 
         except Exception as e:
             logger.exception(f"Erro ao gerar/enviar resposta: {e}")
-            try:
-                conversation = await asyncio.to_thread(
-                    supabase_client.get_or_create_conversation,
-                    user_phone
-                )
-                await asyncio.to_thread(
-                    supabase_client.save_message,
-                    conversation['id'],
-                    'sent',
-                    "Desculpe, ocorreu um erro ao gerar a resposta.",
-                    'text',
-                    None,
-                    {"ai": True, "error": True}
-                )
-            except Exception:
-                logger.debug("Falha ao persistir mensagem de erro.")
+            self._persist_sent_message(
+                user_phone,
+                "Desculpe, ocorreu um erro ao gerar a resposta.",
+                {"ai": True, "error": True}
+            )
+
+    async def _stream_and_send_response(self, prompt: str, model: Optional[str], user_phone: str,
+                                        history: Optional[List[Dict[str, str]]] = None) -> str:
+        """Consome a resposta em streaming e envia cada parágrafo completo ao usuário.
+        Retorna o texto integral (para persistência)."""
+        parts: List[str] = []
+        pending = ""
+        async for piece in rag.astream_gpt(
+            prompt, model, system_prompt=self.chat_system_prompt, max_tokens=CHAT_REPLY_MAX_TOKENS,
+            history=history
+        ):
+            parts.append(piece)
+            pending += piece
+            # Envia parágrafos prontos; o último (possivelmente incompleto) continua no buffer
+            *ready, pending = pending.split("\n\n")
+            for paragraph in ready:
+                if paragraph.strip():
+                    await self.whatsapp_service.send_message(user_phone, paragraph.strip())
+        if pending.strip():
+            await self.whatsapp_service.send_message(user_phone, pending.strip())
+        return "".join(parts).strip()
 
     async def _should_send_greeting(self, user_phone: str) -> bool:
         """Decide se deve enviar saudação personalizada agora.
@@ -264,6 +556,11 @@ class IntelligentRealEstateBot:
         """
         if os.getenv('GREETING_ENABLED', '1') == '0':
             return False
+        expires = GREETING_DONE_CACHE.get(user_phone)
+        if expires is not None:
+            if expires > time.time():
+                return False
+            GREETING_DONE_CACHE.pop(user_phone, None)
         try:
             # Buscar conversa + últimas mensagens (pequeno) em thread
             conversation = await asyncio.to_thread(
@@ -274,12 +571,21 @@ class IntelligentRealEstateBot:
             msgs = await asyncio.to_thread(
                 supabase_client.get_conversation_messages,
                 conv_id,
-                12
+                12,
+                GREETING_CHECK_COLUMNS
             )
             bot_sent = [m for m in msgs if m.get('direction') == 'sent']
-            # Checar se já enviamos saudação (metadado não implementado ainda -> inferir por padrão de texto)
-            already_greeted = any('sou a sofia' in (m.get('content','').lower()) for m in bot_sent)
-            return (len(bot_sent) <= 1) and not already_greeted
+            # Checar se já enviamos saudação: metadado {"greeting": True} gravado no envio;
+            # texto só é inspecionado em mensagens antigas, sem metadado
+            already_greeted = any(
+                (m.get('metadata') or {}).get('greeting')
+                or (not m.get('metadata') and 'sou a sofia' in (m.get('content') or '').lower())
+                for m in bot_sent
+            )
+            eligible = (len(bot_sent) <= 1) and not already_greeted
+            if not eligible:
+                GREETING_DONE_CACHE[user_phone] = time.time() + GREETING_DONE_CACHE_TTL
+            return eligible
         except Exception as e:
             logger.debug(f"Falha em _should_send_greeting: {e}")
             return False
@@ -287,7 +593,7 @@ class IntelligentRealEstateBot:
     async def _send_personalized_greeting(self, user_phone: str, user_message: str):
         """Envia saudação inicial com primeiro nome identificado ou genérico."""
         try:
-            first_name = self._get_first_name(user_phone) or ''
+            first_name = await self._aget_first_name(user_phone) or ''
             # Tentar inferir transação (aluguel x venda) se usuário mencionou
             lower = (user_message or '').lower()
             hinted = None
@@ -297,135 +603,135 @@ class IntelligentRealEstateBot:
                 hinted = 'comprar'
             name_part = f"Olá {first_name}, " if first_name else "Olá, "
             base = (
-                f"{name_part}sou a Sofia da Allega Imóveis e vou te ajudar a encontrar seu imóvel."
+                f"{name_part}sou a Sofia da Allega Imóveis e vou te ajudar a encontrar seu imóvel. "
+                f"{self.GREETING_FOLLOW_UPS[hinted]}"
             )
-            if hinted == 'alugar':
-                base += " Está buscando para alugar mesmo ou também consideraria comprar?"
-            elif hinted == 'comprar':
-                base += " Confirma que é para compra ou também avalia locação?"
-            else:
-                base += " Seria para alugar ou comprar?"
             # Enviar sem bloquear o fluxo principal (mas aguardar envio para não cruzar com CTAs imediatamente)
             if getattr(self, 'whatsapp_service', None):
                 await self.whatsapp_service.send_message(user_phone, base)
-                # Persistir
-                try:
-                    conversation = await asyncio.to_thread(
-                        supabase_client.get_or_create_conversation,
-                        user_phone
-                    )
-                    await asyncio.to_thread(
-                        supabase_client.save_message,
-                        conversation['id'],
-                        'sent',
-                        base,
-                        'text',
-                        None,
-                        {"ai": True, "greeting": True}
-                    )
-                except Exception:
-                    logger.debug("Falha ao persistir greeting.")
+                GREETING_DONE_CACHE[user_phone] = time.time() + GREETING_DONE_CACHE_TTL
+                # Persistir em segundo plano (CTAs seguem sem esperar o Supabase)
+                self._persist_sent_message(user_phone, base, {"ai": True, "greeting": True})
         except Exception as e:
             logger.debug(f"Erro ao enviar greeting: {e}")
 
     async def process_image_message(self, image_data: bytes, caption: str, user_phone: str) -> str:
         try:
-            logger.info(f"📸 Imagem recebida de {user_phone} - Tamanho: {len(image_data)} bytes")
-            image_b64 = base64.b64encode(image_data).decode("utf-8")
+            logger.info("📸 Imagem recebida de %s - Tamanho: %d bytes", user_phone, len(image_data))
+            # Mesma imagem + legenda (ex.: print de anúncio reenviado) -> reaproveita análise
+            # Hash de vários MB é CPU-bound: calculado fora do event loop, como o resize
+            cache_key = await asyncio.to_thread(self._image_cache_key, image_data, caption)
+            cached = IMAGE_ANALYSIS_CACHE.get(cache_key)
+            if cached:
+                cached_response, expires = cached
+                if expires > time.time():
+                    IMAGE_ANALYSIS_CACHE.move_to_end(cache_key)
+                    logger.info("✅ Análise de imagem (cache) para %s", user_phone)
+                    return cached_response
+                IMAGE_ANALYSIS_CACHE.pop(cache_key, None)
+
+            # Resize + base64 são CPU-bound: executar fora do event loop
+            image_b64 = await asyncio.to_thread(self._prepare_image_base64, image_data)
             prompt = self._build_image_prompt(caption, user_phone)
             response = await self._call_sofia_vision(prompt, image_b64)
-            logger.info(f"✅ Análise de imagem concluída para {user_phone}")
+            logger.info("✅ Análise de imagem concluída para %s", user_phone)
+
+            # Só armazena análises reais (não as mensagens de falha)
+            if response not in (VISION_EMPTY_MESSAGE, VISION_ERROR_MESSAGE):
+                IMAGE_ANALYSIS_CACHE[cache_key] = (response, time.time() + IMAGE_ANALYSIS_CACHE_TTL)
+                IMAGE_ANALYSIS_CACHE.move_to_end(cache_key)
+                while len(IMAGE_ANALYSIS_CACHE) > IMAGE_ANALYSIS_CACHE_MAX:
+                    IMAGE_ANALYSIS_CACHE.popitem(last=False)
             return response
         except Exception as e:
-            logger.exception(f"❌ Erro ao processar imagem: {str(e)}")
-            return (
-                "📸 Recebi sua imagem!\n\n"
-                "😅 Tive dificuldade técnica para analisá-la no momento.\n\n"
-                "🏠 *Mas posso ajudar de outras formas:*\n"
-                "• Descreva o imóvel que procura\n"
-                "• Informe sua localização preferida\n"
-                "• Conte sobre seu orçamento\n\n"
-                "📞 *Ou entre em contato direto:*\n"
-                "🏠 Vendas: (41) 99214-6670\n"
-                "🏡 Locação: (41) 99223-0874"
-            )
+            logger.exception(f"❌ Erro ao processar imagem: {e}")
+            return IMAGE_ANALYSIS_FALLBACK_MESSAGE
 
-    def _build_prompt(self, message: str, user_phone: str) -> str:
-        system = (
-            "Você é Sofia, assistente virtual da Allega Imóveis.\n"
-            "Responda de forma concisa, inclua URL e imagem quando disponíveis e ofereça próximos passos.\n"
-        )
-        user_display = self._get_first_name(user_phone) or user_phone
-        return system + f"\nUsuário ({user_display}): {message}\n"
+    @staticmethod
+    def _image_cache_key(image_data: bytes, caption: str) -> str:
+        """Chave do cache de análises: blake2b incremental de imagem + legenda (sem concatenar os bytes)."""
+        digest = hashlib.blake2b(image_data, digest_size=16)
+        digest.update(b"\0")
+        digest.update((caption or "").encode("utf-8"))
+        return digest.hexdigest()
+
+    def _prepare_image_base64(self, image_data: bytes) -> str:
+        """Reduz a imagem para IMAGE_MAX_SIDE/IMAGE_MAX_BYTES (se Pillow disponível) e codifica em base64.
+
+        Imagens fora do limite ou que não são JPEG (PNG de print, WebP...) são re-comprimidas em JPEG.
+        """
+        if Image is not None:
+            try:
+                with Image.open(io.BytesIO(image_data)) as img:
+                    if (max(img.size) > IMAGE_MAX_SIDE or len(image_data) > IMAGE_MAX_BYTES
+                            or img.format != "JPEG"):
+                        # JPEG: decodifica já reduzido (escala 1/2..1/8 no domínio DCT) antes do resize fino
+                        img.draft("RGB", (IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+                        img.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE), Image.LANCZOS)
+                        if img.mode in ("RGBA", "LA", "P"):
+                            # Transparência sobre fundo branco (convert direto deixaria preto)
+                            rgba = img.convert("RGBA")
+                            img = Image.new("RGB", rgba.size, (255, 255, 255))
+                            img.paste(rgba, mask=rgba.getchannel("A"))
+                        elif img.mode not in ("RGB", "L"):
+                            img = img.convert("RGB")
+                        # Reduz dimensões até caber no limite de bytes (máx. 4 tentativas)
+                        for _ in range(4):
+                            buffer = io.BytesIO()
+                            img.save(buffer, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+                            if buffer.tell() <= IMAGE_MAX_BYTES:
+                                break
+                            width, height = img.size
+                            img.thumbnail((int(width * 0.75), int(height * 0.75)), Image.LANCZOS)
+                        image_data = buffer.getvalue()
+            except Exception as e:
+                logger.debug(f"Resize de imagem ignorado: {e}")
+        # pybase64 gera a str direto (sem o passo bytes -> decode)
+        if pybase64 is not None:
+            return pybase64.b64encode_as_string(image_data)
+        return base64.b64encode(image_data).decode("ascii")
+
+    def _build_prompt(self, message: str, user_display: str) -> str:
+        """Turno do usuário (curto e variável); instruções fixas vão no prompt de sistema."""
+        return f"Usuário ({user_display}): {message}\n"
 
     def _build_image_prompt(self, caption: str, user_phone: str) -> str:
         """Constrói prompt específico para análise de imagens"""
-        return (
-            f"Você é a Sofia, assistente virtual da Allega Imóveis. Analise esta imagem de imóvel enviada pelo cliente.\n\n"
-            f"INSTRUÇÕES PARA ANÁLISE:\n"
-            f"1. Descreva detalhadamente o que você vê na imagem\n"
-            f"2. Identifique características do imóvel (tipo, quartos, área, localização se visível)\n"
-            f"3. Se for um print de anúncio, extraia todas as informações disponíveis\n"
-            f"4. Verifique se temos imóveis similares em nossa base\n"
-            f"5. Seja cordial e ofereça ajuda adicional\n\n"
-            f"Mensagem do usuário: {caption}\n\n"
-            f"Responda como Sofia da Allega Imóveis, sendo profissional e prestativa."
-        )
+        return f"{self.IMAGE_PROMPT_HEADER}Mensagem do usuário: {caption}{self.IMAGE_PROMPT_FOOTER}"
 
     async def _call_sofia_with_history(self, history: List[Dict[str, str]]) -> str:
         """
-        Constrói prompt a partir do histórico e chama o GPT (call_gpt) de forma segura.
+        Chama o GPT com o histórico como mensagens estruturadas (último item = turno atual).
         """
         try:
-            prompt = ""
-            for msg in history:
-                role = "Usuário" if msg["role"] == "user" else "Sofia"
-                prompt += f"{role}: {msg['content']}\n"
-            prompt += "Sofia:"
+            *previous, current = history
+            messages = [
+                {"role": "user" if msg['role'] == 'user' else "assistant", "content": msg['content']}
+                for msg in previous
+            ]
 
             model = os.getenv("OPENAI_MODEL")
-            response_text = await asyncio.to_thread(rag.call_gpt, prompt, model)
-            return response_text.strip() if response_text else (
-                "😅 Tive dificuldade técnica para responder no momento. Por favor, tente novamente em instantes."
-            )
+            response_text = await rag.acall_gpt(current['content'], model, history=messages)
+            return response_text.strip() if response_text else TECHNICAL_DIFFICULTY_MESSAGE
         except Exception as e:
-            logger.exception(f"Erro ao chamar Sofia: {str(e)}")
-            return "😅 Tive dificuldade técnica para responder no momento. Por favor, tente novamente em instantes."
+            logger.exception(f"Erro ao chamar Sofia: {e}")
+            return TECHNICAL_DIFFICULTY_MESSAGE
 
     async def _extract_profile_with_gpt(self, message: str, user_phone: str, history: List[Dict[str,str]]) -> dict:
         """Chama LLM para extrair um JSON com campos de perfil/requisitos do usuário."""
         try:
-            system = (
-                "Você é um assistente que extrai informações estruturadas de mensagens de clientes. "
-                "Retorne apenas um JSON válido com campos opcionais: name, email, phone, transaction_type, "
-                "budget_min, budget_max, preferred_neighborhoods (lista), bedrooms (int), contact_time (string)."
-            )
-            example = {
-                "name": "Maria Silva",
-                "email": "maria@example.com",
-                "phone": user_phone,
-                "transaction_type": "locacao",
-                "budget_min": None,
-                "budget_max": 2000,
-                "preferred_neighborhoods": ["Água Verde"],
-                "bedrooms": 2,
-                "contact_time": "tarde"
-            }
+            example = self.PROFILE_EXAMPLE_JSON.replace('"__PHONE__"', json.dumps(user_phone, ensure_ascii=False))
+            history_text = "\n".join(f"{h['role']}: {h['content']}" for h in history)
             prompt = (
-                f"{system}\n\nCONTEXT HISTORY:\n"
-                + "\n".join([f"{h['role']}: {h['content']}" for h in history])
-                + f"\n\nMESSAGE:\n{message}\n\nReturn JSON example:\n{json.dumps(example, ensure_ascii=False)}\n\nJSON:"
+                f"CONTEXT HISTORY:\n{history_text}"
+                f"\n\nMESSAGE:\n{message}\n\nReturn JSON example:\n{example}\n\nJSON:"
             )
             model = os.getenv("OPENAI_MODEL")
-            resp = await asyncio.to_thread(rag.call_gpt, prompt, model)
+            resp = await rag.acall_gpt(prompt, model, system_prompt=self.PROFILE_SYSTEM_PROMPT)
             if not resp:
                 return {}
             # tentar extrair JSON bruto do texto
-            start = resp.find("{")
-            end = resp.rfind("}") + 1
-            json_text = resp[start:end] if start != -1 and end != -1 else resp
-            data = json.loads(json_text)
-            return data if isinstance(data, dict) else {}
+            return self._parse_json_object(resp)
         except Exception as e:
             logger.debug(f"Falha extrair perfil: {e}")
             return {}
@@ -458,9 +764,10 @@ class IntelligentRealEstateBot:
         except Exception as e:
             logger.debug(f"Erro salvar property_search: {e}")
 
-    async def process_property_search(self, user_query: str, phone_number: Optional[str] = None) -> tuple[str, list]:
+    async def process_property_search(self, user_query: str, phone_number: Optional[str] = None, generate_answer: bool = True) -> tuple[str, list]:
         """
         Busca imóveis usando RAG local com resposta mais natural e session cache.
+        Com generate_answer=False pula a chamada ao LLM (resposta_texto vazia).
         Retorna: (resposta_texto, lista_de_imoveis_estruturados)
         """
         try:
@@ -471,6 +778,8 @@ class IntelligentRealEstateBot:
 
             # 2) Processar e estruturar dados
             normalized_hits, structured_properties = self._process_retrieved_documents(retrieved_docs)
+            if not generate_answer:
+                return "", structured_properties
             
             # 3) Gerar resposta natural via LLM
             response_text = await self._generate_natural_response(user_query, normalized_hits)
@@ -487,7 +796,6 @@ class IntelligentRealEstateBot:
         # Gerar phone_hash se phone_number fornecido
         phone_hash = None
         if phone_number:
-            import hashlib
             phone_hash = hashlib.md5(phone_number.encode()).hexdigest()
         
         retrieved = await rag.retrieve(user_query, top_k=8, filters={}, phone_hash=phone_hash)
@@ -513,11 +821,8 @@ class IntelligentRealEstateBot:
             structured_properties.append(structured_property)
         
         # Log diagnóstico: quantos possuem URL válida
-        try:
-            with_url = sum(1 for p in structured_properties if p.get("url") and p["url"].startswith("http"))
-            logger.info("StructuredPropertiesDiag | total=%d | with_url=%d", len(structured_properties), with_url)
-        except Exception:
-            pass
+        with_url = sum(1 for p in structured_properties if isinstance(p.get("url"), str) and p["url"].startswith("http"))
+        logger.info("StructuredPropertiesDiag | total=%d | with_url=%d", len(structured_properties), with_url)
         return normalized_hits, structured_properties
 
 
@@ -532,12 +837,11 @@ class IntelligentRealEstateBot:
             text = (doc.get("text") or doc.get("content") or doc.get("snippet") or "").strip()
             doc_id = doc.get("id") or doc.get("doc_id") or meta.get("id")
         else:
-            try:
-                meta = getattr(doc, "meta", {}) or getattr(doc, "metadata", {}) or {}
-                text = (getattr(doc, "text", None) or getattr(doc, "content", None) or "")
-                doc_id = getattr(doc, "id", None)
-            except Exception:
-                text = str(doc)
+            meta = getattr(doc, "meta", None) or getattr(doc, "metadata", None) or {}
+            text = getattr(doc, "text", None) or getattr(doc, "content", None) or ""
+            doc_id = getattr(doc, "id", None)
+            if not isinstance(text, str):
+                text = str(text)
         
         return {
             "id": doc_id or f"doc_{idx}",
@@ -567,19 +871,17 @@ class IntelligentRealEstateBot:
 
         price = meta.get("price") or meta.get("valor") or None
         # Normalização simples de preço se vier somente números
-        try:
-            if price and isinstance(price, (int, float)):
-                price = f"R$ {price:,.0f}".replace(",", ".")
-        except Exception:
-            pass
+        if price and isinstance(price, (int, float)):
+            price = f"R$ {price:,.0f}".replace(",", ".")
+        neighborhood = meta.get("neighborhood") or meta.get("bairro")
 
         return {
             "id": doc_data["id"],
-            "title": self._extract_title_from_text(text) or f"Imóvel em {meta.get('neighborhood', meta.get('bairro', 'Curitiba'))}",
+            "title": self._extract_title_from_text(text) or f"Imóvel em {neighborhood or 'Curitiba'}",
             "description": text[:200],
             "url": url,
             "main_image": meta.get("main_image") or meta.get("image"),
-            "neighborhood": meta.get("neighborhood") or meta.get("bairro"),
+            "neighborhood": neighborhood,
             "price": price or "Sob consulta",
             "bedrooms": meta.get("bedrooms") or meta.get("quartos") or meta.get("dorms")
         }
@@ -588,31 +890,25 @@ class IntelligentRealEstateBot:
         """Gera listagem textual curta de imóveis para enviar no WhatsApp quando não houver CTA."""
         if not structured_properties:
             return ""
-        lines = ["Algumas opções que encontrei:"]
-        for i, prop in enumerate(structured_properties[:max_list], start=1):
+        pieces = [PROPERTY_LISTING_HEADER]
+        for i, prop in enumerate(islice(structured_properties, max_list), start=1):
             title = (prop.get("title") or f"Imóvel {i}").strip()
             # Sanitizar tags técnicas como [ANALYSIS], [CONTEXT], etc.
             if title.startswith("[") and "]" in title.split(" ")[0]:
                 first_token = title.split(" ")[0]
                 if first_token.endswith("]") and len(first_token) < 25:
                     title = title[len(first_token):].strip(" -:•|\t") or f"Imóvel {i}"
-            bairro = prop.get("neighborhood") or ""
-            price = prop.get("price") or "Sob consulta"
-            bedrooms = prop.get("bedrooms") or "?"
             url = prop.get("url") or ""
-            part = f"{i}. {title}"
-            extras = []
-            if bairro:
-                extras.append(bairro)
-            if bedrooms and bedrooms != "?":
-                extras.append(f"{bedrooms} qt")
-            if price:
-                extras.append(str(price))
-            if url.startswith("http"):
-                part += f"\n{url}"
-            lines.append(part)
-        lines.append("\nSe quiser mais detalhes de alguma delas basta me falar o número ou dizer 'quero a 1', por exemplo.")
-        return "\n\n".join(lines)
+            pieces.append(f"\n\n{i}. {title}\n{url}" if url.startswith("http") else f"\n\n{i}. {title}")
+        pieces.append(PROPERTY_LISTING_FOOTER)
+        return "".join(pieces)
+
+    @staticmethod
+    def _truncate(text: str, limit: int, suffix: str = "...") -> str:
+        """Trunca text para no máximo `limit` caracteres (sufixo incluído); sem cópia se já couber."""
+        if text is None or len(text) <= limit:
+            return text
+        return text[:max(limit - len(suffix), 0)] + suffix
 
     def _augment_answer_with_listing(self, answer: str, structured_properties: list) -> str:
         """Acrescenta listagem de imóveis à resposta se ela não mencionar explicitamente opções."""
@@ -625,10 +921,8 @@ class IntelligentRealEstateBot:
             listing = self._build_property_listing(structured_properties)
             # Limite aproximado (WhatsApp geralmente suporta > 4000, manter seguro)
             combined = (answer.strip() + "\n\n" + listing).strip()
-            if len(combined) > 3800:
-                # Truncar para segurança mantendo começo
-                combined = combined[:3800] + "..."
-            return combined
+            # Truncar para segurança mantendo começo
+            return self._truncate(combined, 3800)
         return answer
 
 
@@ -642,7 +936,7 @@ class IntelligentRealEstateBot:
         
         # Chamar LLM
         model = os.getenv("OPENAI_MODEL")
-        response = await asyncio.to_thread(rag.call_gpt, context, model)
+        response = await rag.acall_gpt(context, model)
         
         return response or self._handle_no_results()
 
@@ -652,8 +946,7 @@ class IntelligentRealEstateBot:
         max_properties = self.bot_config.get("max_properties_per_response", 3)
         
         context_parts = [
-            "Você é Sofia, consultora imobiliária da Allega Imóveis em Curitiba.",
-            "Responda de forma natural e conversacional, como se estivesse falando pessoalmente com o cliente.",
+            self.LLM_CONTEXT_HEADER,
             f"Pergunta do cliente: {user_query}",
             "",
             "Imóveis disponíveis que podem interessar:"
@@ -661,20 +954,9 @@ class IntelligentRealEstateBot:
         
         # Adicionar informações dos imóveis de forma mais natural
         for i, hit in enumerate(normalized_hits[:max_properties]):
-            meta = hit.get("meta", {})
-            property_info = self._format_property_info(hit, i + 1)
-            context_parts.append(property_info)
+            context_parts.append(self._format_property_info(hit, i + 1))
         
-        context_parts.extend([
-            "",
-            "Instruções para sua resposta:",
-            "- Seja natural e conversacional, não robotizada",
-            "- Destaque os pontos mais relevantes para o que o cliente pediu",
-            "- Se houver links ou imagens, inclua-os naturalmente na conversa",
-            "- Ofereça ajuda adicional (visita, mais opções, contato direto)",
-            "- Se não encontrar nada adequado, seja honesta e ofereça alternativas",
-            "- Mantenha o tom amigável e profissional da Sofia"
-        ])
+        context_parts.append(self.LLM_CONTEXT_INSTRUCTIONS)
         
         return "\n".join(context_parts)
 
@@ -684,35 +966,23 @@ class IntelligentRealEstateBot:
         meta = hit.get("meta", {})
         text = hit.get("text", "")
         
-        info_parts = [f"Opção {number}:"]
-        info_parts.append(f"Descrição: {text[:300]}")
-        
-        if meta.get("neighborhood") or meta.get("bairro"):
-            neighborhood = meta.get("neighborhood") or meta.get("bairro")
-            info_parts.append(f"Bairro: {neighborhood}")
-        
-        if meta.get("price") or meta.get("valor"):
-            price = meta.get("price") or meta.get("valor")
-            info_parts.append(f"Preço: {price}")
-        
-        if meta.get("url"):
-            info_parts.append(f"Link: {meta.get('url')}")
-        
-        if meta.get("main_image") or meta.get("image"):
-            image = meta.get("main_image") or meta.get("image")
-            info_parts.append(f"Imagem: {image}")
-        
-        return " | ".join(info_parts)
+        neighborhood = meta.get("neighborhood") or meta.get("bairro")
+        price = meta.get("price") or meta.get("valor")
+        url = meta.get("url")
+        image = meta.get("main_image") or meta.get("image")
+
+        return (
+            f"Opção {number}: | Descrição: {text[:300]}"
+            f"{f' | Bairro: {neighborhood}' if neighborhood else ''}"
+            f"{f' | Preço: {price}' if price else ''}"
+            f"{f' | Link: {url}' if url else ''}"
+            f"{f' | Imagem: {image}' if image else ''}"
+        )
 
 
     def _handle_no_results(self) -> str:
         """Resposta quando não encontra imóveis"""
-        return (
-            "Não encontrei imóveis que atendam exatamente ao que você procura no momento. "
-            "Que tal me contar mais detalhes sobre suas preferências? "
-            "Posso buscar opções similares ou te ajudar a refinar a busca. "
-            "Também posso te passar o contato direto da nossa equipe para uma consulta personalizada."
-        )
+        return NO_RESULTS_MESSAGE
 
     def _extract_title_from_text(self, text: str) -> str:
         """Extrai título do texto do imóvel"""
@@ -738,8 +1008,13 @@ class IntelligentRealEstateBot:
         - Tenta pedir ao LLM para devolver JSON {"intent": "...", "confidence": 0.x}
         - Se falhar, usa heurística simples como fallback.
         """
+        cache_key = " ".join((message or "").lower().split())
+        cached = PROPERTY_INTENT_CACHE.get(cache_key)
+        if cached is not None:
+            PROPERTY_INTENT_CACHE.move_to_end(cache_key)
+            return cached
+
         try:
-            model = os.getenv("OPENAI_MODEL")
             prompt = (
                 "Analise se o usuário está PROCURANDO/BUSCANDO um imóvel para alugar ou comprar. "
                 "Retorne JSON: {\"intent\": \"property_search\" ou \"other\", \"confidence\": 0.0-1.0}\n\n"
@@ -750,58 +1025,53 @@ class IntelligentRealEstateBot:
                 "- 'Oi, tudo bem?' → other (0.95)"
             )
             
-            # call_gpt é síncrono; execute em thread
-            resp = await asyncio.to_thread(rag.call_gpt, prompt, model)
+            resp = await rag.acall_gpt(
+                prompt, MODEL_TIERS["instant"], temperature=0.0, max_tokens=INTENT_NLU_MAX_TOKENS
+            )
             if not resp:
                 raise ValueError("NLU returned empty")
 
             # tentar extrair JSON
-            start = resp.find("{")
-            end = resp.rfind("}") + 1
-            json_text = resp[start:end] if start != -1 and end != -1 else resp
-            data = json.loads(json_text)
+            data = self._parse_json_object(resp)
             intent = (data.get("intent") or "other").lower()
             confidence = float(data.get("confidence") or 0.0)
             
             # Log para monitoramento
-            logger.info(f"NLU: '{message[:50]}...' → {intent} ({confidence:.2f})")
+            logger.info("NLU: '%.50s...' → %s (%.2f)", message, intent, confidence)
             
             # threshold configurável via env
             threshold = float(os.getenv("NLU_PROPERTY_CONF_THRESHOLD", "0.6"))
-            return intent == "property_search" and confidence >= threshold
+            is_search = intent == "property_search" and confidence >= threshold
+            PROPERTY_INTENT_CACHE[cache_key] = is_search
+            while len(PROPERTY_INTENT_CACHE) > PROPERTY_INTENT_CACHE_MAX:
+                PROPERTY_INTENT_CACHE.popitem(last=False)
+            return is_search
             
         except Exception as e:
             logger.debug("NLU detect failed (%s) — falling back to keyword heuristic", e)
             
             # fallback: heurística melhorada
-            keywords = [
-                "procuro", "buscar", "apartamento", "casa", "quarto", "quartos", 
-                "aluguel", "venda", "vaga", "área", "bairro", "locação", 
-                "locar", "alugar", "comprar", "imóvel", "propriedade",
-                "preciso", "quero", "gostaria", "interesse"
-            ]
-            text = (message or "").lower()
-            found_keywords = [k for k in keywords if k in text]
+            found_keywords = _match_property_keywords(cache_key)
             
             # Log do fallback também
             if found_keywords:
-                logger.info(f"Fallback: '{message[:50]}...' → property_search (keywords: {found_keywords})")
+                logger.info("Fallback: '%.50s...' → property_search (keywords: %s)", message, found_keywords)
             else:
-                logger.info(f"Fallback: '{message[:50]}...' → other (no keywords)")
+                logger.info("Fallback: '%.50s...' → other (no keywords)", message)
                 
             return len(found_keywords) > 0
 
     async def _call_sofia_vision(self, prompt: str, image_base64: str, model_name: Optional[str] = None) -> str:
-        """Envio de prompt + imagem (base64) para o GPT via call_gpt (executa em thread)."""
+        """Envio de prompt + imagem (base64, como parte image_url) para o modelo de visão."""
         try:
             model = model_name or os.getenv("OPENAI_MODEL")
-            full_prompt = prompt + "\n\n---BEGIN_IMAGE_BASE64---\n" + image_base64 + "\n---END_IMAGE_BASE64---\n\n"
-            full_prompt += "Resuma em até 300 caracteres e destaque campos relevantes."
-            resp = await asyncio.to_thread(rag.call_gpt, full_prompt, model)
-            return resp or "📸 Não consegui analisar a imagem agora."
+            resp = await rag.acall_gpt_vision(
+                prompt + self.VISION_INSTRUCTIONS, image_base64, model, max_tokens=VISION_MAX_TOKENS
+            )
+            return resp or VISION_EMPTY_MESSAGE
         except Exception as e:
             logger.exception(f"Erro visão Sofia (OpenAI): {e}")
-            return "📸 Não foi possível analisar a imagem agora. Tente novamente mais tarde."
+            return VISION_ERROR_MESSAGE
 
     async def _save_attachment(self, owner_phone: str, storage_url: str, content_type: str, size: int, message_id: str = None, meta: dict = None):
         """
@@ -864,16 +1134,19 @@ class IntelligentRealEstateBot:
         try:
             logger.info("Iniciando fluxo de property_search para %s: %s", user_phone, user_query[:120])
             
+            multi_mode = os.getenv("MULTI_CTA_MODE", "1") == "1"
+            max_cta = int(os.getenv("MAX_CTA_PER_RESPONSE", "3"))
+
             # 1) Buscar imóveis e gerar resposta natural (COM CACHE!)
-            answer, structured_properties = await self.process_property_search(user_query, phone_number=user_phone)
+            # No multi-mode a resposta do LLM não é usada: evita a chamada
+            answer, structured_properties = await self.process_property_search(
+                user_query, phone_number=user_phone, generate_answer=not multi_mode
+            )
 
             original_answer = answer or ""
             if not answer or not answer.strip():
                 answer = "Encontrei algumas opções que podem te interessar." if structured_properties else self._handle_no_results()
 
-            multi_mode = os.getenv("MULTI_CTA_MODE", "1") == "1"
-            max_cta = int(os.getenv("MAX_CTA_PER_RESPONSE", "3"))
-
             # Se multi-mode ativo e temos propriedades -> envia fluxo multi e retorna
             if multi_mode and structured_properties:
                 await self._send_multi_cta_sequence(user_query, user_phone, structured_properties[:max_cta])
@@ -882,14 +1155,9 @@ class IntelligentRealEstateBot:
             # 2) Heurística rápida para CTA (antes do custo do LLM adicional)
             quick_cta = False
             uq_lower = (user_query or "").lower()
-            cta_intent_keywords = [
-                "ver detalhes", "link", "manda o link", "me envia o link", "agendar visita",
-                "quero esse", "quero este", "gostei desse", "gostei dessa", "quero ver",
-                "me passa", "me manda", "qual o valor", "valor desse"
-            ]
             force_single = os.getenv("ALWAYS_CTA_IF_SINGLE", "1") == "1"
             if structured_properties:
-                if len(structured_properties) == 1 and (force_single or any(k in uq_lower for k in cta_intent_keywords)):
+                if len(structured_properties) == 1 and (force_single or CTA_INTENT_PATTERN.search(uq_lower)):
                     quick_cta = True
 
             # 3) Decidir CTA via LLM se heurística não decidiu
@@ -960,28 +1228,13 @@ class IntelligentRealEstateBot:
 
             # 4) Persistir mensagem enviada (só se não foi CTA) no Supabase
             if not cta_sent:
-                try:
-                    conversation = await asyncio.to_thread(
-                        supabase_client.get_or_create_conversation,
-                        user_phone
-                    )
-                    await asyncio.to_thread(
-                        supabase_client.save_message,
-                        conversation['id'],
-                        'sent',
-                        answer,
-                        'text',
-                        None,
-                        {
-                            "ai": True, 
-                            "flow": "property_search",
-                            "cta_sent": cta_sent,
-                            "properties_found": len(structured_properties),
-                            "should_send_cta": should_send_cta
-                        }
-                    )
-                except Exception:
-                    logger.exception("Falha ao persistir mensagem de property_search no Firestore.")
+                self._persist_sent_message(user_phone, answer, {
+                    "ai": True,
+                    "flow": "property_search",
+                    "cta_sent": cta_sent,
+                    "properties_found": len(structured_properties),
+                    "should_send_cta": should_send_cta
+                })
                 
         except Exception as e:
             logger.exception("Erro no fluxo property_search: %s", e)
@@ -993,10 +1246,10 @@ class IntelligentRealEstateBot:
             return
         try:
             # Intro humanizada
-            first_name = self._get_first_name(user_phone)
+            first_name = await self._aget_first_name(user_phone)
             intro = self._build_intro_message(user_query, properties, first_name)
             await self.whatsapp_service.send_message(user_phone, intro)
-            await self._persist_property_message(user_phone, intro, meta={
+            self._persist_sent_message(user_phone, intro, meta={
                 "ai": True,
                 "flow": "property_search_intro",
                 "properties_listed": len(properties),
@@ -1015,8 +1268,7 @@ class IntelligentRealEstateBot:
         lower = user_query.lower()
         target = "o que você está buscando"
         if "quarto" in lower:
-            import re
-            m = re.search(r"(\d+)\s*quarto", lower)
+            m = BEDROOMS_QUERY_PATTERN.search(lower)
             if m:
                 target = f"{m.group(1)} quartos"
             else:
@@ -1029,10 +1281,19 @@ class IntelligentRealEstateBot:
             f"{saud} Que bom ter você aqui! Você busca {target}. "
             f"Separei {qtd} opção{'s' if qtd>1 else ''} inicial{'s' if qtd>1 else ''} para você:" )
 
+    async def _aget_first_name(self, user_phone: str) -> Optional[str]:
+        """Versão assíncrona de _get_first_name: cache hit resolve no loop, miss (consultas Supabase) roda em thread."""
+        phone_norm = (user_phone or '').strip()
+        if not phone_norm:
+            return None
+        cached = FIRST_NAME_CACHE.get(hashlib.md5(phone_norm.encode()).hexdigest())
+        if cached and cached[1] > time.time():
+            return cached[0]
+        return await asyncio.to_thread(self._get_first_name, user_phone)
+
     def _get_first_name(self, user_phone: str) -> Optional[str]:
         """Busca primeiro nome com cache em memória (TTL). Cache key = md5(phone).
         Salva tanto hits quanto misses (miss TTL menor)."""
-        import hashlib, time
         try:
             phone_norm = (user_phone or '').strip()
             if not phone_norm:
@@ -1046,10 +1307,10 @@ class IntelligentRealEstateBot:
                 name_val, exp = cached
                 if exp > now:
                     if name_val:
-                        logger.debug(f"FirstNameCache HIT ({phone_hash[:6]}..): {name_val}")
+                        logger.debug("FirstNameCache HIT (%.6s..): %s", phone_hash, name_val)
                         return name_val
                     else:
-                        logger.debug(f"FirstNameCache HIT-NULL ({phone_hash[:6]}..)")
+                        logger.debug("FirstNameCache HIT-NULL (%.6s..)", phone_hash)
                         return None
                 else:
                     # expirado -> remover lazy
@@ -1075,30 +1336,17 @@ class IntelligentRealEstateBot:
             # 3. Heurística em mensagens recentes (só se nada achado)
             if not candidates:
                 try:
-                    import re
                     conversation_row = supabase_client.client.table('conversations').select('id').eq('phone_number', phone_norm).limit(1).execute()
                     if conversation_row.data:
                         conv_id = conversation_row.data[0]['id']
                         msgs = supabase_client.client.table('messages').select('content,direction').eq('conversation_id', conv_id).order('created_at', desc=True).limit(10).execute()
-                        patterns = [
-                            r"meu nome e\s+([A-Za-zÀ-ÖØ-öø-ÿ]{2,25})",
-                            r"meu nome é\s+([A-Za-zÀ-ÖØ-öø-ÿ]{2,25})",
-                            r"sou o\s+([A-Za-zÀ-ÖØ-öø-ÿ]{2,25})",
-                            r"sou a\s+([A-Za-zÀ-ÖØ-öø-ÿ]{2,25})",
-                            r"aqui é o\s+([A-Za-zÀ-ÖØ-öø-ÿ]{2,25})",
-                            r"aqui é a\s+([A-Za-zÀ-ÖØ-öø-ÿ]{2,25})",
-                        ]
                         for msg in msgs.data or []:
                             if msg.get('direction') != 'received':
                                 continue
-                            text_lower = (msg.get('content') or '').lower()
-                            for pat in patterns:
-                                m = re.search(pat, text_lower)
-                                if m:
-                                    candidates.append(m.group(1))
-                                    logger.debug(f"FirstName heuristic extracted '{m.group(1)}'")
-                                    break
-                            if candidates:
+                            m = NAME_INTRO_PATTERN.search((msg.get('content') or '').lower())
+                            if m:
+                                candidates.append(m.group(1))
+                                logger.debug("FirstName heuristic extracted '%s'", m.group(1))
                                 break
                 except Exception as heur_e:
                     logger.debug(f"Heuristic name extraction failed: {heur_e}")
@@ -1123,25 +1371,13 @@ class IntelligentRealEstateBot:
             logger.debug(f"Name resolution failed (cache path) for {user_phone}: {e}")
             return None
 
-    def invalidate_first_name_cache(phone_or_hash: str):
-        """Invalidates cached first name by phone (raw) or direct md5 hash (32 hex)."""
-        import hashlib
-        key = phone_or_hash.strip()
-        if not key:
-            return
-        if len(key) != 32 or any(c not in '0123456789abcdef' for c in key.lower()):
-            key = hashlib.md5(key.encode()).hexdigest()
-        removed = FIRST_NAME_CACHE.pop(key, None)
-        if removed:
-            logger.debug(f"FirstNameCache INVALIDATE ({key[:6]}..)")
-
     async def _send_single_property_cta(self, user_phone: str, prop: dict, index: int, total: int):
         """Envia um CTA (ou fallback texto) para uma propriedade específica."""
         if not prop.get("url") or not prop["url"].startswith("http"):
             # Fallback texto se não tem URL
             body = self._format_property_fallback_text(prop, index)
             await self.whatsapp_service.send_message(user_phone, body)
-            await self._persist_property_message(user_phone, body, meta={
+            self._persist_sent_message(user_phone, body, meta={
                 "ai": True,
                 "flow": "property_search_cta_fallback",
                 "sequence": index,
@@ -1166,7 +1402,7 @@ class IntelligentRealEstateBot:
                     await self.whatsapp_service.send_message(user_phone, body_text + f"\n{prop['url']}")
             else:
                 await self.whatsapp_service.send_message(user_phone, body_text + f"\n{prop['url']}")
-            await self._persist_property_message(user_phone, body_text, meta={
+            self._persist_sent_message(user_phone, body_text, meta={
                 "ai": True,
                 "flow": "property_search_cta",
                 "sequence": index,
@@ -1200,23 +1436,107 @@ class IntelligentRealEstateBot:
     def _format_property_fallback_text(self, prop: dict, index: int) -> str:
         return self._short_property_body(prop) + f"\n(Opção {index})"
 
-    async def _persist_property_message(self, user_phone: str, content: str, meta: dict):
+    def _fire_and_forget(self, coro) -> asyncio.Task:
+        """Agenda corrotina em background mantendo referência até concluir."""
+        task = asyncio.create_task(coro)
+        _BACKGROUND_TASKS.add(task)
+        task.add_done_callback(_BACKGROUND_TASKS.discard)
+        return task
+
+    async def _persist_received_message(self, conversation_id: str, user_phone: str, content: str, meta: dict):
+        """Grava a mensagem recebida ('received') no Supabase; falhas apenas logadas."""
         try:
-            conversation = await asyncio.to_thread(
-                supabase_client.get_or_create_conversation,
-                user_phone
-            )
             await asyncio.to_thread(
                 supabase_client.save_message,
-                conversation['id'],
-                'sent',
+                conversation_id,
+                'received',
                 content,
                 'text',
                 None,
                 meta
             )
+            logger.info("Mensagem salva no Supabase para %s.", user_phone)
         except Exception as e:
-            logger.debug("Falha ao persistir multi CTA message: %s", e)
+            logger.error(f"Falha ao salvar mensagem recebida de {user_phone}: {e}")
+
+    def _persist_sent_message(self, user_phone: str, content: str, meta: dict):
+        """Enfileira mensagem enviada pelo bot ('sent') para gravação em lote no Supabase."""
+        _SENT_MESSAGE_BUFFER.append((user_phone, content, meta, datetime.utcnow().isoformat(), 0))
+        if len(_SENT_MESSAGE_BUFFER) >= SENT_MESSAGE_BATCH_MAX:
+            self._fire_and_forget(self.flush_sent_messages())
+        elif self._sent_flush_task is None or self._sent_flush_task.done():
+            self._sent_flush_task = self._fire_and_forget(self._delayed_flush_sent_messages())
+
+    async def _delayed_flush_sent_messages(self):
+        """Aguarda a janela de agrupamento e grava o que acumulou no buffer."""
+        await asyncio.sleep(SENT_MESSAGE_FLUSH_INTERVAL_MS / 1000)
+        await self.flush_sent_messages()
+
+    async def flush_sent_messages(self):
+        """Grava em um único insert as mensagens enviadas pendentes.
+
+        Falha ao resolver a conversa de um telefone afeta só as mensagens dele; linhas
+        não gravadas voltam ao buffer (até SENT_MESSAGE_MAX_ATTEMPTS tentativas).
+        """
+        if not _SENT_MESSAGE_BUFFER:
+            return
+        pending = _SENT_MESSAGE_BUFFER[:]
+        _SENT_MESSAGE_BUFFER.clear()
+
+        conversation_ids = {}
+        for user_phone in dict.fromkeys(row[0] for row in pending):
+            try:
+                conversation = await asyncio.to_thread(
+                    supabase_client.get_or_create_conversation,
+                    user_phone
+                )
+                conversation_ids[user_phone] = conversation['id']
+            except Exception as e:
+                logger.error(f"Falha ao obter conversa de {user_phone} para gravar mensagens enviadas: {e}")
+
+        ready = [row for row in pending if row[0] in conversation_ids]
+        failed = [row for row in pending if row[0] not in conversation_ids]
+        if ready:
+            try:
+                saved = await asyncio.to_thread(
+                    supabase_client.save_messages_batch,
+                    [
+                        {
+                            'conversation_id': conversation_ids[phone],
+                            'direction': 'sent',
+                            'content': content,
+                            'message_type': 'text',
+                            'metadata': meta,
+                            'created_at': created_at,
+                        }
+                        for phone, content, meta, created_at, _ in ready
+                    ]
+                )
+            except Exception as e:
+                logger.error(f"Erro no insert em lote de mensagens enviadas: {e}")
+                saved = 0
+            if not saved:
+                logger.error("Falha ao persistir %d mensagens enviadas em lote", len(ready))
+                failed.extend(ready)
+
+        if failed:
+            self._requeue_sent_messages(failed)
+
+    def _requeue_sent_messages(self, rows: List[tuple]):
+        """Devolve ao buffer as mensagens não gravadas e agenda nova tentativa."""
+        retry = []
+        for phone, content, meta, created_at, attempts in rows:
+            if attempts + 1 >= SENT_MESSAGE_MAX_ATTEMPTS:
+                logger.error("Descartando mensagem enviada para %s após %d tentativas de gravação", phone, attempts + 1)
+                continue
+            retry.append((phone, content, meta, created_at, attempts + 1))
+        if not retry:
+            return
+        _SENT_MESSAGE_BUFFER[:0] = retry
+        task = self._sent_flush_task
+        # Chamado de dentro do próprio flush agendado: essa tarefa já está terminando
+        if task is None or task.done() or task is asyncio.current_task():
+            self._sent_flush_task = self._fire_and_forget(self._delayed_flush_sent_messages())
 
 
     async def _should_send_cta(self, sofia_response: str, user_query: str, structured_properties: list) -> bool:
@@ -1231,8 +1551,7 @@ class IntelligentRealEstateBot:
                 logger.debug("Não enviando CTA: nenhuma propriedade estruturada encontrada")
                 return False
             
-            # Usar LLM para analisar se a resposta da Sofia indica que deve enviar CTA
-            model = os.getenv("OPENAI_MODEL")
+            # Usar LLM (modelo rápido) para analisar se a resposta da Sofia indica que deve enviar CTA
             prompt = (
                 "Analise se a resposta da Sofia indica que ela ENCONTROU IMÓVEIS ESPECÍFICOS "
                 "e está apresentando opções concretas, ou se ela está PEDINDO MAIS INFORMAÇÕES "
@@ -1246,21 +1565,20 @@ class IntelligentRealEstateBot:
                 "- Se Sofia disse que não encontrou nada → {\"should_send_cta\": false, \"reason\": \"sem resultados\"}"
             )
             
-            resp = await asyncio.to_thread(rag.call_gpt, prompt, model)
+            resp = await rag.acall_gpt(
+                prompt, MODEL_TIERS["instant"], temperature=0.0, max_tokens=CTA_NLU_MAX_TOKENS
+            )
             if not resp:
                 logger.debug("NLU CTA decision: resposta vazia, não enviando CTA")
                 return False
 
             # Extrair JSON da resposta
-            start = resp.find("{")
-            end = resp.rfind("}") + 1
-            json_text = resp[start:end] if start != -1 and end != -1 else resp
-            data = json.loads(json_text)
+            data = self._parse_json_object(resp)
             
             should_send = data.get("should_send_cta", False)
             reason = data.get("reason", "sem razão")
             
-            logger.info(f"NLU CTA decision: should_send={should_send}, reason='{reason}'")
+            logger.info("NLU CTA decision: should_send=%s, reason='%s'", should_send, reason)
             return should_send
             
         except Exception as e:
@@ -1268,15 +1586,8 @@ class IntelligentRealEstateBot:
             
             # Fallback: heurística simples
             # Se a resposta contém palavras que indicam que está pedindo mais info, não envia CTA
-            asking_keywords = [
-                "que tal me contar", "mais detalhes", "suas preferências", 
-                "refinar a busca", "me conte", "gostaria de saber",
-                "qual seu orçamento", "quantos quartos", "qual bairro",
-                "para alugar ou comprar", "mais informações"
-            ]
-            
             response_lower = sofia_response.lower()
-            is_asking_more_info = any(keyword in response_lower for keyword in asking_keywords)
+            is_asking_more_info = ASKING_MORE_INFO_PATTERN.search(response_lower) is not None
             
             if is_asking_more_info:
                 logger.info("Fallback CTA decision: Sofia está pedindo mais informações, não enviando CTA")
@@ -1287,5 +1598,13 @@ class IntelligentRealEstateBot:
             return len(structured_properties) > 0
 
 
-# Instância global do bot
-intelligent_bot = IntelligentRealEstateBot()
\ No newline at end of file
+# Instância compartilhada (criada no primeiro uso, não no import)
+_intelligent_bot: Optional[IntelligentRealEstateBot] = None
+
+
+def get_intelligent_bot() -> IntelligentRealEstateBot:
+    """Retorna o bot compartilhado, criando-o sob demanda na primeira chamada."""
+    global _intelligent_bot
+    if _intelligent_bot is None:
+        _intelligent_bot = IntelligentRealEstateBot()
+    return _intelligent_bot
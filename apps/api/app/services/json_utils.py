@@ -0,0 +1,35 @@
+"""
+Serialização JSON compartilhada
+Usa orjson (C, bytes direto) quando instalado e cai para o json da stdlib
+"""
+import json
+from typing import Any, Union
+
+# Serialização JSON rápida (opcional)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    """Tipos extras no fallback da stdlib (arrays/escalares numpy, como o OPT_SERIALIZE_NUMPY)"""
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    """Serializa para bytes UTF-8 (orjson se disponível; arrays numpy suportados)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, ensure_ascii=False, default=_default).encode("utf-8")
+
+
+def loads(raw: Union[str, bytes, bytearray, memoryview]) -> Any:
+    """Desserializa JSON de str ou bytes (orjson se disponível)."""
+    if orjson is not None:
+        return orjson.loads(raw)
+    if isinstance(raw, memoryview):
+        raw = raw.tobytes()
+    return json.loads(raw)
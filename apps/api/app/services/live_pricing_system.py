@@ -12,10 +12,14 @@ import aiohttp
 import os
 
 from app.services.supabase_client import supabase_client
+from app.services import http_session
 from app.services.rag_pipeline import rag
 
 logger = logging.getLogger(__name__)
 
+# Timeout das consultas em lote (até 1000 imóveis por página); o padrão da sessão (30s) é para chamadas curtas
+PRICING_SYNC_TIMEOUT = int(os.getenv("PRICING_SYNC_TIMEOUT", "300"))  # seconds
+
 class LivePricingSystem:
     """Sistema de sincronização de preços em tempo real"""
     
@@ -164,19 +168,23 @@ class LivePricingSystem:
                 "limit": 1000
             }
             
-            async with aiohttp.ClientSession() as session:
-                url = f"{self.sciensa_config['base_url']}/properties/updated"
+            # Sessão HTTP compartilhada do processo (keep-alive entre sincronizações)
+            session = await http_session.get_session()
+            url = f"{self.sciensa_config['base_url']}/properties/updated"
                 
-                async with session.get(url, headers=headers, params=params) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        properties = data.get("properties", [])
+            async with session.get(
+                url, headers=headers, params=params,
+                timeout=aiohttp.ClientTimeout(total=PRICING_SYNC_TIMEOUT)
+            ) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    properties = data.get("properties", [])
                         
-                        logger.info(f"Sciensa incremental: {len(properties)} imóveis")
-                        return self._normalize_sciensa_properties(properties)
-                    else:
-                        logger.error(f"Erro Sciensa API: {response.status}")
-                        return []
+                    logger.info(f"Sciensa incremental: {len(properties)} imóveis")
+                    return self._normalize_sciensa_properties(properties)
+                else:
+                    logger.error(f"Erro Sciensa API: {response.status}")
+                    return []
             
         except Exception as e:
             logger.error(f"Erro na sincronização Sciensa incremental: {e}")
@@ -195,36 +203,40 @@ class LivePricingSystem:
                 "password": self.sincroniza_config["password"]
             }
             
-            async with aiohttp.ClientSession() as session:
-                # Login
-                login_url = f"{self.sincroniza_config['base_url']}/auth/login"
-                async with session.post(login_url, json=auth_data) as auth_response:
-                    if auth_response.status != 200:
-                        logger.error("Erro na autenticação SincronizaIMOVEIS")
-                        return []
+            # Sessão HTTP compartilhada do processo (keep-alive entre sincronizações)
+            session = await http_session.get_session()
+            # Login
+            login_url = f"{self.sincroniza_config['base_url']}/auth/login"
+            async with session.post(login_url, json=auth_data) as auth_response:
+                if auth_response.status != 200:
+                    logger.error("Erro na autenticação SincronizaIMOVEIS")
+                    return []
                     
-                    auth_result = await auth_response.json()
-                    token = auth_result.get("access_token")
+                auth_result = await auth_response.json()
+                token = auth_result.get("access_token")
                 
-                # Buscar propriedades atualizadas
-                headers = {"Authorization": f"Bearer {token}"}
-                params = {
-                    "updated_since": since_time.isoformat(),
-                    "status": "ativo",
-                    "limit": 1000
-                }
+            # Buscar propriedades atualizadas
+            headers = {"Authorization": f"Bearer {token}"}
+            params = {
+                "updated_since": since_time.isoformat(),
+                "status": "ativo",
+                "limit": 1000
+            }
                 
-                properties_url = f"{self.sincroniza_config['base_url']}/imoveis/updated"
-                async with session.get(properties_url, headers=headers, params=params) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        properties = data.get("imoveis", [])
+            properties_url = f"{self.sincroniza_config['base_url']}/imoveis/updated"
+            async with session.get(
+                properties_url, headers=headers, params=params,
+                timeout=aiohttp.ClientTimeout(total=PRICING_SYNC_TIMEOUT)
+            ) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    properties = data.get("imoveis", [])
                         
-                        logger.info(f"SincronizaIMOVEIS incremental: {len(properties)} imóveis")
-                        return self._normalize_sincroniza_properties(properties)
-                    else:
-                        logger.error(f"Erro SincronizaIMOVEIS API: {response.status}")
-                        return []
+                    logger.info(f"SincronizaIMOVEIS incremental: {len(properties)} imóveis")
+                    return self._normalize_sincroniza_properties(properties)
+                else:
+                    logger.error(f"Erro SincronizaIMOVEIS API: {response.status}")
+                    return []
             
         except Exception as e:
             logger.error(f"Erro na sincronização SincronizaIMOVEIS incremental: {e}")
@@ -352,36 +364,36 @@ class LivePricingSystem:
         
         return mapping.get(tipo_imovel, "apartamento")
     
+    @staticmethod
+    def _as_number(value: Any) -> float:
+        """Converte valor numérico vindo da API (int/float/str/None) sem levantar exceção"""
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return 0.0
+    
     def _calculate_data_quality(self, property_data: Dict) -> float:
         """Calcula score de qualidade dos dados (0-1)"""
         
-        score = 0.0
         max_score = 10.0
-        
-        # Campos obrigatórios
-        if property_data.get("title"):
-            score += 1.5
-        if property_data.get("description") and len(property_data["description"]) > 50:
-            score += 1.5
-        if property_data.get("price", 0) > 0:
-            score += 2.0
-        
-        # Localização
-        if property_data.get("address"):
-            score += 1.0
-        if property_data.get("neighborhood"):
-            score += 1.0
-        
-        # Características
-        if property_data.get("bedrooms", 0) > 0:
-            score += 1.0
-        if property_data.get("area_total", 0) > 0:
-            score += 1.0
-        
-        # Imagens
+        number = self._as_number
         photos = property_data.get("photos", property_data.get("fotos", []))
-        if photos and len(photos) > 0:
-            score += 1.0
+        
+        # Soma ponderada de indicadores booleanos (bool -> 0/1)
+        score = (
+            # Campos obrigatórios
+            1.5 * bool(property_data.get("title"))
+            + 1.5 * (len(property_data.get("description") or "") > 50)
+            + 2.0 * (number(property_data.get("price")) > 0)
+            # Localização
+            + 1.0 * bool(property_data.get("address"))
+            + 1.0 * bool(property_data.get("neighborhood"))
+            # Características
+            + 1.0 * (number(property_data.get("bedrooms")) > 0)
+            + 1.0 * (number(property_data.get("area_total")) > 0)
+            # Imagens
+            + 1.0 * bool(photos)
+        )
         
         return min(score / max_score, 1.0)
     
@@ -10,6 +10,7 @@ import os
 from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
 import re
+import sys
 import aiohttp
 from dotenv import load_dotenv
 
@@ -21,6 +22,86 @@ from app.services.rag_pipeline import rag
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Texto fixo da resposta sem resultados (contatos anexados em seguida)
+NO_RESULTS_RESPONSE = (
+    "😔 *Não encontrei imóveis exatos com esses critérios...*\n\n"
+    "Mas não desista! Posso ajudar de outras formas:\n\n"
+    "🔍 *Sugestões:*\n"
+    "• Experimente critérios mais amplos\n"
+    "• Procure em bairros próximos\n"
+    "• Considere imóveis similares\n\n"
+    "💡 *Ou posso:*\n"
+    "• Cadastrar sua busca personalizada\n"
+    "• Avisar quando chegarem novos imóveis\n"
+    "• Conectar você com nossos especialistas\n\n"
+)
+
+COMPANY_INFO = {
+    'name': 'Allega Imóveis',
+    'creci': '6684 J',
+    'address': 'Rua Gastão Câmara, 135 - Bigorrilho, Curitiba - PR',
+    'phone_sales': '(41) 99214-6670',
+    'phone_rental': '(41) 99223-0874',
+    'phone_fixed': '(41) 3285-1383',
+    'email': 'contato@allegaimoveis.com',
+    'website': 'https://www.allegaimoveis.com',
+    'whatsapp_sales': 'https://wa.me/5541992146670',
+    'whatsapp_rental': 'https://wa.me/5541992230874'
+}
+
+# Bloco de contatos anexado às respostas (texto estático, montado uma vez no import)
+CONTACT_INFO = (
+    f"📞 *Contatos Allega Imóveis:*\n"
+    f"🏠 Vendas: {COMPANY_INFO['phone_sales']}\n"
+    f"🏡 Locação: {COMPANY_INFO['phone_rental']}\n"
+    f"📧 {COMPANY_INFO['email']}\n"
+    f"🌐 {COMPANY_INFO['website']}\n\n"
+    f"_CRECI {COMPANY_INFO['creci']} - Profissionais Certificados_"
+)
+
+# Recomendações padrão da Sofia quando a IA não responde
+FALLBACK_RECOMMENDATIONS = (
+    "💡 *Recomendações da Sofia:*\n\n"
+    "🏠 Para famílias: Casas no Champagnat ou Batel\n"
+    "🏢 Para investimento: Apartamentos no Centro\n"
+    "🌳 Para tranquilidade: Bigorrilho ou Água Verde\n\n"
+    f"{CONTACT_INFO}"
+)
+
+# Tipos de imóvel e suas palavras-chave, em ordem de prioridade; cada tipo vira
+# um único regex (uma varredura por tipo em vez de uma por palavra-chave)
+PROPERTY_TYPE_PATTERNS = tuple(
+    (prop_type, re.compile("|".join(map(re.escape, keywords))))
+    for prop_type, keywords in (
+        ('apartamento', ('apartamento', 'ap', 'apto')),
+        ('casa', ('casa', 'residencia')),
+        ('sobrado', ('sobrado',)),
+        ('terreno', ('terreno', 'lote')),
+        ('cobertura', ('cobertura',)),
+        ('studio', ('studio', 'loft')),
+    )
+)
+# Campos categóricos repetidos em milhares de imóveis: valores internados no carregamento
+# (uma única instância por valor em memória e comparações por identidade nas estatísticas)
+INTERNED_PROPERTY_FIELDS = ('property_type', 'transaction_type', 'city', 'neighborhood', 'state', 'status')
+SALE_PATTERN = re.compile(r'comprar|compra|venda|vender')
+RENT_PATTERN = re.compile(r'alugar|aluguel|locação|locacao')
+
+# Prompts de sistema fixos (montados uma vez; prefixo estável entre chamadas permite cache de prompt)
+ASSISTANT_SYSTEM_PROMPT = (
+    "Você é a Sofia, assistente virtual da Allega Imóveis. "
+    "Forneça dicas úteis, sugestões ou peça mais detalhes para ajudar o usuário a encontrar o imóvel ideal. "
+    "Seja amigável, profissional e objetiva. Máximo 200 caracteres."
+)
+RECOMMENDATIONS_SYSTEM_PROMPT = (
+    "Você é a Sofia da Allega Imóveis. "
+    "Com base nas preferências do usuário, sugira tipos de imóveis e bairros em Curitiba. "
+    "Seja específica e útil. Máximo 300 caracteres."
+)
+# Tetos de saída coerentes com os limites de caracteres pedidos acima (~3-4 caracteres/token)
+ASSISTANT_MAX_TOKENS = 100
+RECOMMENDATIONS_MAX_TOKENS = 150
+
 class PropertyIntelligenceService:
     """Serviço que integra o GPT/OpenAI (RAG) com dados imobiliários"""
 
@@ -30,34 +111,32 @@ class PropertyIntelligenceService:
         self.property_cache = {}
         self.cache_expiry = timedelta(hours=6)
         self.last_cache_update = None
+        # Recarga em andamento: chamadas simultâneas aguardam a mesma (single-flight)
+        self._load_task: Optional[asyncio.Task] = None
 
-        self.company_info = {
-            'name': 'Allega Imóveis',
-            'creci': '6684 J',
-            'address': 'Rua Gastão Câmara, 135 - Bigorrilho, Curitiba - PR',
-            'phone_sales': '(41) 99214-6670',
-            'phone_rental': '(41) 99223-0874',
-            'phone_fixed': '(41) 3285-1383',
-            'email': 'contato@allegaimoveis.com',
-            'website': 'https://www.allegaimoveis.com',
-            'whatsapp_sales': 'https://wa.me/5541992146670',
-            'whatsapp_rental': 'https://wa.me/5541992230874'
-        }
+        self.company_info = COMPANY_INFO
 
     async def load_property_data(self) -> bool:
-        """Carrega dados de imóveis do Supabase ou cache"""
+        """Carrega dados de imóveis do Supabase ou cache.
+        Quando o cache expira, mensagens simultâneas compartilham uma única recarga."""
+        if (self.last_cache_update and
+            datetime.now() - self.last_cache_update < self.cache_expiry and
+            self.property_cache):
+            return True
+        if self._load_task is None or self._load_task.done():
+            self._load_task = asyncio.ensure_future(self._refresh_property_data())
+        return await asyncio.shield(self._load_task)
+
+    async def _refresh_property_data(self) -> bool:
+        """Busca a tabela de imóveis no Supabase e reconstrói o cache"""
         try:
-            if (self.last_cache_update and
-                datetime.now() - self.last_cache_update < self.cache_expiry and
-                self.property_cache):
-                return True
-
             # Buscar imóveis do Supabase
             properties = await asyncio.to_thread(
                 supabase_client.client.table('properties').select('*').execute
             )
 
             if properties.data:
+                self._intern_categorical_fields(properties.data)
                 # Converter para formato esperado
                 self.property_cache = {
                     'properties': properties.data,
@@ -72,10 +151,20 @@ class PropertyIntelligenceService:
                 return True
 
         except Exception as e:
-            logger.error(f"Erro ao carregar dados de imóveis do Supabase: {str(e)}")
+            logger.error(f"Erro ao carregar dados de imóveis do Supabase: {e}")
             self._load_sample_data()
             return False
     
+    @staticmethod
+    def _intern_categorical_fields(properties: List[Dict]) -> None:
+        """Interna (sys.intern) os valores string dos campos categóricos, in-place"""
+        intern = sys.intern
+        for prop in properties:
+            for field in INTERNED_PROPERTY_FIELDS:
+                value = prop.get(field)
+                if type(value) is str:
+                    prop[field] = intern(value)
+    
     def _calculate_statistics(self, properties: List[Dict]) -> Dict[str, Any]:
         """Calcula estatísticas dos imóveis"""
         stats = {
@@ -263,24 +352,14 @@ class PropertyIntelligenceService:
         message_lower = message.lower()
         criteria = {}
 
-        if any(word in message_lower for word in ['comprar', 'compra', 'venda', 'vender']):
+        if SALE_PATTERN.search(message_lower):
             criteria['transaction_type'] = 'venda'
-        elif any(word in message_lower for word in ['alugar', 'aluguel', 'locação', 'locacao']):
+        elif RENT_PATTERN.search(message_lower):
             criteria['transaction_type'] = 'locacao'
 
-        property_types = {
-            'apartamento': ['apartamento', 'ap', 'apto'],
-            'casa': ['casa', 'residencia'],
-            'sobrado': ['sobrado'],
-            'terreno': ['terreno', 'lote'],
-            'cobertura': ['cobertura'],
-            'studio': ['studio', 'loft']
-        }
-
-        for prop_type, keywords in property_types.items():
-            if any(keyword in message_lower for keyword in keywords):
-                criteria['property_type'] = prop_type
-                break
+        prop_type = next((t for t, pattern in PROPERTY_TYPE_PATTERNS if pattern.search(message_lower)), None)
+        if prop_type:
+            criteria['property_type'] = prop_type
 
         bedroom_match = re.search(r'(\d+)\s*(?:quarto|dormitório|dorm)', message_lower)
         if bedroom_match:
@@ -312,66 +391,54 @@ class PropertyIntelligenceService:
         if not properties:
             return self._generate_no_results_response(criteria)
 
-        response = f"🏠 *Encontrei {len(properties)} imóveis que podem interessar você:*\n\n"
+        parts = [f"🏠 *Encontrei {len(properties)} imóveis que podem interessar você:*\n\n"]
 
         for i, prop in enumerate(properties[:3], 1):
-            response += f"*{i}. {prop.get('title', 'Imóvel')}*\n"
-            response += f"📍 {prop.get('neighborhood', '')}, {prop.get('city', '')}\n"
-            response += f"💰 {prop.get('price', 'Consulte')}\n"
-
+            get = prop.get
+            parts.append(f"*{i}. {get('title', 'Imóvel')}*\n")
+            parts.append(f"📍 {get('neighborhood', '')}, {get('city', '')}\n")
+            parts.append(f"💰 {get('price', 'Consulte')}\n")
+
+            bedrooms = get('bedrooms')
+            bathrooms = get('bathrooms')
+            parking_spaces = get('parking_spaces')
+            area_total = get('area_total')
             details = []
-            if prop.get('bedrooms'):
-                details.append(f"{prop['bedrooms']} quartos")
-            if prop.get('bathrooms'):
-                details.append(f"{prop['bathrooms']} banheiros")
-            if prop.get('parking_spaces'):
-                details.append(f"{prop['parking_spaces']} vagas")
-            if prop.get('area_total'):
-                details.append(f"{prop['area_total']}")
+            if bedrooms:
+                details.append(f"{bedrooms} quartos")
+            if bathrooms:
+                details.append(f"{bathrooms} banheiros")
+            if parking_spaces:
+                details.append(f"{parking_spaces} vagas")
+            if area_total:
+                details.append(f"{area_total}")
 
             if details:
-                response += f"🏡 {', '.join(details)}\n"
+                parts.append(f"🏡 {', '.join(details)}\n")
 
-            if prop.get('description'):
-                response += f"📝 {prop['description'][:100]}...\n"
+            description = get('description')
+            if description:
+                parts.append(f"📝 {description[:100]}...\n" if len(description) > 100 else f"📝 {description}\n")
 
-            if prop.get('features'):
-                features = ', '.join(prop['features'][:3])
-                response += f"✨ {features}\n"
+            features = get('features')
+            if features:
+                parts.append(f"✨ {', '.join(features[:3])}\n")
 
-            response += f"🔗 {prop.get('url', 'Ver mais detalhes')}\n\n"
+            parts.append(f"🔗 {get('url', 'Ver mais detalhes')}\n\n")
 
         if len(properties) > 3:
-            response += f"_E mais {len(properties) - 3} imóveis disponíveis..._\n\n"
+            parts.append(f"_E mais {len(properties) - 3} imóveis disponíveis..._\n\n")
 
-        response += self._add_contact_info()
-        return response
+        parts.append(self._add_contact_info())
+        return "".join(parts)
 
     def _generate_no_results_response(self, criteria: Dict[str, Any]) -> str:
         """Gera resposta quando não encontra imóveis"""
-        response = "😔 *Não encontrei imóveis exatos com esses critérios...*\n\n"
-        response += "Mas não desista! Posso ajudar de outras formas:\n\n"
-        response += "🔍 *Sugestões:*\n"
-        response += "• Experimente critérios mais amplos\n"
-        response += "• Procure em bairros próximos\n"
-        response += "• Considere imóveis similares\n\n"
-        response += "💡 *Ou posso:*\n"
-        response += "• Cadastrar sua busca personalizada\n"
-        response += "• Avisar quando chegarem novos imóveis\n"
-        response += "• Conectar você com nossos especialistas\n\n"
-        response += self._add_contact_info()
-        return response
+        return NO_RESULTS_RESPONSE + self._add_contact_info()
 
     def _add_contact_info(self) -> str:
         """Adiciona informações de contato à resposta"""
-        return (
-            f"📞 *Contatos Allega Imóveis:*\n"
-            f"🏠 Vendas: {self.company_info['phone_sales']}\n"
-            f"🏡 Locação: {self.company_info['phone_rental']}\n"
-            f"📧 {self.company_info['email']}\n"
-            f"🌐 {self.company_info['website']}\n\n"
-            f"_CRECI {self.company_info['creci']} - Profissionais Certificados_"
-        )
+        return CONTACT_INFO
 
     async def process_property_inquiry(self, message: str, user_id: str) -> str:
          """Processa consulta sobre imóveis usando o índice inteligente"""
@@ -395,7 +462,7 @@ class PropertyIntelligenceService:
              return response
 
          except Exception as e:
-             logger.error(f"Erro ao processar consulta de imóveis: {str(e)}")
+             logger.error(f"Erro ao processar consulta de imóveis: {e}")
              return (
                  "😅 Ops! Tive um probleminha ao buscar os imóveis.\n\n"
                  "Mas você pode entrar em contato direto:\n\n"
@@ -407,12 +474,6 @@ class PropertyIntelligenceService:
     async def _call_gpt_property_assistant(self, message: str, criteria: Dict[str, Any], properties: List[Dict[str, Any]]) -> Optional[str]:
         """Chama o GPT (via call_gpt) para gerar uma dica ou resumo"""
         try:
-            system_prompt = (
-                "Você é a Sofia, assistente virtual da Allega Imóveis. "
-                "Forneça dicas úteis, sugestões ou peça mais detalhes para ajudar o usuário a encontrar o imóvel ideal. "
-                "Seja amigável, profissional e objetiva. Máximo 200 caracteres."
-            )
-
             user_prompt = (
                 f"Usuário perguntou: \"{message}\"\n"
                 f"Critérios extraídos: {json.dumps(criteria, ensure_ascii=False)}\n"
@@ -421,43 +482,35 @@ class PropertyIntelligenceService:
 
             # inclua uma prévia dos imóveis (título e url)
             props_preview = "\n".join([f"- {p.get('title','')} | {p.get('url','')}" for p in properties])
-            prompt = f"{system_prompt}\n\n{user_prompt}\nImóveis:\n{props_preview}\n\nSofia:"
+            prompt = f"{user_prompt}\nImóveis:\n{props_preview}\n\nSofia:"
 
-            # call_gpt é bloqueante; execute em thread
-            response_text = await asyncio.to_thread(rag.call_gpt, prompt, self.openai_model)
+            response_text = await rag.acall_gpt(
+                prompt, self.openai_model, system_prompt=ASSISTANT_SYSTEM_PROMPT, max_tokens=ASSISTANT_MAX_TOKENS
+            )
             return response_text.strip()[:250] if response_text else None
         except Exception as e:
-            logger.error(f"Erro ao chamar GPT: {str(e)}")
+            logger.error(f"Erro ao chamar GPT: {e}")
             return None
 
     async def get_property_recommendations(self, user_preferences: Dict[str, Any]) -> str:
         """Gera recomendações personalizadas usando o GPT"""
         try:
-            system_prompt = (
-                "Você é a Sofia da Allega Imóveis. "
-                "Com base nas preferências do usuário, sugira tipos de imóveis e bairros em Curitiba. "
-                "Seja específica e útil. Máximo 300 caracteres."
-            )
-            user_prompt = f"Preferências do usuário: {json.dumps(user_preferences, ensure_ascii=False)}"
-            prompt = f"{system_prompt}\n\n{user_prompt}\nSofia:"
+            prompt = f"Preferências do usuário: {json.dumps(user_preferences, ensure_ascii=False)}\nSofia:"
 
-            content = await asyncio.to_thread(rag.call_gpt, prompt, self.openai_model)
+            content = await rag.acall_gpt(
+                prompt, self.openai_model, system_prompt=RECOMMENDATIONS_SYSTEM_PROMPT,
+                max_tokens=RECOMMENDATIONS_MAX_TOKENS
+            )
             if content:
                 return f"💡 *Recomendações da Sofia:*\n{content.strip()}\n\n{self._add_contact_info()}"
             else:
                 return self._get_fallback_recommendations()
         except Exception as e:
-            logger.error(f"Erro ao gerar recomendações: {str(e)}")
+            logger.error(f"Erro ao gerar recomendações: {e}")
             return self._get_fallback_recommendations()
 
     def _get_fallback_recommendations(self) -> str:
         """Recomendações padrão da Sofia"""
-        return (
-            "💡 *Recomendações da Sofia:*\n\n"
-            "🏠 Para famílias: Casas no Champagnat ou Batel\n"
-            "🏢 Para investimento: Apartamentos no Centro\n"
-            "🌳 Para tranquilidade: Bigorrilho ou Água Verde\n\n"
-            f"{self._add_contact_info()}"
-        )
+        return FALLBACK_RECOMMENDATIONS
 
 property_intelligence = PropertyIntelligenceService()
\ No newline at end of file
@@ -9,7 +9,6 @@ import logging
 import json
 import os
 import re
-import tempfile
 import uuid
 from typing import List, Dict, Any, Optional
 from datetime import datetime
@@ -31,11 +30,19 @@ from webdriver_manager.chrome import ChromeDriverManager
 CHROMEDRIVER_PATH = os.getenv("CHROMEDRIVER_PATH", "/usr/bin/chromedriver")
 CHROME_BINARY = os.getenv("CHROME_BINARY", "/usr/bin/chromium")
 
+# Enriquecimento GPT dos imóveis é offline: por padrão vai pela Batch API (fora da cota em tempo real)
+ENRICH_VIA_BATCH = os.getenv("SCRAPER_ENRICH_VIA_BATCH", "true").lower() in ("1", "true", "yes", "on")
+# Lotes de enriquecimento em andamento, persistidos no Redis para sobreviver a restarts
+# ({batch_id: {chave: imóvel resumido}}; a janela da Batch API é de 24h)
+PENDING_BATCHES_KEY = "scraper:enrichment_batches"
+PENDING_BATCHES_TTL = 3 * 24 * 3600  # seconds
+
 
 # internal services
 from app.services.supabase_client import supabase_client
 from app.services.rag_pipeline import rag
-from app.services.intelligent_bot import intelligent_bot
+from app.services.intelligent_bot import get_intelligent_bot
+from app.services import redis_client
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -231,8 +238,9 @@ class AllegaPropertyScraper:
                         features.append(text)
             property_data['features'] = list(dict.fromkeys(features))[:30]
 
-            # enriquecer com GPT
-            property_data = await self.enhance_property_with_gpt(property_data)
+            # enriquecer com GPT (no modo batch, o monitor envia os novos imóveis num lote só)
+            if not ENRICH_VIA_BATCH:
+                property_data = await self.enhance_property_with_gpt(property_data)
 
             logger.info(f"Imóvel extraído: {property_data.get('title','')[:60]} - {property_data.get('reference')}")
             return property_data
@@ -241,11 +249,9 @@ class AllegaPropertyScraper:
             logger.error(f"Erro ao extrair detalhes {property_url}: {e}")
             return None
 
-    async def enhance_property_with_gpt(self, property_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Enriquece dados do imóvel usando o GPT/OpenAI (call_gpt)"""
-        if not property_data.get('description') and not property_data.get('title'):
-            return property_data
-
+    @staticmethod
+    def _build_enrichment_prompt(property_data: Dict[str, Any]) -> str:
+        """Prompt de análise do imóvel (mesmo texto no caminho em tempo real e no batch)"""
         system_prompt = (
             "Você é um especialista em análise de imóveis. Extraia pontos positivos, público-alvo, "
             "potenciais problemas e sugestão de preço/ação comercial. Seja conciso (<=250 caracteres)."
@@ -258,33 +264,93 @@ class AllegaPropertyScraper:
             f"Descrição: {property_data.get('description','')[:1200]}\n"
             f"Features: {', '.join(property_data.get('features',[])[:8])}\n"
         )
-        prompt = f"{system_prompt}\n\n{user_prompt}\n\nSofia:"
+        return f"{system_prompt}\n\n{user_prompt}\n\nSofia:"
+
+    async def _apply_ai_analysis(self, property_data: Dict[str, Any], analysis: str):
+        """Grava a análise no imóvel e salva metadados de embedding"""
+        property_data['ai_analysis'] = analysis.strip()[:250]
+        property_data['ai_enhanced'] = True
+
+        # --- novo: salvar metadados de embedding no Firestore via intelligent_bot ---
+        try:
+            doc_id = property_data.get('reference') or property_data.get('url') or f"prop-{uuid.uuid4().hex[:8]}"
+            vector_id = f"vec-{uuid.uuid4().hex}"
+            embedding_model = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+            meta = {
+                "source": "scraper",
+                "url": property_data.get("url"),
+                "title": property_data.get("title"),
+                "neighborhood": property_data.get("neighborhood")
+            }
+            # intelligent_bot._save_embedding_meta é async — aguardar a gravação
+            await get_intelligent_bot()._save_embedding_meta(doc_id=doc_id, vector_id=vector_id, model=embedding_model, meta=meta)
+        except Exception as e_save:
+            logger.debug(f"Falha ao salvar metadata de embedding: {e_save}")
+
+    async def enhance_property_with_gpt(self, property_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Enriquece dados do imóvel usando o GPT/OpenAI (call_gpt)"""
+        if not property_data.get('description') and not property_data.get('title'):
+            return property_data
 
+        prompt = self._build_enrichment_prompt(property_data)
         try:
             resp = await asyncio.to_thread(rag.call_gpt, prompt, self.openai_model)
             if resp:
-                property_data['ai_analysis'] = resp.strip()[:250]
-                property_data['ai_enhanced'] = True
-
-                # --- novo: salvar metadados de embedding no Firestore via intelligent_bot ---
-                try:
-                    doc_id = property_data.get('reference') or property_data.get('url') or f"prop-{uuid.uuid4().hex[:8]}"
-                    vector_id = f"vec-{uuid.uuid4().hex}"
-                    embedding_model = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
-                    meta = {
-                        "source": "scraper",
-                        "url": property_data.get("url"),
-                        "title": property_data.get("title"),
-                        "neighborhood": property_data.get("neighborhood")
-                    }
-                    # intelligent_bot._save_embedding_meta é async — aguardar a gravação
-                    await intelligent_bot._save_embedding_meta(doc_id=doc_id, vector_id=vector_id, model=embedding_model, meta=meta)
-                except Exception as e_save:
-                    logger.debug(f"Falha ao salvar metadata de embedding: {e_save}")
+                await self._apply_ai_analysis(property_data, resp)
         except Exception as e:
             logger.error(f"Erro ao enriquecer imóvel com GPT: {e}")
         return property_data
 
+    async def submit_enrichment_batch(self, properties: Dict[str, Dict[str, Any]]) -> Optional[str]:
+        """Envia a análise GPT de vários imóveis ({chave: imóvel}) como um lote da Batch API"""
+        prompts = {
+            key: self._build_enrichment_prompt(prop)
+            for key, prop in properties.items()
+            if prop.get('description') or prop.get('title')
+        }
+        if not prompts:
+            return None
+        try:
+            return await asyncio.to_thread(rag.submit_batch, prompts, self.openai_model)
+        except Exception as e:
+            logger.error(f"Erro ao enviar lote de enriquecimento: {e}")
+            return None
+
+    @staticmethod
+    def batch_property_summary(property_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Campos do imóvel guardados com o lote pendente (o suficiente para gravar a análise)"""
+        return {
+            'property_id': supabase_client.derive_property_id(property_data),
+            'reference': property_data.get('reference'),
+            'url': property_data.get('url'),
+            'title': property_data.get('title'),
+            'neighborhood': property_data.get('neighborhood'),
+        }
+
+    async def collect_enrichment_batch(self, batch_id: str, properties: Dict[str, Dict[str, Any]]) -> bool:
+        """Aplica os resultados de um lote, se pronto, gravando a análise de cada imóvel no Supabase.
+
+        properties: {chave: resumo do imóvel (batch_property_summary)}.
+        Retorna True quando o lote foi encerrado (com ou sem resultados).
+        """
+        try:
+            results = await asyncio.to_thread(rag.fetch_batch_results, batch_id)
+        except Exception as e:
+            logger.error(f"Erro ao consultar lote {batch_id}: {e}")
+            return False
+        if results is None:
+            return False
+        for key, analysis in results.items():
+            prop = properties.get(key)
+            if prop is None:
+                continue
+            await self._apply_ai_analysis(prop, analysis)
+            await asyncio.to_thread(
+                supabase_client.update_property_analysis, prop['property_id'], prop['ai_analysis']
+            )
+        logger.info(f"Lote {batch_id}: {len(results)} imóveis enriquecidos")
+        return True
+
     async def generate_market_insights(self, properties: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Gera insights de mercado via GPT usando um resumo dos dados extraídos"""
         if not properties:
@@ -416,13 +482,42 @@ class AllegaPropertyScraper:
         }
         return knowledge_base
 
+async def _load_pending_batches() -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """Lotes de enriquecimento pendentes gravados no Redis ({} se ausente/indisponível)"""
+    raw = await redis_client.get(PENDING_BATCHES_KEY)
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except ValueError:
+        logger.warning("Lotes de enriquecimento pendentes inválidos no Redis; ignorando")
+        return {}
+
+
+async def _save_pending_batches(pending_batches: Dict[str, Dict[str, Dict[str, Any]]]):
+    """Persiste os lotes pendentes (sem Redis, ficam só em memória até o próximo restart)"""
+    await redis_client.set(PENDING_BATCHES_KEY, json.dumps(pending_batches, ensure_ascii=False), ex=PENDING_BATCHES_TTL)
+
+
 # monitor and main functions preserved (use as before)
 async def monitor_scraper(interval_minutes: int = 30, max_properties: int = 100):
     scraper = AllegaPropertyScraper()
     interval = interval_minutes * 60
+    # Lotes de enriquecimento em andamento: { batch_id: {chave: imóvel resumido} }
+    pending_batches = await _load_pending_batches()
+    if pending_batches:
+        logger.info(f"Retomando {len(pending_batches)} lotes de enriquecimento pendentes")
     while True:
         logger.info(f"[{datetime.utcnow()}] Iniciando verificação de imóveis...")
         try:
+            collected = False
+            for batch_id in list(pending_batches):
+                if await scraper.collect_enrichment_batch(batch_id, pending_batches[batch_id]):
+                    del pending_batches[batch_id]
+                    collected = True
+            if collected:
+                await _save_pending_batches(pending_batches)
+
             scraped_properties = await scraper.scrape_all_properties(max_per_type=max_properties // 4)
             # Helper para chave consistente (espelha lógica de _prepare_property_record)
             def _key(p: Dict[str, Any]) -> Optional[str]:
@@ -459,6 +554,13 @@ async def monitor_scraper(interval_minutes: int = 30, max_properties: int = 100)
                 await asyncio.to_thread(supabase_client.upsert_property, prop)
             if new_props:
                 logger.info(f"Adicionados {len(new_props)} imóveis ao Supabase")
+                if ENRICH_VIA_BATCH:
+                    batch_id = await scraper.submit_enrichment_batch({k: scraped_dict[k] for k in new_keys})
+                    if batch_id:
+                        pending_batches[batch_id] = {
+                            k: scraper.batch_property_summary(scraped_dict[k]) for k in new_keys
+                        }
+                        await _save_pending_batches(pending_batches)
 
             # Upsert modificados (idempotente)
             for prop in updated_props:
@@ -522,4 +624,10 @@ async def scrape_allega_properties(max_properties: int = 100) -> Dict[str, Any]:
     }
 
 if __name__ == "__main__":
+    # Execução standalone: mesmo event loop (uvloop) que o uvicorn usa na API, se instalado
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
     asyncio.run(monitor_scraper(interval_minutes=30, max_properties=100))
\ No newline at end of file
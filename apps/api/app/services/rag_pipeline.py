@@ -4,28 +4,43 @@ RAG Pipeline usando APENAS Supabase com pgvector
 """
 
 import os
+import asyncio
 import logging
 import time
-from typing import List, Dict, Optional
+import hashlib
+import json
+import threading
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Deque, List, Dict, Optional, Tuple
 from dataclasses import dataclass
 from datetime import datetime
 import re
+import numpy as np
 from dotenv import load_dotenv
 
 load_dotenv()
 
 from sentence_transformers import SentenceTransformer, CrossEncoder
 import openai
-from tenacity import retry, stop_after_attempt, wait_exponential
+import httpx
+from tenacity import retry, stop_after_attempt, wait_exponential_jitter, retry_if_exception_type
 import tiktoken
 
 # Import Supabase
 from app.services.supabase_client import supabase_client
 from app.services.session_cache import session_cache
 
+# HTTP/2 para a OpenAI (opcional; requer o pacote h2 — sem ele o httpx fica em HTTP/1.1)
+try:
+    import h2  # noqa: F401
+    OPENAI_HTTP2 = True
+except ImportError:
+    OPENAI_HTTP2 = False
+
 # ---------- CONFIG ----------
 # Embedding config
 EMBED_MODEL_NAME = "all-MiniLM-L6-v2"  # 384 dimensões (modelo local)
+RERANK_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
 OPENAI_EMBEDDING_MODEL = "text-embedding-3-small"  # 1536 dimensões (OpenAI)
 OPENAI_EMBED_DIM = 1536
 
@@ -43,10 +58,101 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_CHAT_MODEL = os.getenv("OPENAI_MODEL")
 MAX_RETRIES = 3
 REQUEST_TIMEOUT = 30
+# Pool de conexões reaproveitado por todas as chamadas à OpenAI (sync e async)
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "64"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "32"))
+
+# Cache exato de respostas do chat (mensagens repetidas tipo FAQ não voltam à OpenAI)
+GPT_RESPONSE_CACHE_TTL = int(os.getenv("GPT_RESPONSE_CACHE_TTL", "1800"))  # seconds (0 desativa)
+GPT_RESPONSE_CACHE_MAX = int(os.getenv("GPT_RESPONSE_CACHE_MAX", "2048"))  # entries
+# Erros transitórios da OpenAI que valem nova tentativa (4xx de requisição inválida não)
+TRANSIENT_OPENAI_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+# Teto para o Retry-After informado pela OpenAI (acima disso, melhor falhar e deixar o breaker agir)
+OPENAI_RETRY_AFTER_MAX = float(os.getenv("OPENAI_RETRY_AFTER_MAX", "30"))  # seconds
+# Circuit breaker: após N falhas seguidas, chamadas falham na hora por um tempo
+GPT_BREAKER_FAIL_MAX = int(os.getenv("GPT_BREAKER_FAIL_MAX", "10"))
+GPT_BREAKER_RESET_SECONDS = float(os.getenv("GPT_BREAKER_RESET_SECONDS", "30"))
+# Máximo de chamadas simultâneas ao chat (cada uma ocupa uma thread do executor)
+GPT_MAX_CONCURRENCY = int(os.getenv("GPT_MAX_CONCURRENCY", "8"))
+# Orçamento de tokens por minuto do chat (limite TPM da conta; 0 desativa)
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "0"))
+GPT_MAX_OUTPUT_TOKENS = 512
+# Textos de fallback devolvidos no lugar de uma completion (não devem ir para caches de resposta)
+CHAT_UNAVAILABLE_MESSAGE = "Desculpe, o serviço de chat não está disponível no momento."
+EMPTY_COMPLETION_MESSAGE = "Desculpe, não consegui gerar uma resposta adequada."
+FALLBACK_REPLIES = frozenset({CHAT_UNAVAILABLE_MESSAGE, EMPTY_COMPLETION_MESSAGE})
+# Nível de detalhe da imagem no modelo de visão: "low" (512px, custo fixo ~85 tokens),
+# "high" ou "auto" (tiles de 512px; ~765 tokens para 1024x768)
+VISION_IMAGE_DETAIL = os.getenv("VISION_IMAGE_DETAIL", "auto")
+# Custo aproximado de uma imagem de até 1024px no modelo de visão, para o orçamento TPM
+VISION_IMAGE_TOKENS = 85 if VISION_IMAGE_DETAIL == "low" else 800
+# Batch API: trabalho offline (metade do custo, limite de taxa separado do tempo real)
+OPENAI_BATCH_COMPLETION_WINDOW = "24h"
+OPENAI_BATCH_DONE_STATUSES = frozenset({"completed", "failed", "expired", "cancelled"})
 
 # ---------------------------
 
-@dataclass
+_backoff_with_jitter = wait_exponential_jitter(initial=0.5, max=4)
+
+
+def _wait_openai_retry(retry_state) -> float:
+    """Espera entre tentativas: Retry-After do 429/503 quando presente, senão backoff exponencial com jitter"""
+    response = getattr(retry_state.outcome.exception(), "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(max(float(retry_after), 0.0), OPENAI_RETRY_AFTER_MAX)
+        except ValueError:
+            pass
+    return _backoff_with_jitter(retry_state)
+
+
+# Política única de retry das chamadas à OpenAI (chat, streaming e embeddings):
+# só erros transitórios; 4xx de requisição inválida falham na hora
+_openai_retry = retry(
+    stop=stop_after_attempt(MAX_RETRIES),
+    wait=_wait_openai_retry,
+    retry=retry_if_exception_type(TRANSIENT_OPENAI_ERRORS),
+    reraise=True
+)
+
+
+class TokenBudget:
+    """Janela deslizante de 60 s dos tokens reservados para o chat (limite TPM).
+
+    O semáforo limita chamadas simultâneas; isto limita o volume de tokens,
+    que estoura primeiro com históricos longos e imagens (429 em cascata).
+    """
+    
+    def __init__(self, tokens_per_minute: int):
+        self.tokens_per_minute = tokens_per_minute
+        self._usage: Deque[Tuple[float, int]] = deque()
+        self._used = 0
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self, tokens: int):
+        """Aguarda até a janela comportar `tokens` e os reserva (sem limite se tokens_per_minute <= 0)"""
+        if self.tokens_per_minute <= 0:
+            return
+        tokens = min(tokens, self.tokens_per_minute)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._usage and self._usage[0][0] <= now - 60:
+                    self._used -= self._usage.popleft()[1]
+                if self._used + tokens <= self.tokens_per_minute:
+                    break
+                await asyncio.sleep(self._usage[0][0] + 60 - now)
+            self._usage.append((now, tokens))
+            self._used += tokens
+
+
+@dataclass(slots=True)
 class RetrievalResult:
     id: str
     text: str
@@ -55,6 +161,10 @@ class RetrievalResult:
     rerank_score: Optional[float] = None
 
 
+class _InflightAbandoned(Exception):
+    """Chamada coalescida abandonada porque a tarefa dona foi cancelada"""
+
+
 class RAGPipeline:
     """RAG Pipeline usando Supabase pgvector"""
     
@@ -63,23 +173,65 @@ class RAGPipeline:
 Persona: amigável, prestativa, especialista em mercado imobiliário de Curitiba. 
 Estilo: concisa (3-4 linhas), oferece próximos passos (visita, contato, WhatsApp). 
 Instruções: apresente-se na primeira interação, qualifique leads (orçamento, preferências, prazo), seja empática com objeções de preço e sugira alternativas se necessário."""
+        # Mensagem de sistema no formato da API de chat, montada uma única vez
+        self.system_message = {"role": "system", "content": self.system_prompt}
         
         self.logger = self._setup_logging()
-        self.embed_model = SentenceTransformer(EMBED_MODEL_NAME)
+        # Modelos locais (embeddings de fallback, reranker) e tokenizer carregam no primeiro uso:
+        # o import do módulo não lê pesos do disco nem baixa nada do Hugging Face Hub
+        self._embed_model: Optional[SentenceTransformer] = None
+        self._reranker: Optional[CrossEncoder] = None
+        self._tokenizer = None
+        self._models_lock = threading.Lock()
         self.force_local_embeddings = False
-        self.reranker = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
-        self.tokenizer = tiktoken.encoding_for_model("gpt-4.1-mini")
+        
+        # Cache LRU+TTL de respostas: { blake2b(modelo|temperatura|sistema|prompt): (resposta, expires_epoch) }
+        # call_gpt roda em threads (asyncio.to_thread): acesso protegido por lock
+        self._response_cache: "OrderedDict[str, tuple[str, float]]" = OrderedDict()
+        self._response_cache_lock = threading.Lock()
+        # Chamadas idênticas em andamento compartilham o mesmo resultado: { cache_key: Future }
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._gpt_semaphore = asyncio.Semaphore(GPT_MAX_CONCURRENCY)
+        self._token_budget = TokenBudget(OPENAI_TPM_LIMIT)
+        # Estado do circuit breaker (falhas consecutivas / aberto até epoch)
+        self._breaker_lock = threading.Lock()
+        self._breaker_failures = 0
+        self._breaker_open_until = 0.0
         
         # OpenAI setup
         if OPENAI_API_KEY:
+            # Retries ficam a cargo do tenacity (evita retry do SDK multiplicado pelo nosso)
+            # Transporte explícito: pool maior que o padrão e HTTP/2 (multiplexa chamadas
+            # concorrentes numa mesma conexão TLS) quando o h2 está instalado
+            limits = httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE
+            )
             self.openai_client = openai.OpenAI(
                 api_key=OPENAI_API_KEY,
-                timeout=REQUEST_TIMEOUT
+                timeout=REQUEST_TIMEOUT,
+                max_retries=0,
+                http_client=httpx.Client(http2=OPENAI_HTTP2, limits=limits, follow_redirects=True)
+            )
+            # Cliente assíncrono usado no streaming (astream_gpt)
+            self.async_openai_client = openai.AsyncOpenAI(
+                api_key=OPENAI_API_KEY,
+                timeout=REQUEST_TIMEOUT,
+                max_retries=0,
+                http_client=httpx.AsyncClient(http2=OPENAI_HTTP2, limits=limits, follow_redirects=True)
             )
         else:
             self.openai_client = None
+            self.async_openai_client = None
             self.logger.warning("OpenAI API key not found - using local embeddings only")
     
+    async def aclose(self):
+        """Fecha os pools HTTP dos clientes OpenAI (chamar no shutdown)."""
+        if self.async_openai_client is not None:
+            await self.async_openai_client.close()
+        if self.openai_client is not None:
+            await asyncio.to_thread(self.openai_client.close)
+    
     def _setup_logging(self) -> logging.Logger:
         logging.basicConfig(
             level=logging.INFO,
@@ -99,6 +251,37 @@ Instruções: apresente-se na primeira interação, qualifique leads (orçamento
         text = text.strip()
         return text
     
+    @property
+    def embed_model(self) -> SentenceTransformer:
+        """Modelo local de embeddings (384), carregado sob demanda"""
+        if self._embed_model is None:
+            with self._models_lock:
+                if self._embed_model is None:
+                    self._embed_model = SentenceTransformer(EMBED_MODEL_NAME)
+        return self._embed_model
+    
+    @property
+    def reranker(self) -> CrossEncoder:
+        """Cross-encoder de rerank, carregado sob demanda"""
+        if self._reranker is None:
+            with self._models_lock:
+                if self._reranker is None:
+                    self._reranker = CrossEncoder(RERANK_MODEL_NAME)
+        return self._reranker
+    
+    @property
+    def tokenizer(self):
+        """Tokenizer tiktoken para contagem de contexto, carregado sob demanda"""
+        if self._tokenizer is None:
+            with self._models_lock:
+                if self._tokenizer is None:
+                    self._tokenizer = tiktoken.encoding_for_model("gpt-4.1-mini")
+        return self._tokenizer
+    
+    def _encode_local(self, texts: List[str]) -> np.ndarray:
+        """Embeddings com o modelo local (CPU-bound e carga sob demanda: executar em thread)"""
+        return self.embed_model.encode(texts, convert_to_numpy=True, show_progress_bar=False)
+    
     async def _encode_texts(self, texts: List[str]) -> List[List[float]]:
         """Gera embeddings garantindo dimensão PROPERTY_EMBED_DIM.
 
@@ -117,10 +300,7 @@ Instruções: apresente-se na primeira interação, qualifique leads (orçamento
                 self.logger.error("USE_OPENAI_EMBEDDINGS=1 mas cliente OpenAI não está configurado — verifique OPENAI_API_KEY")
             else:
                 try:
-                    response = self.openai_client.embeddings.create(
-                        input=texts,
-                        model=OPENAI_EMBEDDING_MODEL
-                    )
+                    response = await asyncio.to_thread(self._create_embeddings, texts)
                     vectors = [item.embedding for item in response.data]
                     if vectors and len(vectors[0]) != PROPERTY_EMBED_DIM:
                         raise ValueError(f"Embedding OpenAI retornou dimensão {len(vectors[0])} != {PROPERTY_EMBED_DIM}")
@@ -128,27 +308,23 @@ Instruções: apresente-se na primeira interação, qualifique leads (orçamento
                 except Exception as e:
                     self.logger.warning(f"Falha OpenAI embeddings: {e} — fallback local com padding")
 
-            # Fallback local -> pad para 1536
-            local_vectors = self.embed_model.encode(texts, convert_to_numpy=True, show_progress_bar=False).tolist()
-            if local_vectors and len(local_vectors[0]) != PROPERTY_EMBED_DIM:
-                src_dim = len(local_vectors[0])
-                if src_dim > PROPERTY_EMBED_DIM:
-                    self.logger.error(f"Fallback local produziu dimensão {src_dim} > {PROPERTY_EMBED_DIM} — truncando")
-                    padded = [v[:PROPERTY_EMBED_DIM] for v in local_vectors]
-                else:
-                    # Zero padding
-                    diff = PROPERTY_EMBED_DIM - src_dim
-                    padded = [v + [0.0] * diff for v in local_vectors]
-                return padded
-            return local_vectors
+            # Fallback local -> pad para 1536 (vetorizado no ndarray, conversão para lista uma única vez)
+            local_array = np.asarray(await asyncio.to_thread(self._encode_local, texts), dtype=np.float32)
+            src_dim = local_array.shape[1] if local_array.ndim == 2 else PROPERTY_EMBED_DIM
+            if src_dim > PROPERTY_EMBED_DIM:
+                self.logger.error(f"Fallback local produziu dimensão {src_dim} > {PROPERTY_EMBED_DIM} — truncando")
+                local_array = local_array[:, :PROPERTY_EMBED_DIM]
+            elif src_dim < PROPERTY_EMBED_DIM:
+                # Zero padding
+                local_array = np.pad(local_array, ((0, 0), (0, PROPERTY_EMBED_DIM - src_dim)))
+            return local_array.tolist()
 
         # Caminho somente local (PROPERTY_EMBED_DIM deve ser 384)
-        local_vectors = self.embed_model.encode(texts, convert_to_numpy=True, show_progress_bar=False).tolist()
+        local_vectors = (await asyncio.to_thread(self._encode_local, texts)).tolist()
         if local_vectors and len(local_vectors[0]) != PROPERTY_EMBED_DIM:
             self.logger.warning(
-                "Dimensão local %d diferente de PROPERTY_EMBED_DIM=%d (ajuste esperado se schema mudou)." % (
-                    len(local_vectors[0]), PROPERTY_EMBED_DIM
-                )
+                f"Dimensão local {len(local_vectors[0])} diferente de PROPERTY_EMBED_DIM={PROPERTY_EMBED_DIM} "
+                "(ajuste esperado se schema mudou)."
             )
         return local_vectors
     
@@ -185,21 +361,26 @@ Instruções: apresente-se na primeira interação, qualifique leads (orçamento
             return []
         
         try:
-            # Get shown properties from cache (if phone_hash provided)
-            shown_property_ids = []
-            if phone_hash:
-                shown_property_ids = await session_cache.get_shown_properties(phone_hash)
-                if shown_property_ids:
-                    self.logger.info(f"Cache: {len(shown_property_ids)} properties already shown to {phone_hash[:8]}...")
+            # Imóveis já mostrados (cache de sessão) e embedding da query são independentes: em paralelo
+            async def _shown_properties() -> List[str]:
+                return await session_cache.get_shown_properties(phone_hash) if phone_hash else []
             
-            # Generate query embedding
-            query_embeddings = await self._encode_texts([clean_query])
+            shown_property_ids, query_embeddings = await asyncio.gather(
+                _shown_properties(),
+                self._encode_texts([clean_query])
+            )
+            if shown_property_ids:
+                self.logger.info(f"Cache: {len(shown_property_ids)} properties already shown to {phone_hash[:8]}...")
+            # Set para checagem O(1) (lista do cache pode ter até max_properties itens)
+            shown_set = set(shown_property_ids)
             query_embedding = query_embeddings[0]
             
             # Search using Supabase pgvector
             search_limit = top_k * 3 if shown_property_ids else top_k * 2
             
-            results = supabase_client.vector_search(
+            # Cliente Supabase é síncrono: busca vetorial em thread para não bloquear o event loop
+            results = await asyncio.to_thread(
+                supabase_client.vector_search,
                 query_embedding=query_embedding,
                 limit=search_limit,
                 filters=filters
@@ -208,15 +389,22 @@ Instruções: apresente-se na primeira interação, qualifique leads (orçamento
             # Process results
             retrieval_results = []
             new_property_ids = []
+            seen_property_ids = set()
             
             for result in results:
                 property_id = result.get("property_id")
 
                 # Filtro de sessão (já mostrado)
-                if phone_hash and property_id and property_id in shown_property_ids:
+                if phone_hash and property_id and property_id in shown_set:
                     self.logger.debug(f"Skipping property {property_id} - already shown")
                     continue
 
+                # Mesmo imóvel retornado mais de uma vez (ex.: múltiplos chunks)
+                if property_id:
+                    if property_id in seen_property_ids:
+                        continue
+                    seen_property_ids.add(property_id)
+
                 # Normalização de campos conforme saída atual da função RPC ou fallback lexical
                 # RPC fields: property_id, title, description, url, price, bedrooms_int, similarity
                 # Fallback lexical: property_id, title, description, url, price, bedrooms_int, similarity=None, fallback=True
@@ -249,9 +437,11 @@ Instruções: apresente-se na primeira interação, qualifique leads (orçamento
                 if property_id:
                     new_property_ids.append(property_id)
             
-            # Rerank results
+            # Rerank results (cross-encoder é CPU-bound: em thread para não travar o event loop)
             if len(retrieval_results) > RERANK_TOP_K:
-                reranked_results = self._rerank_results(clean_query, retrieval_results[:top_k])
+                reranked_results = await asyncio.to_thread(
+                    self._rerank_results, clean_query, retrieval_results[:top_k]
+                )
                 final_results = reranked_results[:RERANK_TOP_K]
             else:
                 final_results = retrieval_results[:RERANK_TOP_K]
@@ -299,40 +489,394 @@ CONTEXTO:
 
 PERGUNTA: {question}"""
     
-    @retry(stop=stop_after_attempt(MAX_RETRIES), wait=wait_exponential(multiplier=1, min=4, max=10))
-    def call_gpt(self, prompt: str, model_name: Optional[str] = None, temperature: float = 0.1) -> str:
-        """Call OpenAI with retry logic"""
+    def _response_cache_key(self, model: Optional[str], temperature: float, prompt: str,
+                            system_prompt: Optional[str] = None,
+                            max_tokens: int = GPT_MAX_OUTPUT_TOKENS,
+                            history: Optional[List[Dict[str, str]]] = None) -> str:
+        """Chave do cache de respostas (None = persona padrão da instância)"""
+        digest = hashlib.blake2b(f"{model}|{temperature}|{max_tokens}|{system_prompt}|".encode("utf-8"), digest_size=16)
+        for msg in history or ():
+            digest.update(f"{msg['role']}\x1f{msg['content']}\x1e".encode("utf-8"))
+        digest.update(prompt.encode("utf-8"))
+        return digest.hexdigest()
+    
+    def _get_cached_response(self, key: str) -> Optional[str]:
+        """Resposta em cache ainda válida (None se ausente/expirada)"""
+        if GPT_RESPONSE_CACHE_TTL <= 0:
+            return None
+        with self._response_cache_lock:
+            cached = self._response_cache.get(key)
+            if cached is None:
+                return None
+            content, expires = cached
+            if expires <= time.time():
+                self._response_cache.pop(key, None)
+                return None
+            self._response_cache.move_to_end(key)
+            return content
+    
+    def _store_cached_response(self, key: str, content: str):
+        """Guarda resposta no cache, descartando as menos usadas acima do limite"""
+        if GPT_RESPONSE_CACHE_TTL <= 0:
+            return
+        with self._response_cache_lock:
+            self._response_cache[key] = (content, time.time() + GPT_RESPONSE_CACHE_TTL)
+            self._response_cache.move_to_end(key)
+            while len(self._response_cache) > GPT_RESPONSE_CACHE_MAX:
+                self._response_cache.popitem(last=False)
+    
+    def _estimate_tokens(self, prompt: str, system_prompt: Optional[str], max_tokens: int,
+                         history: Optional[List[Dict[str, str]]] = None) -> int:
+        """Estimativa barata (~4 caracteres/token) da entrada + teto de saída, para o orçamento TPM"""
+        system_chars = len(self.system_prompt if system_prompt is None else system_prompt)
+        history_chars = sum(len(msg["content"]) for msg in history or ())
+        return (system_chars + history_chars + len(prompt)) // 4 + max_tokens
+    
+    def _check_breaker(self):
+        """Falha imediatamente se o circuit breaker estiver aberto"""
+        if self._breaker_open_until and time.time() < self._breaker_open_until:
+            raise RuntimeError("OpenAI indisponível (circuit breaker aberto); tente novamente em instantes.")
+    
+    def _record_gpt_result(self, success: bool):
+        """Atualiza o circuit breaker com o resultado de uma chamada.
+
+        Só falhas transitórias (TRANSIENT_OPENAI_ERRORS) contam: um 400/401 de uma
+        requisição específica não deve bloquear todas as outras.
+        """
+        with self._breaker_lock:
+            if success:
+                self._breaker_failures = 0
+                self._breaker_open_until = 0.0
+                return
+            self._breaker_failures += 1
+            if self._breaker_failures >= GPT_BREAKER_FAIL_MAX:
+                self._breaker_open_until = time.time() + GPT_BREAKER_RESET_SECONDS
+                self.logger.warning(
+                    "OpenAI circuit breaker aberto por %.0fs após %d falhas seguidas",
+                    GPT_BREAKER_RESET_SECONDS, self._breaker_failures
+                )
+    
+    @_openai_retry
+    def _create_embeddings(self, texts: List[str]):
+        """Chamada à API de embeddings (bloqueante; executar em thread)"""
+        return self.openai_client.embeddings.create(input=texts, model=OPENAI_EMBEDDING_MODEL)
+    
+    @_openai_retry
+    def _create_chat_completion(self, model: Optional[str], system_message: Dict, prompt,
+                                temperature: float, max_tokens: int,
+                                history: Optional[List[Dict[str, str]]] = None):
+        """Chamada à API de chat (bloqueante; executar em thread).
+
+        prompt: texto ou lista de partes (texto + image_url) do turno do usuário.
+        history: turnos anteriores ({role, content}) entre o sistema e o turno atual.
+        """
+        return self.openai_client.chat.completions.create(
+            model=model,
+            messages=[
+                system_message,
+                *(history or ()),
+                {"role": "user", "content": prompt}
+            ],
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+    
+    def call_gpt(
+        self,
+        prompt: str,
+        model_name: Optional[str] = None,
+        temperature: float = 0.1,
+        system_prompt: Optional[str] = None,
+        max_tokens: int = GPT_MAX_OUTPUT_TOKENS,
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> str:
+        """Call OpenAI with retry logic and circuit breaker.
+
+        system_prompt substitui a persona padrão; deve ser estável entre chamadas
+        (o prefixo idêntico permite cache de prompt no provedor).
+        max_tokens: teto de saída; respostas curtas por natureza devem pedir menos
+        (latência e orçamento TPM crescem com o teto).
+        history: turnos anteriores como mensagens {role, content}, em ordem cronológica;
+        vão depois do sistema, então o prefixo cresce estável de um turno para o outro.
+        """
         if not self.openai_client:
-            return "Desculpe, o serviço de chat não está disponível no momento."
+            return CHAT_UNAVAILABLE_MESSAGE
         
         model = model_name or OPENAI_CHAT_MODEL
+        system_message = self.system_message if system_prompt is None else {"role": "system", "content": system_prompt}
+        cache_key = self._response_cache_key(model, temperature, prompt, system_prompt, max_tokens, history)
+        cached = self._get_cached_response(cache_key)
+        if cached is not None:
+            self.logger.debug("GPT response cache hit (model: %s)", model)
+            return cached
         
+        self._check_breaker()
         try:
             start_time = time.time()
             
-            response = self.openai_client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=temperature,
-                max_tokens=512
-            )
+            response = self._create_chat_completion(model, system_message, prompt, temperature, max_tokens, history)
             
             elapsed = time.time() - start_time
-            
-            if response.choices and response.choices[0].message.content:
-                content = response.choices[0].message.content.strip()
-                self.logger.info(f"GPT response generated in {elapsed:.2f}s (model: {model})")
-                return content
-            else:
-                self.logger.warning("Empty response from OpenAI")
-                return "Desculpe, não consegui gerar uma resposta adequada."
         
         except Exception as e:
+            if isinstance(e, TRANSIENT_OPENAI_ERRORS):
+                self._record_gpt_result(False)
             self.logger.error(f"OpenAI API error: {e}")
             raise
+        
+        self._record_gpt_result(True)
+        if response.choices and response.choices[0].message.content:
+            content = response.choices[0].message.content.strip()
+            self.logger.info(f"GPT response generated in {elapsed:.2f}s (model: {model})")
+            self._store_cached_response(cache_key, content)
+            return content
+        else:
+            self.logger.warning("Empty response from OpenAI")
+            return EMPTY_COMPLETION_MESSAGE
+    
+    async def acall_gpt(
+        self,
+        prompt: str,
+        model_name: Optional[str] = None,
+        temperature: float = 0.1,
+        system_prompt: Optional[str] = None,
+        max_tokens: int = GPT_MAX_OUTPUT_TOKENS,
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> str:
+        """Versão assíncrona de call_gpt para o caminho por mensagem.
+
+        - Requisições idênticas simultâneas (mesmo modelo/temperatura/sistema/prompt)
+          são coalescidas numa única chamada à OpenAI.
+        - No máximo GPT_MAX_CONCURRENCY chamadas ocupam threads ao mesmo tempo,
+          dentro do orçamento OPENAI_TPM_LIMIT.
+        """
+        key = self._response_cache_key(
+            model_name or OPENAI_CHAT_MODEL, temperature, prompt, system_prompt, max_tokens, history
+        )
+        cached = self._get_cached_response(key)
+        if cached is not None:
+            return cached
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            try:
+                return await asyncio.shield(inflight)
+            except _InflightAbandoned:
+                # O dono da chamada foi cancelado (não este chamador): refaz por conta própria
+                return await self.acall_gpt(prompt, model_name, temperature, system_prompt, max_tokens, history)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            await self._token_budget.acquire(self._estimate_tokens(prompt, system_prompt, max_tokens, history))
+            async with self._gpt_semaphore:
+                result = await asyncio.to_thread(
+                    self.call_gpt, prompt, model_name, temperature, system_prompt, max_tokens, history
+                )
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            # Não propaga o cancelamento do dono aos seguidores (CancelledError escaparia
+            # dos fallbacks "except Exception" de requisições não relacionadas)
+            future.set_exception(_InflightAbandoned())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Evita "exception was never retrieved" quando ninguém mais aguardava
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+    
+    def call_gpt_vision(
+        self,
+        prompt: str,
+        image_base64: str,
+        model_name: Optional[str] = None,
+        max_tokens: int = GPT_MAX_OUTPUT_TOKENS,
+        mime_type: str = "image/jpeg"
+    ) -> str:
+        """Chat com imagem: a imagem vai como parte image_url (data URL), não como texto no prompt.
+
+        Bloqueante (executar em thread). Sem cache de respostas: quem chama já cacheia por hash da imagem.
+        """
+        if not self.openai_client:
+            return CHAT_UNAVAILABLE_MESSAGE
+        
+        model = model_name or OPENAI_CHAT_MODEL
+        content = [
+            {"type": "text", "text": prompt},
+            {
+                "type": "image_url",
+                "image_url": {"url": f"data:{mime_type};base64,{image_base64}", "detail": VISION_IMAGE_DETAIL}
+            }
+        ]
+        self._check_breaker()
+        try:
+            start_time = time.time()
+            response = self._create_chat_completion(model, self.system_message, content, 0.1, max_tokens)
+            elapsed = time.time() - start_time
+        except Exception as e:
+            if isinstance(e, TRANSIENT_OPENAI_ERRORS):
+                self._record_gpt_result(False)
+            self.logger.error(f"OpenAI vision error: {e}")
+            raise
+        
+        self._record_gpt_result(True)
+        if response.choices and response.choices[0].message.content:
+            self.logger.info(f"GPT vision response generated in {elapsed:.2f}s (model: {model})")
+            return response.choices[0].message.content.strip()
+        self.logger.warning("Empty vision response from OpenAI")
+        return ""
+    
+    async def acall_gpt_vision(
+        self,
+        prompt: str,
+        image_base64: str,
+        model_name: Optional[str] = None,
+        max_tokens: int = GPT_MAX_OUTPUT_TOKENS,
+        mime_type: str = "image/jpeg"
+    ) -> str:
+        """Versão assíncrona de call_gpt_vision (mesmo semáforo e orçamento TPM do chat)"""
+        await self._token_budget.acquire(len(prompt) // 4 + VISION_IMAGE_TOKENS + max_tokens)
+        async with self._gpt_semaphore:
+            return await asyncio.to_thread(
+                self.call_gpt_vision, prompt, image_base64, model_name, max_tokens, mime_type
+            )
+    
+    @_openai_retry
+    async def _create_chat_stream(self, model: Optional[str], system_message: Dict, prompt: str,
+                                  temperature: float, max_tokens: int,
+                                  history: Optional[List[Dict[str, str]]] = None):
+        """Abre o stream do chat (retry só na abertura; fragmentos já entregues não são repetidos)"""
+        return await self.async_openai_client.chat.completions.create(
+            model=model,
+            messages=[
+                system_message,
+                *(history or ()),
+                {"role": "user", "content": prompt}
+            ],
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True
+        )
+    
+    async def astream_gpt(
+        self,
+        prompt: str,
+        model_name: Optional[str] = None,
+        temperature: float = 0.1,
+        system_prompt: Optional[str] = None,
+        max_tokens: int = GPT_MAX_OUTPUT_TOKENS,
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> AsyncIterator[str]:
+        """Gera a resposta do chat em fragmentos (stream=True), à medida que chegam.
+
+        Cache hit é entregue num único fragmento; a resposta completa é gravada no cache ao final.
+        """
+        model = model_name or OPENAI_CHAT_MODEL
+        cache_key = self._response_cache_key(model, temperature, prompt, system_prompt, max_tokens, history)
+        cached = self._get_cached_response(cache_key)
+        if cached is not None:
+            yield cached
+            return
+        if not self.async_openai_client:
+            yield CHAT_UNAVAILABLE_MESSAGE
+            return
+        
+        self._check_breaker()
+        system_message = self.system_message if system_prompt is None else {"role": "system", "content": system_prompt}
+        parts: List[str] = []
+        await self._token_budget.acquire(self._estimate_tokens(prompt, system_prompt, max_tokens, history))
+        start_time = time.time()
+        async with self._gpt_semaphore:
+            try:
+                stream = await self._create_chat_stream(
+                    model, system_message, prompt, temperature, max_tokens, history
+                )
+            except TRANSIENT_OPENAI_ERRORS:
+                self._record_gpt_result(False)
+                raise
+            self._record_gpt_result(True)
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    piece = chunk.choices[0].delta.content
+                    parts.append(piece)
+                    yield piece
+        
+        content = "".join(parts).strip()
+        self.logger.info(f"GPT stream finished in {time.time() - start_time:.2f}s (model: {model})")
+        if content:
+            self._store_cached_response(cache_key, content)
+    
+    def submit_batch(
+        self,
+        prompts: Dict[str, str],
+        model_name: Optional[str] = None,
+        temperature: float = 0.1,
+        system_prompt: Optional[str] = None
+    ) -> Optional[str]:
+        """Envia prompts não urgentes para a Batch API da OpenAI ({custom_id: prompt}).
+
+        Bloqueante (upload + criação do lote): chamar via asyncio.to_thread.
+        Retorna o id do lote, ou None se não houver cliente/prompts.
+        """
+        if not self.openai_client or not prompts:
+            return None
+        model = model_name or OPENAI_CHAT_MODEL
+        system_message = self.system_message if system_prompt is None else {"role": "system", "content": system_prompt}
+        lines = [
+            json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": model,
+                    "messages": [system_message, {"role": "user", "content": prompt}],
+                    "temperature": temperature,
+                    "max_tokens": GPT_MAX_OUTPUT_TOKENS
+                }
+            }, ensure_ascii=False)
+            for custom_id, prompt in prompts.items()
+        ]
+        payload = "\n".join(lines).encode("utf-8")
+        input_file = self.openai_client.files.create(file=("batch.jsonl", payload), purpose="batch")
+        batch = self.openai_client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=OPENAI_BATCH_COMPLETION_WINDOW
+        )
+        self.logger.info("Batch %s enviado com %d prompts (model: %s)", batch.id, len(prompts), model)
+        return batch.id
+    
+    def fetch_batch_results(self, batch_id: str) -> Optional[Dict[str, str]]:
+        """Resultados de um lote da Batch API ({custom_id: resposta}).
+
+        Bloqueante: chamar via asyncio.to_thread. Retorna None enquanto o lote
+        estiver em andamento; lote encerrado sem saída (falha/expirado) retorna {}.
+        """
+        if not self.openai_client:
+            return {}
+        batch = self.openai_client.batches.retrieve(batch_id)
+        if batch.status not in OPENAI_BATCH_DONE_STATUSES:
+            return None
+        if not batch.output_file_id:
+            self.logger.warning("Batch %s encerrado sem resultados (status: %s)", batch_id, batch.status)
+            return {}
+        
+        results: Dict[str, str] = {}
+        for line in self.openai_client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+                content = item["response"]["body"]["choices"][0]["message"]["content"]
+            except (ValueError, KeyError, IndexError, TypeError):
+                continue
+            if content:
+                results[item["custom_id"]] = content.strip()
+        self.logger.info("Batch %s concluído: %d respostas", batch_id, len(results))
+        return results
     
     async def query(
         self, 
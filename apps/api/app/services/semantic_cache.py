@@ -0,0 +1,125 @@
+"""
+Cache Semântico de Respostas - Reaproveita respostas de perguntas parecidas
+Turnos de conversa geral sem contexto ("bom dia", "qual o horário de vocês?")
+são servidos em milissegundos, sem nova chamada ao LLM
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+logger = logging.getLogger(__name__)
+
+# Modelo multilíngue (treinado com paráfrases em português): o all-MiniLM-L6-v2 do
+# embedding_cache é só inglês e aproxima demais perguntas curtas diferentes em PT
+SEMANTIC_CACHE_MODEL = os.getenv(
+    "SEMANTIC_CACHE_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+)
+# Similaridade de cosseno mínima para reaproveitar uma resposta (conservadora: um falso
+# positivo entrega a resposta de outra pergunta)
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+# Entradas por namespace (modelo); ao encher, as mais antigas são sobrescritas
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "10000"))
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", "86400"))  # seconds
+
+
+class _SemanticSlots:
+    """Buffer circular de embeddings normalizados + respostas de um namespace"""
+
+    def __init__(self, dim: int, capacity: int):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.expires = np.zeros(capacity, dtype=np.float64)
+        self.responses: List[str] = [""] * capacity
+        self.count = 0
+        self.next = 0
+
+
+class SemanticResponseCache:
+    """Cache de respostas por similaridade de embeddings.
+
+    Os embeddings chegam normalizados (cosseno = produto interno), então a busca é um
+    único produto matriz-vetor sobre o buffer — o mesmo que um IndexFlatIP, mas com
+    sobrescrita em anel das entradas antigas (FAISS flat não remove vetores).
+    Em memória, por processo.
+    """
+
+    def __init__(self,
+                 threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+                 ttl_seconds: int = SEMANTIC_CACHE_TTL,
+                 model_name: str = SEMANTIC_CACHE_MODEL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.model_name = model_name
+        self._namespaces: Dict[str, _SemanticSlots] = {}
+        self.stats = {"hits": 0, "misses": 0, "stores": 0}
+        # Modelo carregado no primeiro uso (em thread, via embed)
+        self._model: Optional[SentenceTransformer] = None
+        self._model_lock = threading.Lock()
+
+    def _encode(self, text: str) -> np.ndarray:
+        """Embedding normalizado do texto (CPU-bound: executar em thread)"""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = SentenceTransformer(self.model_name)
+        return np.asarray(self._model.encode(text, normalize_embeddings=True), dtype=np.float32)
+
+    async def embed(self, text: str) -> np.ndarray:
+        """Embedding da pergunta sem travar o event loop"""
+        return await asyncio.to_thread(self._encode, text)
+
+    def lookup(self, namespace: str, embedding: np.ndarray) -> Optional[str]:
+        """Resposta da pergunta mais parecida, se acima do limiar e ainda válida"""
+        slots = self._namespaces.get(namespace)
+        if slots is None or slots.count == 0 or embedding.shape[0] != slots.vectors.shape[1]:
+            self.stats["misses"] += 1
+            return None
+
+        scores = slots.vectors[:slots.count] @ embedding
+        best = int(np.argmax(scores))
+        if scores[best] >= self.threshold and slots.expires[best] > time.time():
+            self.stats["hits"] += 1
+            logger.debug("Semantic cache HIT (%s): score=%.3f", namespace, scores[best])
+            return slots.responses[best]
+
+        self.stats["misses"] += 1
+        return None
+
+    def store(self, namespace: str, embedding: np.ndarray, response: str):
+        """Grava a resposta associada ao embedding da pergunta"""
+        slots = self._namespaces.get(namespace)
+        if slots is None:
+            slots = self._namespaces[namespace] = _SemanticSlots(embedding.shape[0], self.max_entries)
+        elif embedding.shape[0] != slots.vectors.shape[1]:
+            return
+
+        pos = slots.next
+        slots.vectors[pos] = embedding
+        slots.expires[pos] = time.time() + self.ttl_seconds
+        slots.responses[pos] = response
+        slots.next = (pos + 1) % self.max_entries
+        slots.count = min(slots.count + 1, self.max_entries)
+        self.stats["stores"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estatísticas do cache"""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            "entries": sum(slots.count for slots in self._namespaces.values()),
+            "threshold": self.threshold,
+            "model": self.model_name,
+            "ttl_seconds": self.ttl_seconds
+        }
+
+
+# Instância global do cache
+semantic_response_cache = SemanticResponseCache()
@@ -7,9 +7,10 @@ TTL: 24h
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import os
-import json
 import logging
 
+from app.services import json_utils
+
 logger = logging.getLogger(__name__)
 
 
@@ -39,14 +40,14 @@ class SessionCache:
                     existing_list: List[str] = []
                     if existing_raw:
                         try:
-                            existing_list = json.loads(existing_raw)
+                            existing_list = json_utils.loads(existing_raw)
                         except Exception:
                             existing_list = []
                     existing_set = set(existing_list)
-                    new_props = [pid for pid in property_ids if pid not in existing_set]
+                    new_props = self._unseen(property_ids, existing_set)
                     if new_props:
                         combined = (existing_list + new_props)[-self.max_properties:]
-                        pipe.set(key, json.dumps(combined), ex=int(self.ttl.total_seconds()))
+                        pipe.set(key, json_utils.dumps(combined), ex=int(self.ttl.total_seconds()))
                         await pipe.execute()
                         logger.debug(f"[RedisSessionCache] updated {phone_hash}: +{len(new_props)} now={len(combined)}")
                         return
@@ -58,13 +59,23 @@ class SessionCache:
         if phone_hash not in self._cache:
             self._cache[phone_hash] = {"properties": [], "updated_at": now}
         existing = set(self._cache[phone_hash]["properties"])
-        new_props = [pid for pid in property_ids if pid not in existing]
+        new_props = self._unseen(property_ids, existing)
         self._cache[phone_hash]["properties"].extend(new_props)
         self._cache[phone_hash]["updated_at"] = now
         if len(self._cache[phone_hash]["properties"]) > self.max_properties:
             self._cache[phone_hash]["properties"] = self._cache[phone_hash]["properties"][-self.max_properties:]
         logger.debug(f"[MemSessionCache] updated for {phone_hash}: {len(self._cache[phone_hash]['properties'])} properties")
     
+    @staticmethod
+    def _unseen(property_ids: List[str], seen: set) -> List[str]:
+        """Filtra ids já vistos, deduplicando também dentro do próprio lote (mantém ordem)."""
+        new_props: List[str] = []
+        for pid in property_ids:
+            if pid not in seen:
+                seen.add(pid)
+                new_props.append(pid)
+        return new_props
+    
     async def get_shown_properties(self, phone_hash: str) -> List[str]:
         """Retorna propriedades já mostradas (dentro do TTL)"""
         use_redis = os.getenv("USE_REDIS_SESSION_CACHE", "1") == "1"
@@ -78,7 +89,7 @@ class SessionCache:
                     if not raw:
                         return []
                     try:
-                        data = json.loads(raw)
+                        data = json_utils.loads(raw)
                         if isinstance(data, list):
                             return data
                     except Exception:
@@ -5,10 +5,12 @@ Suporta busca híbrida (vector + full-text), cache, e idempotency
 
 import os
 import logging
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime, timedelta, timezone
 import hashlib
 import re
+import time
+import threading
 from uuid import uuid4
 from dotenv import load_dotenv
 from supabase import create_client, Client
@@ -21,6 +23,24 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Relógio em cache com precisão de segundo: (epoch_inteiro, isoformat UTC). Tupla imutável
+# trocada numa única atribuição, para threads concorrentes nunca lerem par misturado
+_utc_clock: Tuple[int, str] = (0, "")
+
+def _utc_now_iso() -> str:
+    """Timestamp UTC ISO com precisão de segundo, recalculado no máximo 1x por segundo.
+
+    Uso restrito a colunas de auditoria (last_message_at/updated_at); não serve para
+    ordenar mensagens enviadas dentro do mesmo segundo.
+    """
+    global _utc_clock
+    now = int(time.time())
+    clock = _utc_clock
+    if now != clock[0]:
+        clock = (now, datetime.utcfromtimestamp(now).isoformat())
+        _utc_clock = clock
+    return clock[1]
+
 class SupabaseClient:
     """Cliente Supabase com features avançadas (lazy init).
 
@@ -32,7 +52,9 @@ class SupabaseClient:
         self.supabase_url = os.getenv("SUPABASE_URL")
         self.supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
         self.client: Optional[Client] = None
-        self.embedding_model: Optional[SentenceTransformer] = None
+        # Modelo local (fallback de embeddings) carregado só quando a OpenAI falhar
+        self._embedding_model: Optional[SentenceTransformer] = None
+        self._embedding_model_lock = threading.Lock()
         self.available = False
         # Embeddings sempre 1536 (schema vector(1536)); OpenAI preferencial com fallback local padded
         self.use_openai_embeddings = True  # sempre tentar OpenAI primeiro
@@ -56,8 +78,6 @@ class SupabaseClient:
             return
         try:
             self.client = create_client(self.supabase_url, self.supabase_key)
-            # Carregar modelo local sempre (serve como fallback / modo offline)
-            self.embedding_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')  # 384 dims
             if self.openai_api_key:
                 try:
                     self.openai_client = openai.OpenAI(api_key=self.openai_api_key, timeout=30)
@@ -72,6 +92,15 @@ class SupabaseClient:
         except Exception as e:
             logger.error(f"❌ Falha ao inicializar Supabase: {e}")
 
+    @property
+    def embedding_model(self) -> SentenceTransformer:
+        """Modelo local all-MiniLM-L6-v2 (384 dims), carregado no primeiro fallback."""
+        if self._embedding_model is None:
+            with self._embedding_model_lock:
+                if self._embedding_model is None:
+                    self._embedding_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+        return self._embedding_model
+
     def ensure_client(self) -> Optional[Client]:
         """Garante que o client esteja inicializado, tentando lazy init."""
         if not self.available:
@@ -262,19 +291,20 @@ class SupabaseClient:
                 
                 # Atualizar last_message_at
                 self.client.table('conversations')\
-                    .update({'last_message_at': datetime.utcnow().isoformat()})\
+                    .update({'last_message_at': _utc_now_iso()})\
                     .eq('id', conversation['id'])\
                     .execute()
                 
                 return conversation
             
             # Criar nova
+            now_iso = _utc_now_iso()
             new_conversation = {
                 'phone_number': phone_number,
                 'state': 'pending',
                 'urgency_score': 1,
-                'last_message_at': datetime.utcnow().isoformat(),
-                'created_at': datetime.utcnow().isoformat()
+                'last_message_at': now_iso,
+                'created_at': now_iso
             }
             
             result = self.client.table('conversations')\
@@ -305,18 +335,19 @@ class SupabaseClient:
                 conv = result.data[0]
                 if conv.get('user_name') != user_name:
                     self.client.table('conversations')\
-                        .update({'user_name': user_name, 'updated_at': datetime.utcnow().isoformat()})\
+                        .update({'user_name': user_name, 'updated_at': _utc_now_iso()})\
                         .eq('id', conv['id'])\
                         .execute()
                 return True
             # criar\atualizar
+            now_iso = _utc_now_iso()
             new_conv = {
                 'phone_number': phone_number,
                 'user_name': user_name,
                 'state': 'pending',
                 'urgency_score': 1,
-                'last_message_at': datetime.utcnow().isoformat(),
-                'created_at': datetime.utcnow().isoformat()
+                'last_message_at': now_iso,
+                'created_at': now_iso
             }
             self.client.table('conversations').insert(new_conv).execute()
             return True
@@ -371,7 +402,7 @@ class SupabaseClient:
         try:
             updates = {
                 'state': new_state,
-                'updated_at': datetime.utcnow().isoformat()
+                'updated_at': _utc_now_iso()
             }
             
             if urgency_score is not None:
@@ -517,15 +548,54 @@ class SupabaseClient:
             logger.error(f"❌ Erro ao salvar mensagem: {e}")
             return None
     
+    def save_messages_batch(self, messages: List[Dict[str, Any]]) -> int:
+        """Salva várias mensagens em um único insert (mesmos campos de save_message;
+        `created_at` opcional por mensagem para preservar a ordem de envio).
+
+        Returns:
+            Quantidade de mensagens gravadas (0 em caso de erro)
+        """
+        if not messages:
+            return 0
+        try:
+            created_at = datetime.utcnow().isoformat()
+            rows = [
+                {
+                    'conversation_id': msg['conversation_id'],
+                    'direction': msg['direction'],
+                    'content': msg['content'],
+                    'message_type': msg.get('message_type', 'text'),
+                    'whatsapp_message_id': msg.get('whatsapp_message_id'),
+                    'status': 'sent',
+                    'metadata': msg.get('metadata') or {},
+                    'created_at': msg.get('created_at') or created_at
+                }
+                for msg in messages
+            ]
+            
+            result = self.client.table('messages')\
+                .insert(rows)\
+                .execute()
+            
+            return len(result.data or [])
+            
+        except Exception as e:
+            logger.error(f"❌ Erro ao salvar lote de mensagens: {e}")
+            return 0
+    
     def get_conversation_messages(
         self, 
         conversation_id: str, 
-        limit: int = 50
+        limit: int = 50,
+        columns: str = '*'
     ) -> List[Dict[str, Any]]:
-        """Busca histórico de mensagens"""
+        """Busca histórico de mensagens (mais recentes primeiro).
+
+        columns restringe as colunas retornadas (ex.: 'direction,content,created_at').
+        """
         try:
             result = self.client.table('messages')\
-                .select('*')\
+                .select(columns)\
                 .eq('conversation_id', conversation_id)\
                 .order('created_at', desc=True)\
                 .limit(limit)\
@@ -784,46 +854,76 @@ class SupabaseClient:
         return filtered
 
     def _lexical_property_fallback(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """Fallback simples usando ILIKE em title / description / ai_analysis.
+        """Fallback lexical: full-text no servidor (RPC lexical_property_search, índice GIN);
+        se a função não existir, ILIKE em title / description.
         Retorna formato aproximado ao da função vetorial.
         """
+        q = (query or '').strip()
+        if not q:
+            return []
         try:
-            # Sanitizar query para evitar % consecutivos
-            q = (query or '').strip()
-            if not q:
+            result = self.client.rpc(
+                'lexical_property_search',
+                {'query_text': q[:200], 'max_results': limit}
+            ).execute()
+            rows = [r.get('property') or {} for r in (result.data or [])]
+        except Exception as e:
+            logger.debug(f"lexical_property_search indisponível ({e}); usando ILIKE")
+            try:
+                # Sanitizar query para evitar % consecutivos
+                pattern = f"%{q[:60]}%"  # limitar tamanho
+                result = self.client.table('properties') \
+                    .select('property_id, title, description, url, price, bedrooms') \
+                    .or_(f"title.ilike.{pattern},description.ilike.{pattern}") \
+                    .limit(limit) \
+                    .execute()
+                rows = result.data or []
+            except Exception as fe:
+                logger.debug(f"Falha fallback lexical: {fe}")
                 return []
-            pattern = f"%{q[:60]}%"  # limitar tamanho
 
-            # Preferir ai_analysis se existir
-            result = self.client.table('properties') \
-                .select('property_id, title, description, ai_analysis, url, price, bedrooms') \
-                .or_(
-                    f"title.ilike.{pattern},description.ilike.{pattern},ai_analysis.ilike.{pattern}"
-                ) \
-                .limit(limit) \
-                .execute()
-
-            rows = result.data or []
-            normalized = []
-            for r in rows:
-                normalized.append({
-                    'property_id': r.get('property_id'),
-                    'title': r.get('title'),
-                    'description': r.get('ai_analysis') or r.get('description'),
-                    'url': r.get('url'),
-                    'price': r.get('price'),
-                    'bedrooms_int': r.get('bedrooms'),
-                    'similarity': None,  # sem score semântico
-                    'fallback': True
-                })
-            return normalized
-        except Exception as e:
-            logger.debug(f"Falha fallback lexical: {e}")
-            return []
+        return [
+            {
+                'property_id': r.get('property_id'),
+                'title': r.get('title'),
+                'description': r.get('description'),
+                'url': r.get('url'),
+                'price': r.get('price'),
+                'bedrooms_int': r.get('bedrooms'),
+                'similarity': None,  # sem score semântico
+                'fallback': True
+            }
+            for r in rows
+        ]
 
     # ================================================================
     # INTERNAL - NORMALIZATION FOR SCRAPED PROPERTIES
     # ================================================================
+    @staticmethod
+    def derive_property_id(raw: Dict[str, Any]) -> str:
+        """property_id do imóvel cru do scraper (preferência: reference -> property_id -> slug da URL -> uuid)"""
+        reference = raw.get('reference') or raw.get('property_id')
+        if reference:
+            return reference
+        url = raw.get('url') or ''
+        if url:
+            # gerar slug curta baseada na URL
+            slug_part = re.sub(r'[^a-zA-Z0-9]+', '-', url.split('/')[-1])[:40].strip('-')
+            return f"url-{slug_part or uuid4().hex[:8]}"
+        return f"scr-{uuid4().hex[:10]}"
+
+    def update_property_analysis(self, property_id: str, analysis: str) -> bool:
+        """Grava só a análise GPT de um imóvel existente (sem regenerar o embedding)."""
+        try:
+            self.client.table('properties')\
+                .update({'ai_analysis': analysis[:500], 'updated_at': datetime.utcnow().isoformat()})\
+                .eq('property_id', property_id)\
+                .execute()
+            return True
+        except Exception as e:
+            logger.error(f"❌ Erro ao salvar análise do imóvel {property_id}: {e}")
+            return False
+
     def _prepare_property_record(self, raw: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Transforma dict cru do scraper em registro compatível com tabela properties.
         Remove campos desconhecidos (ex: ai_analysis, ai_enhanced) que causam 400.
@@ -831,16 +931,7 @@ class SupabaseClient:
         if not raw:
             return None
 
-        # Derivar property_id (preferência: reference -> property_id -> hash URL -> uuid)
-        reference = raw.get('reference') or raw.get('property_id')
-        if not reference:
-            url = raw.get('url') or ''
-            if url:
-                # gerar slug curta baseada na URL
-                slug_part = re.sub(r'[^a-zA-Z0-9]+', '-', url.split('/')[-1])[:40].strip('-')
-                reference = f"url-{slug_part or uuid4().hex[:8]}"
-            else:
-                reference = f"scr-{uuid4().hex[:10]}"
+        reference = self.derive_property_id(raw)
 
         # Price: extrair números
         raw_price = str(raw.get('price') or '').replace('\u00a0', ' ')
@@ -887,7 +978,8 @@ class SupabaseClient:
             'external_id': raw.get('reference') or reference,
             'last_sync_at': datetime.utcnow().isoformat(),
             'created_at': datetime.utcnow().isoformat(),  # só usado se inserir
-            'ai_analysis': (raw.get('ai_analysis') or '')[:500],
+            # Vazio = imóvel não enriquecido neste ciclo: não sobrescrever a análise já gravada
+            'ai_analysis': (raw.get('ai_analysis') or '')[:500] or None,
             'url': raw.get('url')
         }
 
@@ -14,6 +14,9 @@ from app.services.supabase_client import supabase_client
 
 logger = logging.getLogger(__name__)
 
+# Referências de tempo contadas para o boost de urgência
+TIME_REFERENCE_PATTERN = re.compile(r'(hoje|amanhã|sexta|semana|dias|urgente|rápido|já|preciso)')
+
 @dataclass
 class UrgencyAlert:
     """Alert de urgência para corretor"""
@@ -103,6 +106,16 @@ class UrgencyScoreSystem:
                 "Follow-up semanal"
             ]
         }
+        
+        # Versões compiladas (uma vez por processo) usadas a cada mensagem
+        self._compiled_urgency_patterns = {
+            score: [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+            for score, patterns in self.urgency_patterns.items()
+        }
+        self._motivation_patterns = {
+            category: re.compile("|".join(map(re.escape, keywords)))
+            for category, keywords in self.motivation_keywords.items()
+        }
     
     async def analyze_urgency(self, 
                             message: str, 
@@ -168,26 +181,23 @@ class UrgencyScoreSystem:
         reasons = []
         
         # Verificar padrões por nível de urgência
-        for score, patterns in self.urgency_patterns.items():
+        for score, patterns in self._compiled_urgency_patterns.items():
             for pattern in patterns:
-                matches = re.findall(pattern, message_lower, re.IGNORECASE)
+                matches = pattern.findall(message_lower)
                 if matches:
                     max_score = max(max_score, score)
                     reason = f"Padrão urgência {score}: '{matches[0]}'"
                     reasons.append(reason)
         
         # Boost por múltiplas menções de tempo
-        time_references = len(re.findall(
-            r'(hoje|amanhã|sexta|semana|dias|urgente|rápido|já|preciso)',
-            message_lower
-        ))
+        time_references = len(TIME_REFERENCE_PATTERN.findall(message_lower))
         if time_references >= 3:
             max_score = min(max_score + 1, 5)
             reasons.append(f"Múltiplas referências de tempo ({time_references})")
         
         # Boost por motivação específica
-        for category, keywords in self.motivation_keywords.items():
-            if any(kw in message_lower for kw in keywords):
+        for category, pattern in self._motivation_patterns.items():
+            if pattern.search(message_lower):
                 max_score = min(max_score + 1, 5)
                 reasons.append(f"Motivação {category} detectada")
                 break
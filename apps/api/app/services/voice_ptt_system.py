@@ -9,17 +9,30 @@ import os
 import io
 from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
-import tempfile
 import base64
 
+# Base64 vetorizado (SIMD) para o áudio gerado (opcional; fallback: base64 da stdlib)
+try:
+    import pybase64
+except ImportError:
+    pybase64 = None
+
 import openai
 from pydub import AudioSegment
-import speech_recognition as sr
 
 from app.services.supabase_client import supabase_client
 
 logger = logging.getLogger(__name__)
 
+# Formato recebido -> formato de decodificação do pydub (WhatsApp usa OGG/Opus)
+AUDIO_DECODE_FORMATS = {
+    "ogg": "ogg",
+    "opus": "ogg",
+    "m4a": "m4a",
+    "mp3": "mp3",
+    "mpeg": "mp3",
+}
+
 class VoicePTTSystem:
     """Sistema de Push-to-Talk com resposta em voz"""
     
@@ -31,9 +44,6 @@ class VoicePTTSystem:
         self.audio_format = "opus"  # Formato para WhatsApp
         self.sample_rate = 48000  # 48kHz para qualidade alta
         
-        # Speech recognition
-        self.recognizer = sr.Recognizer()
-        
         # Cache de áudio
         self.audio_cache = {}
         self.cache_ttl_minutes = 60
@@ -132,17 +142,9 @@ class VoicePTTSystem:
         """Transcreve áudio usando OpenAI Whisper"""
         
         try:
-            # Converter para formato compatível se necessário
-            if format.lower() in ["ogg", "opus"]:
-                # WhatsApp usa OGG/Opus
-                audio_segment = AudioSegment.from_ogg(io.BytesIO(audio_data))
-            elif format.lower() == "m4a":
-                audio_segment = AudioSegment.from_file(io.BytesIO(audio_data), format="m4a")
-            elif format.lower() in ["mp3", "mpeg"]:
-                audio_segment = AudioSegment.from_mp3(io.BytesIO(audio_data))
-            else:
-                # Tentar auto-detectar
-                audio_segment = AudioSegment.from_file(io.BytesIO(audio_data))
+            # Converter para formato compatível se necessário (None -> auto-detectar)
+            decode_format = AUDIO_DECODE_FORMATS.get((format or "").lower())
+            audio_segment = AudioSegment.from_file(io.BytesIO(audio_data), format=decode_format)
             
             # Converter para WAV para Whisper
             wav_buffer = io.BytesIO()
@@ -198,20 +200,10 @@ class VoicePTTSystem:
                 response_format="opus"  # Formato otimizado para WhatsApp
             )
             
-            # Converter para base64
-            audio_bytes = response.content
-            
-            # Analisar duração
-            audio_segment = AudioSegment.from_file(
-                io.BytesIO(audio_bytes), 
-                format="opus"
+            # Decodificação, otimização (ffmpeg) e base64 são CPU-bound: fora do event loop
+            audio_base64, duration_seconds = await asyncio.to_thread(
+                self._encode_tts_audio, response.content
             )
-            duration_seconds = len(audio_segment) / 1000.0
-            
-            # Otimizar para WhatsApp (48kHz OGG)
-            optimized_audio = self._optimize_audio_for_whatsapp(audio_segment)
-            
-            audio_base64 = base64.b64encode(optimized_audio).decode('utf-8')
             
             audio_data = {
                 "audio_base64": audio_base64,
@@ -283,6 +275,19 @@ class VoicePTTSystem:
         
         return speech_text
     
+    def _encode_tts_audio(self, audio_bytes: bytes) -> tuple[str, float]:
+        """Converte o opus do TTS em OGG otimizado para WhatsApp, em base64 (retorna também a duração)"""
+        audio_segment = AudioSegment.from_file(io.BytesIO(audio_bytes), format="opus")
+        duration_seconds = len(audio_segment) / 1000.0
+        
+        # Otimizar para WhatsApp (48kHz OGG)
+        optimized_audio = self._optimize_audio_for_whatsapp(audio_segment)
+        
+        # pybase64 gera a str direto (sem o passo bytes -> decode)
+        if pybase64 is not None:
+            return pybase64.b64encode_as_string(optimized_audio), duration_seconds
+        return base64.b64encode(optimized_audio).decode('ascii'), duration_seconds
+    
     def _optimize_audio_for_whatsapp(self, audio_segment: AudioSegment) -> bytes:
         """Otimiza áudio para WhatsApp (OGG 48kHz)"""
         
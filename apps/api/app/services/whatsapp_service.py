@@ -1,12 +1,15 @@
 import aiohttp
 import logging
-import json
 import base64
 from typing import Optional, Dict, Any
 import asyncio
+import os
+
+from app.services import json_utils, http_session
 
 logger = logging.getLogger(__name__)
 
+
 class WhatsAppService:
     def __init__(self, access_token: str, phone_number_id: str):
         self.access_token = access_token
@@ -18,6 +21,10 @@ class WhatsAppService:
             "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json"
         }
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Sessão HTTP compartilhada do processo (pool de conexões/keep-alive)."""
+        return await http_session.get_session()
     
     async def send_message(self, to: str, message: str) -> bool:
         """Enviar mensagem de texto via WhatsApp"""
@@ -37,17 +44,18 @@ class WhatsAppService:
                 }
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=self.headers, json=payload) as response:
-                    resp_text = await response.text()
-                    if 200 <= response.status < 300:
-                        logger.info(f"Message sent successfully to %s (status=%s)", to, response.status)
-                        return True
-                    logger.error("Failed to send message: %s - %s", response.status, resp_text[:1000])
-                    return False
-                         
+            session = await self._get_session()
+            async with session.post(url, headers=self.headers, data=json_utils.dumps(payload)) as response:
+                # Corpo consumido como bytes (libera a conexão p/ keep-alive); só é decodificado no log de erro
+                resp_body = await response.read()
+                if 200 <= response.status < 300:
+                    logger.info(f"Message sent successfully to {to} (status={response.status})")
+                    return True
+                logger.error("Failed to send message: %s - %s", response.status, resp_body[:1000].decode("utf-8", "replace"))
+                return False
+                     
         except Exception as e:
-            logger.error(f"Error sending WhatsApp message: {str(e)}")
+            logger.error(f"Error sending WhatsApp message: {e}")
             return False
     
     async def download_media(self, media_id: str) -> Optional[bytes]:
@@ -56,32 +64,32 @@ class WhatsAppService:
             # Primeiro, obter URL da mídia
             media_url_endpoint = f"https://graph.facebook.com/v18.0/{media_id}"
             
-            async with aiohttp.ClientSession() as session:
-                # Obter URL da mídia
-                async with session.get(media_url_endpoint, headers={"Authorization": f"Bearer {self.access_token}"}) as response:
-                    if response.status != 200:
-                        logger.error(f"Failed to get media URL: {response.status}")
-                        return None
-                    
-                    media_data = await response.json()
-                    media_url = media_data.get("url")
-                    
-                    if not media_url:
-                        logger.error("No media URL found")
-                        return None
+            session = await self._get_session()
+            # Obter URL da mídia
+            async with session.get(media_url_endpoint, headers={"Authorization": f"Bearer {self.access_token}"}) as response:
+                if response.status != 200:
+                    logger.error(f"Failed to get media URL: {response.status}")
+                    return None
+                
+                media_data = json_utils.loads(await response.read())
+                media_url = media_data.get("url")
                 
-                # Download da mídia
-                async with session.get(media_url, headers={"Authorization": f"Bearer {self.access_token}"}) as response:
-                    if response.status == 200:
-                        media_content = await response.read()
-                        logger.info(f"Media downloaded successfully: {len(media_content)} bytes")
-                        return media_content
-                    else:
-                        logger.error(f"Failed to download media: {response.status}")
-                        return None
-                        
+                if not media_url:
+                    logger.error("No media URL found")
+                    return None
+            
+            # Download da mídia
+            async with session.get(media_url, headers={"Authorization": f"Bearer {self.access_token}"}) as response:
+                if response.status == 200:
+                    media_content = await response.read()
+                    logger.info(f"Media downloaded successfully: {len(media_content)} bytes")
+                    return media_content
+                else:
+                    logger.error(f"Failed to download media: {response.status}")
+                    return None
+                    
         except Exception as e:
-            logger.error(f"Error downloading media: {str(e)}")
+            logger.error(f"Error downloading media: {e}")
             return None
     
     def extract_media_info(self, webhook_data: Dict[str, Any]) -> Optional[Dict[str, str]]:
@@ -123,7 +131,7 @@ class WhatsAppService:
             return None
             
         except Exception as e:
-            logger.error(f"Error extracting media info: {str(e)}")
+            logger.error(f"Error extracting media info: {e}")
             return None
     
     async def send_template_message(self, to: str, template_name: str, language_code: str = "pt_BR") -> bool:
@@ -143,17 +151,17 @@ class WhatsAppService:
                 }
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=self.headers, json=payload) as response:
-                    resp_text = await response.text()
-                    if 200 <= response.status < 300:
-                        logger.info("Template message sent successfully to %s (status=%s)", to, response.status)
-                        return True
-                    logger.error("Failed to send template: %s - %s", response.status, resp_text[:1000])
-                    return False
-                         
+            session = await self._get_session()
+            async with session.post(url, headers=self.headers, data=json_utils.dumps(payload)) as response:
+                resp_body = await response.read()
+                if 200 <= response.status < 300:
+                    logger.info("Template message sent successfully to %s (status=%s)", to, response.status)
+                    return True
+                logger.error("Failed to send template: %s - %s", response.status, resp_body[:1000].decode("utf-8", "replace"))
+                return False
+                     
         except Exception as e:
-            logger.error(f"Error sending WhatsApp template: {str(e)}")
+            logger.error(f"Error sending WhatsApp template: {e}")
             return False
     
     async def mark_message_as_read(self, message_id: str) -> bool:
@@ -167,14 +175,14 @@ class WhatsAppService:
             }
         }
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.messages_url, headers=self.headers, json=payload, timeout=10) as response:
-                    resp_text = await response.text()
-                    if 200 <= response.status < 300:
-                        logger.info("Message %s marked as read.", message_id)
-                        return True
-                    logger.error("Failed to mark as read: %s - %s", response.status, resp_text[:1000])
-                    return False
+            session = await self._get_session()
+            async with session.post(self.messages_url, headers=self.headers, data=json_utils.dumps(payload), timeout=10) as response:
+                resp_body = await response.read()
+                if 200 <= response.status < 300:
+                    logger.info("Message %s marked as read.", message_id)
+                    return True
+                logger.error("Failed to mark as read: %s - %s", response.status, resp_body[:1000].decode("utf-8", "replace"))
+                return False
         except Exception as e:
             logger.exception("Error marking message as read: %s", e)
             return False
@@ -222,14 +230,14 @@ class WhatsAppService:
             if footer_text:
                 payload["interactive"]["footer"] = {"text": footer_text}
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.messages_url, headers=self.headers, json=payload) as response:
-                    resp_text = await response.text()
-                    if 200 <= response.status < 300:
-                        logger.info("Interactive CTA sent successfully to %s (status=%s)", to, response.status)
-                        return True
-                    logger.error("Failed to send interactive CTA: %s - %s", response.status, resp_text[:1000])
-                    return False
+            session = await self._get_session()
+            async with session.post(self.messages_url, headers=self.headers, data=json_utils.dumps(payload)) as response:
+                resp_body = await response.read()
+                if 200 <= response.status < 300:
+                    logger.info("Interactive CTA sent successfully to %s (status=%s)", to, response.status)
+                    return True
+                logger.error("Failed to send interactive CTA: %s - %s", response.status, resp_body[:1000].decode("utf-8", "replace"))
+                return False
 
         except Exception as e:
             logger.exception("Error sending interactive CTA: %s", e)
@@ -238,3 +246,18 @@ class WhatsAppService:
     def is_configured(self) -> bool:
         """Verificar se o serviço está configurado"""
         return bool(self.access_token and self.phone_number_id)
+
+
+# Instância compartilhada (uma sessão HTTP para todo o processo)
+_whatsapp_service: Optional[WhatsAppService] = None
+
+
+def get_whatsapp_service() -> WhatsAppService:
+    """Retorna o WhatsAppService compartilhado, criado sob demanda a partir do ambiente."""
+    global _whatsapp_service
+    if _whatsapp_service is None:
+        _whatsapp_service = WhatsAppService(
+            os.getenv("WHATSAPP_ACCESS_TOKEN", ""),
+            os.getenv("WHATSAPP_PHONE_NUMBER_ID", "")
+        )
+    return _whatsapp_service
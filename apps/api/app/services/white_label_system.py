@@ -11,10 +11,10 @@ import os
 import string
 import secrets
 
-import aiohttp
 from jinja2 import Template
 
 from app.services.supabase_client import supabase_client
+from app.services import http_session
 
 logger = logging.getLogger(__name__)
 
@@ -281,22 +281,23 @@ class WhiteLabelSystem:
             
             url = f"https://api.cloudflare.com/client/v4/zones/{self.cloudflare_config['zone_id']}/dns_records"
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json=dns_record) as response:
-                    if response.status == 200:
-                        result = await response.json()
+            # Sessão HTTP compartilhada do processo (pool de conexões)
+            session = await http_session.get_session()
+            async with session.post(url, headers=headers, json=dns_record) as response:
+                if response.status == 200:
+                    result = await response.json()
                         
-                        return {
-                            "success": True,
-                            "dns_record_id": result["result"]["id"],
-                            "message": f"DNS configurado para {subdomain}.{self.base_domain}"
-                        }
-                    else:
-                        error_data = await response.json()
-                        return {
-                            "success": False,
-                            "error": error_data.get("errors", [{}])[0].get("message", "Erro DNS")
-                        }
+                    return {
+                        "success": True,
+                        "dns_record_id": result["result"]["id"],
+                        "message": f"DNS configurado para {subdomain}.{self.base_domain}"
+                    }
+                else:
+                    error_data = await response.json()
+                    return {
+                        "success": False,
+                        "error": error_data.get("errors", [{}])[0].get("message", "Erro DNS")
+                    }
             
         except Exception as e:
             return {"success": False, "error": str(e)}
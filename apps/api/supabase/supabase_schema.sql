@@ -379,6 +379,35 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- Busca lexical (fallback da vetorial) no servidor: a expressão do WHERE é a mesma de
+-- idx_properties_fulltext, então o GIN é usado (ILIKE '%...%' varria a tabela inteira).
+-- Termos da consulta combinados com OR e ordenados por relevância.
+CREATE OR REPLACE FUNCTION lexical_property_search(
+    query_text TEXT,
+    max_results INTEGER DEFAULT 10
+)
+RETURNS TABLE (
+    property JSONB,
+    text_rank FLOAT
+) AS $$
+DECLARE
+    -- Lexemas já normalizados pelo plainto_tsquery: cast direto (to_tsquery os
+    -- re-stemizaria, gerando lexemas que não batem com o tsvector)
+    q tsquery := replace(plainto_tsquery('portuguese', query_text)::text, ' & ', ' | ')::tsquery;
+BEGIN
+    RETURN QUERY
+    SELECT
+        to_jsonb(p) - 'embedding' AS property,
+        ts_rank(to_tsvector('portuguese', p.title || ' ' || COALESCE(p.description, '')), q)::FLOAT AS text_rank
+    FROM properties p
+    WHERE
+        p.status = 'active' AND
+        to_tsvector('portuguese', p.title || ' ' || COALESCE(p.description, '')) @@ q
+    ORDER BY text_rank DESC
+    LIMIT max_results;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
 -- ====================================================================
 -- ROW LEVEL SECURITY (RLS)
 -- ====================================================================